@@ -0,0 +1,299 @@
+"""
+Microbenchmark for email_service._html_to_text_with_links.
+Compares the legacy regex converter with the tokenizing converter: throughput
+in MB/s (best of several runs) and link equivalence (every "text (url)" pair
+the legacy converter produced must appear in the new output, after entity
+decoding).
+
+The legacy converter ignores block structure, entities and <style>/<head>
+content, so it does less work per byte and is faster on well-formed mail;
+the tokenizing converter is measured for what that structure costs. The
+"malformed" sample (anchors missing </a>, as in truncated or forwarded mail)
+shows the legacy anchor regex backtracking super-linearly.
+
+Samples, in order of preference:
+- --gmail SENDER_ID: raw text/html parts of the sender's latest messages,
+  downloaded with the app's Gmail credentials (real f5bot / HARO / Bookface mail)
+- --samples DIR: a directory of .html files (e.g. raw parts saved from Gmail)
+- default: generated mail shaped like each sender's template (table layout,
+  inline CSS, <head><style>, MSO conditional comments, tracking links, entities)
+
+Usage (from backend/):
+    python benchmarks/bench_html_to_text.py [--gmail f5bot --limit 20] [--samples DIR] [--repeat 10]
+"""
+
+import argparse
+import html
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import email_service  # noqa: E402
+
+SENDERS_FILE = Path(__file__).resolve().parent.parent / "config" / "senders.json"
+
+# Inline style used on every table cell, as email template builders emit it
+_TD = (
+    'style="padding: 8px 24px 8px 24px; font-family: Helvetica, Arial, sans-serif; '
+    'font-size: 15px; line-height: 22px; color: #1f2933; text-align: left;"'
+)
+
+
+def legacy_html_to_text_with_links(html_text: str) -> str:
+    """Regex converter used before the tokenizer rewrite (kept for comparison)."""
+    link_pattern = re.compile(r'<a[^>]+href=["\'](.*?)["\'][^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+
+    def replace_link(match):
+        url = match.group(1)
+        text = re.sub(r'<.*?>', '', match.group(2)).strip()
+        return f"{text} ({url})" if text else url
+
+    text = link_pattern.sub(replace_link, html_text)
+    text = re.sub(r'<.*?>', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    return text.strip()
+
+
+def _tracking_url(target: str, i: int, host: str = "click.mail-provider.example") -> str:
+    """ESP click-tracking redirect (long opaque token, &amp;-escaped query)."""
+    token = f"{i:04d}".join("u4SFf9kQpZ7mWc2xRb1LtN0aHvYe8GdJ" for _ in range(5))
+    return f"https://{host}/ls/click?upn={token}&amp;u={i:06d}&amp;redirect={target.replace(':', '%3A').replace('/', '%2F')}"
+
+
+def _template_head(title: str) -> str:
+    """<head> with the embedded stylesheet and MSO conditional block templates ship."""
+    css = "\n".join(
+        f".c{i} {{ font-family: -apple-system, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; "
+        f"font-size: {12 + i % 6}px; line-height: 1.5; color: #1f2933; padding: {i % 4 * 4}px; }}"
+        for i in range(120)
+    )
+    return (
+        '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" '
+        '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head>'
+        '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">'
+        f'<meta name="viewport" content="width=device-width, initial-scale=1.0"><title>{title}</title>'
+        f'<style type="text/css">\n{css}\n@media only screen and (max-width:600px) {{ .wrap {{ width:100% !important; }} }}\n</style>'
+        "<!--[if mso]><style>table,td {font-family: Arial, sans-serif !important;}</style><![endif]--></head>"
+    )
+
+
+def _sample_f5bot(alerts: int = 80) -> str:
+    subreddits = ["SaaS", "smallbusiness", "Entrepreneur", "startups", "sales", "marketing"]
+    snippet = (
+        "...we have been trying to automate inbound calls for our dental clinic &amp; the current answering "
+        "service is &quot;ok&quot; but costs &gt;$800/mo. Has anyone used an AI receptionist that actually "
+        "books into Dentrix? Would love recommendations&hellip;"
+    )
+    items = "".join(
+        f'<p style="margin:0 0 4px 0;"><b>Reddit {"Comments" if i % 3 else "Posts"}</b> '
+        f'(<a href="{_tracking_url(f"https://www.reddit.com/r/{subreddits[i % 6]}/", i, "f5bot.com")}">/r/{subreddits[i % 6]}</a>)</p>'
+        f'<p style="margin:0 0 4px 0;"><a href="https://f5bot.com/url?u=https%3A%2F%2Fwww.reddit.com%2Fr%2F'
+        f'{subreddits[i % 6]}%2Fcomments%2Fq{i:05d}%2F&amp;i={i}&amp;h=9f2c{i:04d}e1">'
+        f"Looking for an AI receptionist that books appointments #{i}</a></p>"
+        f'<p style="margin:0 0 4px 0;">Keywords: <i>ai receptionist</i>, <i>voice agent</i></p>'
+        f'<p style="margin:0 0 16px 0; color:#555555;">{snippet}</p>'
+        for i in range(alerts)
+    )
+    return (
+        _template_head("F5Bot found something!") + '<body style="margin:0; padding:0;">'
+        f"<p>F5Bot found something for you:</p>{items}"
+        '<hr><p style="font-size:12px;color:#888;">You are receiving this because you set up alerts at F5Bot. '
+        '<a href="https://f5bot.com/unsubscribe?e=abc123">Unsubscribe</a> &middot; '
+        '<a href="https://f5bot.com/settings">Manage alerts</a></p></body></html>'
+    )
+
+
+def _sample_haro(queries: int = 45) -> str:
+    query = "I&#39;m writing a piece on how small businesses use AI phone agents and chatbots to handle customer support. " * 4
+    rows = "".join(
+        f'<tr><td class="c{i}" {_TD}>'
+        '<table role="presentation" width="100%" cellpadding="0" cellspacing="0" border="0" '
+        'style="border-collapse:collapse;mso-table-lspace:0pt;mso-table-rspace:0pt;">'
+        f'<tr><td {_TD}><strong style="font-size:17px;">{i + 1}) Summary: Looking for founders using AI to cut support costs</strong></td></tr>'
+        f'<tr><td {_TD}>Name: Reporter {i}&nbsp;&nbsp;<span style="color:#6b7280;">Business Insider</span><br>'
+        "Category: Business and Finance<br>"
+        f'Email: <a href="mailto:query-{i}@helpareporter.net" style="color:#0b66c3;text-decoration:underline;">query-{i}@helpareporter.net</a><br>'
+        f'Media Outlet: <a href="{_tracking_url("https://www.businessinsider.com/", i)}" style="color:#0b66c3;">Business Insider</a><br>'
+        f"Deadline: 7:00 PM EST - {i % 28 + 1} March</td></tr>"
+        f'<tr><td {_TD}><p style="margin:0 0 12px 0;">Query:</p><p style="margin:0 0 12px 0;">{query}</p>'
+        '<p style="margin:0 0 12px 0;">Requirements:</p><ul style="margin:0;padding-left:20px;">'
+        "<li>Founder or C-level</li><li>US-based company</li><li>Willing to share numbers</li></ul></td></tr>"
+        f'<tr><td {_TD}><a href="{_tracking_url(f"https://app.helpareporter.com/Pitches/{1000 + i}", i)}" '
+        'style="background:#0b66c3;border-radius:4px;color:#ffffff;display:inline-block;padding:10px 18px;'
+        'text-decoration:none;">Pitch this query</a></td></tr></table></td></tr>'
+        '<tr><td style="padding:0 24px;"><hr style="border:none;border-top:1px solid #e5e7eb;"></td></tr>'
+        for i in range(queries)
+    )
+    return (
+        _template_head("HARO - Help A Reporter Out") + '<body style="margin:0;padding:0;background:#f3f4f6;">'
+        '<!--[if mso]><table role="presentation" width="600" align="center"><tr><td><![endif]-->'
+        '<table class="wrap" role="presentation" width="600" align="center" cellpadding="0" cellspacing="0" '
+        f'border="0" style="background:#ffffff;margin:0 auto;">{rows}'
+        f'<tr><td {_TD}><p style="font-size:12px;color:#9ca3af;">&copy; Cision US Inc. All rights reserved. '
+        f'<a href="{_tracking_url("https://www.helpareporter.com/unsubscribe", 0)}">Unsubscribe</a></p></td></tr>'
+        "</table><!--[if mso]></td></tr></table><![endif]--></body></html>"
+    )
+
+
+def _sample_bookface(posts: int = 25) -> str:
+    summary = (
+        "We tried cold email, communities and founder-led content &mdash; here&rsquo;s what actually "
+        "moved pipeline, with numbers. " * 2
+    )
+    cards = "".join(
+        f'<tr><td {_TD}><table role="presentation" width="100%" cellpadding="0" cellspacing="0" border="0"><tr>'
+        '<td width="40" valign="top" style="padding:0 12px 0 0;">'
+        f'<img src="https://bookface-images.s3.amazonaws.com/avatars/{i:08d}.jpg" width="40" height="40" alt="" '
+        'style="border-radius:20px;display:block;"></td>'
+        f'<td valign="top" {_TD}><a href="{_tracking_url(f"https://bookface.ycombinator.com/posts/{60000 + i}", i)}" '
+        'style="color:#111827;font-weight:600;text-decoration:none;font-size:16px;">'
+        f"How we got our first 100 B2B customers without paid ads ({i})</a>"
+        f'<div style="color:#6b7280;font-size:13px;margin:2px 0 6px 0;">Founder, S{21 + i % 3} &middot; {i + 3} comments</div>'
+        f'<div style="color:#374151;">{summary}</div></td></tr></table></td></tr>'
+        for i in range(posts)
+    )
+    return (
+        _template_head("Bookface Digest") + '<body style="margin:0;padding:0;">'
+        '<div style="display:none;max-height:0;overflow:hidden;">Top posts this week&nbsp;&zwnj;&nbsp;&zwnj;</div>'
+        '<table class="wrap" role="presentation" width="600" align="center" cellpadding="0" cellspacing="0" border="0">'
+        f'<tr><td {_TD}><h1 style="font-size:22px;margin:0;">Bookface Weekly Digest</h1></td></tr>{cards}'
+        f'<tr><td {_TD}><p style="font-size:12px;color:#9ca3af;">Y Combinator, Mountain View, CA. '
+        f'<a href="{_tracking_url("https://bookface.ycombinator.com/settings/email", 0)}">Email preferences</a></p></td></tr>'
+        "</table></body></html>"
+    )
+
+
+def _sample_malformed(links: int = 50) -> str:
+    # Kept small: the legacy converter's run time grows roughly cubically with the number of unclosed anchors
+    return "<html><body>" + "".join(
+        f'<p>Lead {i}: <a href="https://example.com/lead/{i}">see thread for details</p>' for i in range(links)
+    ) + "</body></html>"
+
+
+def gmail_samples(sender_id: str, limit: int) -> Dict[str, str]:
+    """
+    Download raw text/html bodies of a sender's latest messages.
+
+    Args:
+        sender_id: Sender id from config/senders.json (e.g. "f5bot")
+        limit: Maximum number of messages
+
+    Returns:
+        Dictionary {sample name: html}
+    """
+    senders = json.loads(SENDERS_FILE.read_text(encoding="utf-8"))["senders"]
+    sender = next((s for s in senders if s["id"] == sender_id), None)
+    if sender is None:
+        raise SystemExit(f"Unknown sender id: {sender_id}")
+
+    service = email_service._get_gmail_service()
+    response = service.users().messages().list(userId="me", q=f"from:{sender['email']}", maxResults=limit).execute()
+
+    samples = {}
+    for ref in response.get("messages", []):
+        message = service.users().messages().get(userId="me", id=ref["id"], format="full").execute()
+        part = email_service._select_body_part(message["payload"])
+        if part is not None and part.get("mimeType", "").lower() == "text/html":
+            samples[f"{sender_id} {ref['id']}"] = email_service._decode_part(part)
+    if not samples:
+        raise SystemExit(f"No text/html messages found from {sender['email']}")
+    return samples
+
+
+def load_samples(samples_dir: Path = None) -> Dict[str, str]:
+    """
+    Load benchmark samples.
+
+    Args:
+        samples_dir: Optional directory of .html files
+
+    Returns:
+        Dictionary {sample name: html}
+    """
+    if samples_dir:
+        files = sorted(samples_dir.glob("*.html"))
+        if not files:
+            raise SystemExit(f"No .html files found in {samples_dir}")
+        return {f.name: f.read_text(encoding="utf-8", errors="replace") for f in files}
+
+    return {
+        "f5bot (template)": _sample_f5bot(),
+        "haro (template)": _sample_haro(),
+        "bookface (template)": _sample_bookface(),
+        "malformed (unclosed <a>)": _sample_malformed(),
+    }
+
+
+def throughput(fn, html_text: str, repeat: int) -> float:
+    """Return conversion throughput in MB/s (best of 5 runs of `repeat` conversions)."""
+    size_mb = len(html_text.encode("utf-8")) / 1_000_000
+    best = min(timeit.repeat(lambda: fn(html_text), number=repeat, repeat=5))
+    return size_mb * repeat / best
+
+
+def legacy_links(html_text: str) -> List[Tuple[str, str]]:
+    """
+    Return the (text, url) pairs the legacy converter emits, entity-decoded
+    and whitespace-normalized the way the new converter renders them.
+    """
+    pairs = []
+    for match in re.finditer(r'<a[^>]+href=["\'](.*?)["\'][^>]*>(.*?)</a>', html_text, re.IGNORECASE | re.DOTALL):
+        url = html.unescape(match.group(1)).strip()
+        text = " ".join(html.unescape(re.sub(r'<.*?>', '', match.group(2))).split())
+        pairs.append((text, url))
+    return pairs
+
+
+def check_links(html_text: str, new_text: str) -> Tuple[int, int]:
+    """
+    Count legacy links that are preserved in the new output.
+
+    Returns:
+        Tuple of (preserved, total)
+    """
+    pairs = legacy_links(html_text)
+    preserved = 0
+    for text, url in pairs:
+        expected = f"{text} ({url})" if text and text != url else url
+        if expected in new_text:
+            preserved += 1
+    return preserved, len(pairs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gmail", metavar="SENDER_ID", help="benchmark the sender's latest messages from Gmail")
+    parser.add_argument("--limit", type=int, default=20, help="messages to download with --gmail")
+    parser.add_argument("--samples", type=Path, help="directory of .html samples (defaults to template-shaped mail)")
+    parser.add_argument("--repeat", type=int, default=10, help="conversions per timed run")
+    args = parser.parse_args()
+
+    samples = gmail_samples(args.gmail, args.limit) if args.gmail else load_samples(args.samples)
+
+    print(f"{'sample':<28} {'size KB':>8} {'legacy MB/s':>12} {'new MB/s':>10} {'links ok':>10} {'lines':>7}")
+    print("-" * 80)
+    all_ok = True
+    for name, html_text in samples.items():
+        legacy_speed = throughput(legacy_html_to_text_with_links, html_text, args.repeat)
+        new_speed = throughput(email_service._html_to_text_with_links, html_text, args.repeat)
+        new_text = email_service._html_to_text_with_links(html_text)
+        preserved, total = check_links(html_text, new_text)
+        all_ok &= preserved == total
+        print(
+            f"{name[:28]:<28} {len(html_text) / 1024:8.1f} {legacy_speed:12.2f} {new_speed:10.2f} "
+            f"{f'{preserved}/{total}':>10} {new_text.count(chr(10)) + 1:7d}"
+        )
+
+    print("-" * 80)
+    print("Link equivalence: " + ("OK" if all_ok else "MISMATCH - see counts above"))
+
+
+if __name__ == "__main__":
+    main()
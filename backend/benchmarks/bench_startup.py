@@ -0,0 +1,121 @@
+"""
+Startup benchmark for the Gmail client path.
+Compares the old eager path (module-level googleapiclient imports + build()
+per fetch) with the lazy path (deferred imports + cached service built from
+the static discovery document).
+
+Each scenario runs in a fresh interpreter so import caches do not leak.
+No network access or real Gmail credentials are needed.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Shared preamble: dummy credentials, no token refresh or HTTP involved
+_PREAMBLE = """
+import sys, time
+sys.path.insert(0, {backend!r})
+"""
+
+# Each scenario prints one float (seconds) per measured step
+SCENARIOS = {
+    "eager: import google api modules": """
+t = time.perf_counter()
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+print(time.perf_counter() - t)
+""",
+    "lazy: import email_service (google modules deferred)": """
+import llm_service  # imported by email_service either way - keep it out of the number
+t = time.perf_counter()
+import email_service
+elapsed = time.perf_counter() - t
+assert not any(m.startswith("googleapiclient") for m in sys.modules), "googleapiclient imported eagerly"
+print(elapsed)
+""",
+    "eager: first fetch client (import + build per call)": """
+from google.oauth2.credentials import Credentials
+t = time.perf_counter()
+from googleapiclient.discovery import build
+service = build("gmail", "v1", credentials=Credentials(token="bench"))
+print(time.perf_counter() - t)
+""",
+    "lazy: first fetch client (_get_gmail_service)": """
+import email_service
+from google.oauth2.credentials import Credentials
+creds = Credentials(token="bench")
+t = time.perf_counter()
+service = email_service._get_gmail_service(creds)
+print(time.perf_counter() - t)
+""",
+    "eager: second fetch client (build again)": """
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+creds = Credentials(token="bench")
+build("gmail", "v1", credentials=creds)
+t = time.perf_counter()
+build("gmail", "v1", credentials=creds)
+print(time.perf_counter() - t)
+""",
+    "lazy: second fetch client (cached service)": """
+import email_service
+from google.oauth2.credentials import Credentials
+creds = Credentials(token="bench")
+email_service._get_gmail_service(creds)
+t = time.perf_counter()
+email_service._get_gmail_service(creds)
+print(time.perf_counter() - t)
+""",
+}
+
+
+def run_scenario(code: str, runs: int) -> float:
+    """
+    Run a scenario in fresh interpreters and return the median time.
+
+    Args:
+        code: Python snippet printing elapsed seconds
+        runs: Number of fresh-process repetitions
+
+    Returns:
+        Median elapsed seconds
+    """
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PREAMBLE.format(backend=str(BACKEND_DIR)) + code],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh-process repetitions per scenario")
+    args = parser.parse_args()
+
+    print(f"Gmail client startup benchmark ({args.runs} runs per scenario, median)")
+    print("-" * 72)
+    for name, code in SCENARIOS.items():
+        median = run_scenario(code, args.runs)
+        print(f"{name:<58} {median * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
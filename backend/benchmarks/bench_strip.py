@@ -0,0 +1,209 @@
+"""
+Benchmark for metadata stripping (LLM Call #1).
+Compares email_service.strip_metadata_with_rules with the LLM strip on
+combined batch text: cleaned output size, reduction and latency, and checks
+that every "=== MESSAGE N ===" separator survives.
+
+Real samples can be supplied as a directory of *_combined_messages.txt debug
+files (written to debug_outputs/ by the workflow); otherwise synthetic
+f5bot / HARO / Bookface batches and a reply thread with quotes and
+signatures are generated. The LLM side only runs with --llm (it makes real
+API calls, with the LLM cache disabled).
+
+Usage (from backend/):
+    python benchmarks/bench_strip.py [--samples DIR] [--repeat 50] [--llm]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import email_service  # noqa: E402
+
+_SEPARATOR_RE = re.compile(r"^=== MESSAGE \d+ ===$", re.MULTILINE)
+
+_FOOTER = (
+    "You are receiving this because you subscribed to alerts.\n"
+    "Unsubscribe (https://example.com/unsubscribe) | Manage preferences (https://example.com/prefs)\n"
+    "© 2024 Example Inc. All rights reserved."
+)
+
+
+def _message(i: int, subject: str, sender: str, body: str, number: int = 1, total: int = 1) -> Dict[str, str]:
+    return {
+        "subject": subject,
+        "from": sender,
+        "date": f"Mon, {i % 28 + 1} Jan 2024 10:00:00 +0000",
+        "thread_id": f"t{i}",
+        "message_number": number,
+        "total_in_thread": total,
+        "body": body,
+    }
+
+
+def _synthetic_f5bot(messages: int = 10, posts: int = 12) -> str:
+    emails = [
+        _message(
+            i, f"F5Bot found something: voice agent #{i}", "F5Bot <admin@f5bot.com>",
+            "View this email in your browser (https://f5bot.com/view)\n\n"
+            + "\n".join(
+                f"Reddit Posts (r/sub{p}) (https://www.reddit.com/r/sub{p}/)\n"
+                f"Looking for a voice AI tool for appointment booking #{p} "
+                f"(https://www.reddit.com/r/sub{p}/comments/abc{p})\n"
+                f'Keyword: voice agent - "we tried a few vendors but latency & cost were bad..."\n'
+                for p in range(posts)
+            )
+            + "\n" + _FOOTER
+        )
+        for i in range(messages)
+    ]
+    return email_service.combine_emails(emails)
+
+
+def _synthetic_haro(messages: int = 5, queries: int = 8) -> str:
+    emails = [
+        _message(
+            i, f"[HARO] Wednesday Edition #{i}", "HARO <haro@helpareporter.com>",
+            "\n\n".join(
+                f"{q}) Summary: Experts on AI automation for small business #{q}\n"
+                f"Name: Reporter {q}\nCategory: Business and Finance\n"
+                f"Email: query-{q}@helpareporter.net (mailto:query-{q}@helpareporter.net)\n"
+                f"Deadline: 7:00 PM EST - {q} March\n"
+                f"Query: {'Looking for founders who use AI phone agents to handle inbound calls. ' * 4}"
+                for q in range(queries)
+            )
+            + "\n\n" + _FOOTER
+        )
+        for i in range(messages)
+    ]
+    return email_service.combine_emails(emails)
+
+
+def _synthetic_bookface(messages: int = 2, threads: int = 15) -> str:
+    emails = [
+        _message(
+            i, "Bookface Daily Digest", "Bookface <digest@ycombinator.com>",
+            "\n\n".join(
+                f"How we got our first 100 B2B customers without paid ads (part {t}) "
+                f"(https://bookface.ycombinator.com/posts/{t})\n"
+                f"{'We tried cold email, communities, and founder-led content; here is what actually worked. ' * 2}"
+                for t in range(threads)
+            )
+            + "\n\nManage your notification preferences (https://bookface.ycombinator.com/settings)"
+        )
+        for i in range(messages)
+    ]
+    return email_service.combine_emails(emails)
+
+
+def _synthetic_reply_thread(messages: int = 6) -> str:
+    emails = []
+    for i in range(messages):
+        quoted = "\n".join(f"> Earlier line {q} of the previous message." for q in range(15))
+        emails.append(_message(
+            i, "Re: Pilot for the voice agent", f"Person {i} <person{i}@example.com>",
+            f"Hi team,\n\nFollowing up on point {i}: can we start the pilot next week? "
+            f"The pricing sheet is here: https://example.com/pricing/{i}\n\n"
+            "Best regards,\nPerson Name\nHead of Operations | Example Inc.\n+1 555 0100\n\n"
+            "Sent from my iPhone\n\n"
+            f"On Mon, Jan {i + 1}, 2024 at 9:00 AM Someone <someone@example.com> wrote:\n{quoted}",
+            number=i + 1, total=messages
+        ))
+    return email_service.combine_emails(emails)
+
+
+def load_samples(samples_dir: Path = None) -> Dict[str, str]:
+    """
+    Load benchmark samples.
+
+    Args:
+        samples_dir: Optional directory of *_combined_messages.txt debug files
+
+    Returns:
+        Dictionary {sample name: combined email text}
+    """
+    if samples_dir:
+        files = sorted(samples_dir.glob("*_combined_messages.txt"))
+        if not files:
+            raise SystemExit(f"No *_combined_messages.txt files found in {samples_dir}")
+        samples = {}
+        for f in files:
+            text = f.read_text(encoding="utf-8", errors="replace")
+            # Drop the debug header written by workflow._prepare_strip
+            first = _SEPARATOR_RE.search(text)
+            samples[f.name] = text[first.start():] if first else text
+        return samples
+
+    return {
+        "f5bot (synthetic)": _synthetic_f5bot(),
+        "haro (synthetic)": _synthetic_haro(),
+        "bookface (synthetic)": _synthetic_bookface(),
+        "reply thread (synthetic)": _synthetic_reply_thread(),
+    }
+
+
+def latency_ms(fn, text: str, repeat: int) -> float:
+    """Return mean latency per call in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def separators_kept(original: str, cleaned: str) -> bool:
+    """Check that every message separator survives, in order."""
+    return _SEPARATOR_RE.findall(original) == _SEPARATOR_RE.findall(cleaned)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=Path, help="directory of *_combined_messages.txt files (defaults to synthetic batches)")
+    parser.add_argument("--repeat", type=int, default=50, help="rule-based strips per sample")
+    parser.add_argument("--llm", action="store_true", help="also run the LLM strip once per sample (real API calls)")
+    args = parser.parse_args()
+
+    if args.llm:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        import llm_cache
+        llm_cache.LLM_CACHE_ENABLED = False
+
+    samples = load_samples(args.samples)
+
+    columns = f"{'sample':<26} {'in chars':>9} {'rules out':>10} {'saved':>7} {'rules ms':>9} {'seps':>5}"
+    if args.llm:
+        columns += f" {'llm out':>8} {'saved':>7} {'llm ms':>9} {'seps':>5}"
+    print(columns)
+    print("-" * len(columns))
+
+    all_ok = True
+    for name, text in samples.items():
+        cleaned = email_service.strip_metadata_with_rules(text)
+        ok = separators_kept(text, cleaned)
+        all_ok &= ok
+        row = (
+            f"{name[:26]:<26} {len(text):9d} {len(cleaned):10d} {1 - len(cleaned) / len(text):7.1%} "
+            f"{latency_ms(email_service.strip_metadata_with_rules, text, args.repeat):9.2f} {'ok' if ok else 'LOST':>5}"
+        )
+        if args.llm:
+            start = time.perf_counter()
+            llm_cleaned = email_service.strip_metadata_with_llm(text)
+            llm_ms = (time.perf_counter() - start) * 1000
+            llm_ok = separators_kept(text, llm_cleaned)
+            row += (
+                f" {len(llm_cleaned):8d} {1 - len(llm_cleaned) / len(text):7.1%} "
+                f"{llm_ms:9.0f} {'ok' if llm_ok else 'LOST':>5}"
+            )
+        print(row)
+
+    print("-" * len(columns))
+    print("Rule-based separators: " + ("OK" if all_ok else "LOST - see rows above"))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,24 +3,31 @@ Gmail API service for fetching and processing emails.
 Handles OAuth authentication, email retrieval, and hyperlink preservation.
 """
 
+import asyncio
 import logging
 import os
 import re
+import time
+import threading
 import email.utils  # RFC 2822 date parsing for Gmail message dates
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime as dt, timezone
-from typing import Any, List, Dict, Optional
+from typing import TYPE_CHECKING, Any, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
 import base64
+import hashlib
+import json
+from html import unescape
 
-# Google API imports for Gmail integration
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+# Google API client libraries are imported lazily inside the functions that use
+# them - googleapiclient.discovery alone adds ~0.2s to backend startup
+if TYPE_CHECKING:
+    import google_auth_httplib2
+    from google.oauth2.credentials import Credentials
 
 # Import LLM service for metadata stripping
 import llm_service
+import message_store
 
 # Configure logging for email operations
 logger = logging.getLogger(__name__)
@@ -28,27 +35,208 @@ logger = logging.getLogger(__name__)
 # Gmail API scopes - read-only access
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
+# Thread detail fetch mode: "concurrent" (thread pool), "batch" (Gmail HTTP batch
+# requests) or "sequential" (one call at a time)
+GMAIL_FETCH_MODE = os.getenv("GMAIL_FETCH_MODE", "concurrent").lower()
+
+# Maximum parallel threads().get() calls in concurrent mode
+GMAIL_FETCH_WORKERS = int(os.getenv("GMAIL_FETCH_WORKERS", "8"))
+
+# Sub-requests per HTTP batch in batch mode (Gmail allows up to 100, recommends <= 50)
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+
+# Retry rounds for failed sub-requests in batch mode (only failed ones are resent)
+GMAIL_BATCH_RETRIES = int(os.getenv("GMAIL_BATCH_RETRIES", "3"))
+
+# Reuse locally stored threads and download only new/changed ones (per-thread historyId)
+GMAIL_INCREMENTAL_SYNC = os.getenv("GMAIL_INCREMENTAL_SYNC", "true").lower() == "true"
+
+# Version of the message body extraction - bump when _extract_body_with_links
+# output changes so stored bodies are refetched instead of reused
+BODY_FORMAT_VERSION = 3
+
+# threads().list() page size when paginating (Gmail maximum is 500)
+GMAIL_LIST_PAGE_SIZE = int(os.getenv("GMAIL_LIST_PAGE_SIZE", "100"))
+
+# Rank over-fetched threads with a metadata-only pass and download full
+# bodies only for the top N threads
+GMAIL_METADATA_FIRST = os.getenv("GMAIL_METADATA_FIRST", "true").lower() == "true"
+
+# Largest iter_emails request that is ranked by latest activity (which lists and
+# ranks 3x max_results threads before the first yield); larger backfills are
+# streamed page by page in Gmail listing order
+GMAIL_RANK_MAX_THREADS = int(os.getenv("GMAIL_RANK_MAX_THREADS", "500"))
+
+# Headers requested in the metadata pass
+_METADATA_HEADERS = ["Date", "From", "Subject"]
+
+# Metadata stripping (LLM Call #1) mode: "batch" strips the combined batch text
+# in one call; "per_message" strips and caches each message so only unseen
+# messages go to the LLM (opt-in until compared with "batch" on real batches)
+STRIP_MODE = os.getenv("STRIP_MODE", "batch").lower()
+
+# Max characters of uncached message text per per-message strip LLM call
+STRIP_MAX_CHARS = int(os.getenv("STRIP_MAX_CHARS", "40000"))
+
+# HTML-to-text conversion. One tokenizing pass (re.split) over the HTML turns
+# tags into single-character markers (paragraph break, line break, <br>, link
+# start/url end/link end); the markers are then rendered as text.
+_MARK_PARA, _MARK_LINE, _MARK_BR = "\x01", "\x02", "\x03"
+_MARK_LINK, _MARK_HREF_END, _MARK_LINK_END = "\x04", "\x05", "\x06"
+_MARKERS = _MARK_PARA + _MARK_LINE + _MARK_BR + _MARK_LINK + _MARK_HREF_END + _MARK_LINK_END
+_STRIP_MARKERS = str.maketrans("", "", _MARKERS)
+_INLINE_MARKERS = str.maketrans(_MARK_PARA + _MARK_LINE + _MARK_BR, "   ")
+
+_PARAGRAPH_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol", "blockquote", "pre", "hr"}
+_LINE_TAGS = {"div", "tr", "li", "dt", "dd", "section", "article", "header", "footer"}
+_OPEN_TAG_MARKERS = {
+    **{tag: _MARK_PARA for tag in _PARAGRAPH_TAGS},
+    **{tag: _MARK_LINE for tag in _LINE_TAGS},
+    "br": _MARK_BR,
+    "td": " ",
+    "th": " ",
+}
+_CLOSE_TAG_MARKERS = {
+    **{tag: _MARK_PARA for tag in _PARAGRAPH_TAGS},
+    **{tag: _MARK_LINE for tag in _LINE_TAGS},
+    "a": _MARK_LINK_END,
+}
+
+# Groups: 1 = skipped element (content dropped with it), 2 = "/" for closing
+# tags, 3 = tag name, 4 = attributes. Comments match with no groups set.
+# split() returns [text, group 1, group 2, group 3, group 4, text, ...]
+_HTML_TOKEN_RE = re.compile(
+    r"<(?:(script|style|head|title|noscript)\b.*?</\1\s*|!--.*?--|(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*))>",
+    re.IGNORECASE | re.DOTALL
+)
+_HREF_RE = re.compile(r"\bhref\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))", re.IGNORECASE)
+_LINK_RE = re.compile(
+    f"{_MARK_LINK}([^{_MARK_HREF_END}]*){_MARK_HREF_END}([^{_MARK_LINK}{_MARK_LINK_END}]*){_MARK_LINK_END}?"
+)
+_DOUBLE_BR_RE = re.compile(f"{_MARK_BR}{_MARK_LINE}*{_MARK_BR}")
+_PARAGRAPH_RUN_RE = re.compile(
+    f"[{_MARK_LINE}{_MARK_BR}]*{_MARK_PARA}[{_MARK_PARA}{_MARK_LINE}{_MARK_BR}]*"
+)
+_LINE_RUN_RE = re.compile(f"[{_MARK_LINE}{_MARK_BR}]+")
+
+# HTTP statuses worth retrying (rate limits and transient server errors)
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Refresh the cached access token this many seconds before it expires
+GMAIL_TOKEN_REFRESH_MARGIN = int(os.getenv("GMAIL_TOKEN_REFRESH_MARGIN", "300"))
+
+# Per-thread authorized HTTP transports (httplib2.Http is not thread-safe)
+_thread_local = threading.local()
+
+# Process-wide credentials/service cache shared by all tasks
+_auth_lock = threading.RLock()
+_cached_creds: Optional["Credentials"] = None
+_cached_token_mtime: Optional[float] = None
+_cached_service: Optional[Tuple["Credentials", Any]] = None
+
+# Optional path to a Gmail discovery document; defaults to the static copy
+# bundled with google-api-python-client (never fetched over the network)
+GMAIL_DISCOVERY_FILE = os.getenv("GMAIL_DISCOVERY_FILE", "")
+
+# Parsed discovery document, loaded once per process
+_discovery_doc: Optional[Dict[str, Any]] = None
+
+
+def _get_token_path() -> Path:
+    """Return the absolute path of the OAuth token file."""
+    return Path(__file__).parent / os.getenv("GMAIL_TOKEN_FILE", "token.json")
+
+
+def _token_mtime() -> Optional[float]:
+    """Return token.json modification time, or None if it does not exist."""
+    try:
+        return _get_token_path().stat().st_mtime
+    except OSError:
+        return None
+
 
-def _get_gmail_service():
+def _get_gmail_credentials() -> "Credentials":
     """
-    Authenticate and return Gmail API service instance.
+    Return process-wide cached OAuth credentials, safe to share across tasks.
+    Reloads when token.json changes on disk and refreshes proactively when the
+    access token is within GMAIL_TOKEN_REFRESH_MARGIN seconds of expiry.
+
+    Returns:
+        Valid Google OAuth credentials
+
+    Raises:
+        FileNotFoundError: If credentials.json is missing
+        Exception: If authentication fails
+    """
+    global _cached_creds, _cached_token_mtime
+
+    from google.auth.transport.requests import Request
+
+    with _auth_lock:
+        if _cached_creds is not None and _token_mtime() != _cached_token_mtime:
+            logger.info("[AUTH] token.json changed on disk - reloading credentials")
+            _cached_creds = None
+
+        if _cached_creds is None:
+            _cached_creds = _load_gmail_credentials()
+            _cached_token_mtime = _token_mtime()
+            return _cached_creds
+
+        creds = _cached_creds
+        expiry = creds.expiry
+        now = dt.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC expiry
+        if creds.refresh_token and (not creds.valid or (expiry and (expiry - now).total_seconds() < GMAIL_TOKEN_REFRESH_MARGIN)):
+            logger.info("[AUTH] Access token near expiry - refreshing proactively")
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                logger.error(f"[AUTH] ✗ Token refresh failed: {e}")
+                raise
+            with open(_get_token_path(), "w") as token:
+                token.write(creds.to_json())
+            _cached_token_mtime = _token_mtime()
+            logger.info("[AUTH] ✓ Token refreshed and saved")
+
+        return creds
+
+
+def invalidate_gmail_service() -> None:
+    """
+    Drop the cached credentials and Gmail service.
+    Call after replacing token.json or credentials.json; the next fetch
+    reloads them (token.json changes are also detected automatically).
+    """
+    global _cached_creds, _cached_token_mtime, _cached_service
+
+    with _auth_lock:
+        _cached_creds = None
+        _cached_token_mtime = None
+        _cached_service = None
+    logger.info("[AUTH] Gmail credentials/service cache invalidated")
+
+
+def _load_gmail_credentials() -> "Credentials":
+    """
+    Load, refresh or create OAuth credentials for the Gmail API.
     Uses OAuth with credentials.json and token.json files.
 
     Returns:
-        Gmail API service object
+        Valid Google OAuth credentials
 
     Raises:
         FileNotFoundError: If credentials.json is missing
         Exception: If authentication fails
     """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     creds = None
     creds_file = os.getenv("GMAIL_CREDENTIALS_FILE", "credentials.json")
-    token_file = os.getenv("GMAIL_TOKEN_FILE", "token.json")
 
     # Construct absolute paths using pathlib
-    backend_dir = Path(__file__).parent
-    creds_path = backend_dir / creds_file
-    token_path = backend_dir / token_file
+    creds_path = Path(__file__).parent / creds_file
+    token_path = _get_token_path()
 
     # Load existing token if available
     logger.debug(f"[AUTH] Checking for existing token at: {token_path}")
@@ -92,20 +280,88 @@ def _get_gmail_service():
             token.write(creds.to_json())
         logger.info(f"[AUTH] ✓ Token saved successfully")
 
-    # Build Gmail service with credentials only
-    # The build() function will automatically create a requests-based transport
-    # when only credentials are provided (no http parameter)
-    logger.info("[AUTH] Building Gmail API service v1...")
-    service = build("gmail", "v1", credentials=creds)
-    logger.info("[AUTH] ✓ Gmail service built successfully")
+    return creds
 
-    return service
+
+def _get_gmail_discovery_document() -> Dict[str, Any]:
+    """
+    Return the parsed Gmail v1 discovery document, loading it once per process.
+    Uses GMAIL_DISCOVERY_FILE if set, otherwise the static document bundled
+    with google-api-python-client - no discovery HTTP fetch is ever made.
+
+    Returns:
+        Discovery document as a dictionary
+    """
+    global _discovery_doc
+
+    with _auth_lock:
+        if _discovery_doc is None:
+            if GMAIL_DISCOVERY_FILE:
+                doc_path = Path(GMAIL_DISCOVERY_FILE)
+                if not doc_path.is_absolute():
+                    doc_path = Path(__file__).parent / doc_path
+                logger.info(f"[AUTH] Loading Gmail discovery document from {doc_path}")
+                doc_text = doc_path.read_text(encoding="utf-8")
+            else:
+                from googleapiclient.discovery_cache import get_static_doc
+                doc_text = get_static_doc("gmail", "v1")
+                if doc_text is None:
+                    raise FileNotFoundError("Static Gmail v1 discovery document not found in google-api-python-client")
+            _discovery_doc = json.loads(doc_text)
+        return _discovery_doc
+
+
+def _get_gmail_service(creds: Optional["Credentials"] = None):
+    """
+    Return the process-wide cached Gmail API service instance.
+    The service is rebuilt only when the cached credentials are replaced.
+    Every request it builds runs on the calling thread's own transport, so the
+    service can be shared by concurrent background tasks and fetch workers.
+
+    Args:
+        creds: Optional pre-loaded credentials (cached credentials if omitted)
+
+    Returns:
+        Gmail API service object
+
+    Raises:
+        FileNotFoundError: If credentials.json is missing
+        Exception: If authentication fails
+    """
+    global _cached_service
+
+    with _auth_lock:
+        if creds is None:
+            creds = _get_gmail_credentials()
+
+        if _cached_service is not None and _cached_service[0] is creds:
+            return _cached_service[1]
+
+        from googleapiclient.discovery import build_from_document
+        from googleapiclient.http import HttpRequest
+
+        def _build_request(http, *args, **kwargs):
+            # httplib2.Http is not thread-safe - bind each request to the
+            # calling thread's transport instead of the shared one
+            return HttpRequest(_get_thread_http(creds), *args, **kwargs)
+
+        logger.info("[AUTH] Building Gmail API service v1...")
+        service = build_from_document(
+            _get_gmail_discovery_document(),
+            credentials=creds,
+            requestBuilder=_build_request
+        )
+        logger.info("[AUTH] ✓ Gmail service built successfully")
+
+        _cached_service = (creds, service)
+        return service
 
 
 def fetch_emails(
     sender_email: str,
     max_results: int = 50,
-    task_id: Optional[str] = None
+    task_id: Optional[str] = None,
+    fetch_workers: Optional[int] = None
 ) -> List[Dict[str, str]]:
     """
     Fetch INDIVIDUAL MESSAGES from email threads sent by specific sender.
@@ -115,6 +371,8 @@ def fetch_emails(
         sender_email: Email address to filter by (e.g., "admin@f5bot.com")
         max_results: Maximum number of THREADS to fetch (each thread may contain multiple messages)
         task_id: Optional task ID for logging
+        fetch_workers: Optional override for concurrent threads().get() calls
+                       (defaults to GMAIL_FETCH_WORKERS; 1 = sequential)
 
     Returns:
         List of INDIVIDUAL MESSAGE dictionaries with keys:
@@ -142,102 +400,32 @@ def fetch_emails(
         service = _get_gmail_service()
         logger.info(f"{log_prefix} [FETCH] ✓ Gmail service obtained")
 
-        # Step 2: Query THREADS from sender using Gmail search syntax
-        query = f"from:{sender_email}"
-        logger.info(f"{log_prefix} [FETCH] Step 2: Querying Gmail API for threads")
-        logger.info(f"{log_prefix} [FETCH] Query: {query}")
-        logger.info(f"{log_prefix} [FETCH] Executing threads().list() API call...")
-
-        try:
-            # Over-fetch to compensate for Gmail API ordering by matching message date
-            # (threads with user replies get ranked by the older sender message, not the latest reply)
-            fetch_limit = min(max_results * 3, 100)
-            logger.info(f"{log_prefix} [FETCH] Over-fetching {fetch_limit} threads (requested {max_results}) to correct ordering")
-            results = service.users().threads().list(
-                userId="me",
-                q=query,
-                maxResults=fetch_limit
-            ).execute()
-            logger.info(f"{log_prefix} [FETCH] ✓ API call successful")
-        except Exception as api_error:
-            logger.error(f"{log_prefix} [FETCH] ✗ API call failed: {api_error}")
-            logger.error(f"{log_prefix} [FETCH] Error type: {type(api_error).__name__}")
-            raise
-
-        threads = results.get("threads", [])
-        logger.info(f"{log_prefix} [FETCH] API response received - {len(threads)} threads found")
+        # Steps 2-4: List 3x max_results threads, reuse stored ones, rank by latest activity
+        selection = _select_threads(service, sender_email, max_results, fetch_workers, log_prefix)
+        threads = selection["listed"]
 
         if not threads:
             logger.warning(f"{log_prefix} [FETCH] ⚠ No threads found from {sender_email}")
             logger.info(f"{log_prefix} ========== FETCH EMAILS END (No Results) ==========")
             return []
 
-        # Step 3: Fetch full details for each thread and extract INDIVIDUAL MESSAGES
-        logger.info(f"{log_prefix} [FETCH] Step 3: Fetching threads and extracting individual messages")
-        all_messages = []  # Will contain ALL individual messages from ALL threads
-        threads_processed = 0
+        thread_ids = selection["thread_ids"]
 
-        for i, thread in enumerate(threads, 1):
-            thread_id = thread["id"]
-            logger.debug(f"{log_prefix} [FETCH] Processing thread {i}/{len(threads)} - ID: {thread_id[:12]}...")
+        # Step 5: Load stored threads, fetch the remaining full threads and extract INDIVIDUAL MESSAGES
+        logger.info(f"{log_prefix} [FETCH] Step 5: Resolving {len(thread_ids)} threads and extracting individual messages")
+        resolved, downloaded, full_failed = _resolve_threads(
+            service, thread_ids, selection, sender_email, fetch_workers, log_prefix
+        )
+        failed = selection["failed"] + full_failed
 
-            try:
-                # Fetch full thread details with all messages using Gmail API
-                logger.debug(f"{log_prefix} [FETCH]   → Calling threads().get() for thread {i}")
-                thread_detail = service.users().threads().get(
-                    userId="me",
-                    id=thread_id,
-                    format="full"
-                ).execute()
-                logger.debug(f"{log_prefix} [FETCH]   ✓ Thread details fetched")
-
-                # Extract individual messages from thread (NEW: message-level instead of thread-level)
-                messages = thread_detail.get("messages", [])
-                total_in_thread = len(messages)
-                logger.debug(f"{log_prefix} [FETCH]   → Extracting {total_in_thread} individual messages from thread")
-
-                # Get thread subject from first message
-                first_headers = messages[0]["payload"]["headers"] if messages else []
-                thread_subject = next((h["value"] for h in first_headers if h["name"] == "Subject"), "No Subject")
-
-                # Process each message in the thread individually
-                for msg_num, message in enumerate(messages, 1):
-                    msg_headers = message["payload"]["headers"]
-
-                    # Extract message metadata
-                    msg_from = next((h["value"] for h in msg_headers if h["name"] == "From"), sender_email)
-                    msg_date = next((h["value"] for h in msg_headers if h["name"] == "Date"), "Unknown")
-                    msg_body = _extract_body_with_links(message["payload"])
-
-                    # Create individual message object with thread metadata
-                    message_obj = {
-                        "message_id": message["id"],  # Unique message ID
-                        "thread_id": thread_id,  # Parent thread ID
-                        "message_number": msg_num,  # Position in thread (1, 2, 3...)
-                        "total_in_thread": total_in_thread,  # Total messages in thread
-                        "subject": thread_subject,  # Thread subject
-                        "from": msg_from,  # Sender
-                        "date": msg_date,  # Message date
-                        "body": msg_body  # Message body with hyperlinks
-                    }
-
-                    all_messages.append(message_obj)
-
-                threads_processed += 1
-                logger.debug(f"{log_prefix} [FETCH]   ✓ Extracted {total_in_thread} messages from thread {i}")
-
-                # Progress logging every 5 threads
-                if i % 5 == 0:
-                    logger.info(f"{log_prefix} [FETCH] Progress: {i}/{len(threads)} threads processed ({len(all_messages)} total messages)")
-
-            except HttpError as e:
-                logger.error(f"{log_prefix} [FETCH]   ✗ Failed to fetch thread {thread_id}: {e}")
-                logger.error(f"{log_prefix} [FETCH]   Error code: {e.resp.status if hasattr(e, 'resp') else 'unknown'}")
-                continue
-            except Exception as e:
-                logger.error(f"{log_prefix} [FETCH]   ✗ Unexpected error parsing thread {thread_id}: {e}")
-                logger.error(f"{log_prefix} [FETCH]   Error type: {type(e).__name__}")
+        # Flatten in selection order; failed threads are skipped
+        all_messages = []  # Will contain ALL individual messages from ALL threads
+        threads_processed = 0
+        for tid in thread_ids:
+            if tid not in resolved:
                 continue
+            all_messages.extend(resolved[tid])
+            threads_processed += 1
 
         # Sort threads by most recent message date and trim to requested count.
         # Gmail API orders threads by the date of the matching-sender message, not by
@@ -250,20 +438,6 @@ def fetch_emails(
                 thread_groups[tid] = []
             thread_groups[tid].append(msg)
 
-        def _latest_date(messages: List[Dict[str, Any]]) -> dt:
-            """Parse RFC 2822 dates from messages, return the most recent one."""
-            latest = None
-            for m in messages:
-                try:
-                    parsed = email.utils.parsedate_to_datetime(m["date"])
-                    if latest is None or parsed > latest:
-                        latest = parsed
-                except Exception:
-                    continue
-            # Use timezone-aware minimum to avoid TypeError when compared with
-            # Gmail's timezone-aware dates during sorted()
-            return latest or dt.min.replace(tzinfo=timezone.utc)
-
         # Sort by most recent message date (descending) and keep top N threads
         sorted_threads = sorted(thread_groups.items(), key=lambda x: _latest_date(x[1]), reverse=True)
         top_threads = sorted_threads[:max_results]
@@ -277,8 +451,10 @@ def fetch_emails(
 
         logger.info(f"{log_prefix} [FETCH] ========== FETCH SUMMARY ==========")
         logger.info(f"{log_prefix} [FETCH] Threads from API: {len(threads)} (over-fetched)")
+        logger.info(f"{log_prefix} [FETCH] Reused from message store: {selection['reused']}")
+        logger.info(f"{log_prefix} [FETCH] Full threads downloaded: {selection['downloaded'] + downloaded}")
         logger.info(f"{log_prefix} [FETCH] Successfully processed: {threads_processed}")
-        logger.info(f"{log_prefix} [FETCH] Failed/Skipped: {len(threads) - threads_processed}")
+        logger.info(f"{log_prefix} [FETCH] Failed: {failed}")
         logger.info(f"{log_prefix} [FETCH] Threads after sort+trim: {len(top_threads)} (requested {max_results})")
         logger.info(f"{log_prefix} [FETCH] **TOTAL INDIVIDUAL MESSAGES**: {len(all_messages)}")
         logger.info(f"{log_prefix} ========== FETCH EMAILS END (Success) ==========")
@@ -294,6 +470,729 @@ def fetch_emails(
         raise Exception(f"Failed to fetch email threads: {str(e)}")
 
 
+def iter_emails(
+    sender_email: str,
+    max_results: int = 50,
+    task_id: Optional[str] = None,
+    fetch_workers: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream INDIVIDUAL MESSAGES from threads sent by specific sender.
+    Selects the same threads as fetch_emails (3x over-fetch, ranked by latest
+    activity - metadata-only when GMAIL_METADATA_FIRST), then resolves full
+    bodies GMAIL_LIST_PAGE_SIZE threads at a time (stored threads loaded from
+    the message store, the rest downloaded) and yields each chunk's messages
+    as soon as it is resolved. Only thread IDs and dates are held for the
+    whole selection, bodies one chunk at a time.
+
+    Ranking needs the whole listing first. Requests above GMAIL_RANK_MAX_THREADS
+    (large backfills) skip it and yield each listing page as it arrives, in
+    Gmail listing order; so does a selection that keeps every listed thread.
+
+    Args:
+        sender_email: Email address to filter by (e.g., "admin@f5bot.com")
+        max_results: Maximum number of THREADS to stream
+        task_id: Optional task ID for logging
+        fetch_workers: Optional override for concurrent threads().get() calls
+
+    Yields:
+        INDIVIDUAL MESSAGE dictionaries (same keys as fetch_emails)
+
+    Raises:
+        Exception: If Gmail API call fails
+    """
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    logger.info(f"{log_prefix} ========== STREAM EMAILS START ==========")
+    logger.info(f"{log_prefix} [FETCH] Target sender: {sender_email}, max threads: {max_results}")
+
+    try:
+        service = _get_gmail_service()
+
+        if max_results > GMAIL_RANK_MAX_THREADS:
+            logger.info(
+                f"{log_prefix} [FETCH] {max_results} threads exceeds GMAIL_RANK_MAX_THREADS "
+                f"({GMAIL_RANK_MAX_THREADS}) - streaming pages in listing order without ranking"
+            )
+            selections = (
+                _build_selection(page, len(page), service, sender_email, fetch_workers, log_prefix)
+                for page in _list_threads(service, f"from:{sender_email}", max_results, log_prefix)
+            )
+        else:
+            selections = [_select_threads(service, sender_email, max_results, fetch_workers, log_prefix)]
+
+        threads_yielded = 0
+        messages_yielded = 0
+        failed = 0
+        for selection in selections:
+            failed += selection["failed"]
+            thread_ids = selection["thread_ids"]
+            for start in range(0, len(thread_ids), GMAIL_LIST_PAGE_SIZE):
+                chunk = thread_ids[start:start + GMAIL_LIST_PAGE_SIZE]
+                resolved, _, chunk_failed = _resolve_threads(
+                    service, chunk, selection, sender_email, fetch_workers, log_prefix
+                )
+                failed += chunk_failed
+
+                for tid in chunk:
+                    messages = resolved.get(tid)
+                    if not messages:
+                        continue
+                    threads_yielded += 1
+                    messages_yielded += len(messages)
+                    yield from sorted(messages, key=lambda m: m.get("message_number", 1))
+
+                logger.info(f"{log_prefix} [FETCH] Streamed {threads_yielded} threads ({messages_yielded} messages) so far")
+
+        logger.info(f"{log_prefix} [FETCH] Threads streamed: {threads_yielded}, failed: {failed}")
+        logger.info(f"{log_prefix} ========== STREAM EMAILS END ==========")
+
+    except Exception as e:
+        logger.error(f"{log_prefix} [FETCH] ========== STREAM EMAILS FAILED ==========")
+        logger.error(f"{log_prefix} [FETCH] ✗ Gmail API error: {str(e)}")
+        logger.error(f"{log_prefix} [FETCH] Error type: {type(e).__name__}")
+        raise Exception(f"Failed to fetch email threads: {str(e)}")
+
+
+def _select_threads(
+    service,
+    sender_email: str,
+    max_results: int,
+    fetch_workers: Optional[int] = None,
+    log_prefix: str = ""
+) -> Dict[str, Any]:
+    """
+    List over-fetched threads and select the top max_results by latest activity.
+
+    Gmail orders threads by the date of the matching-sender message, not by
+    overall thread activity (threads with recent user replies rank as stale),
+    so 3x max_results threads are listed and ranked by their latest message
+    (see _build_selection).
+
+    Args:
+        service: Gmail API service object
+        sender_email: Email address to filter by
+        max_results: Maximum number of THREADS to select
+        fetch_workers: Optional override for concurrent workers
+        log_prefix: Task log prefix
+
+    Returns:
+        Selection dictionary (see _build_selection)
+    """
+    # Step 2: Query THREADS from sender using Gmail search syntax
+    fetch_limit = max_results * 3
+    logger.info(f"{log_prefix} [FETCH] Step 2: Querying Gmail API for threads")
+    logger.info(f"{log_prefix} [FETCH] Over-fetching {fetch_limit} threads (requested {max_results}) to correct ordering")
+    threads = [
+        thread
+        for page in _list_threads(service, f"from:{sender_email}", fetch_limit, log_prefix)
+        for thread in page
+    ]
+    logger.info(f"{log_prefix} [FETCH] API response received - {len(threads)} threads found")
+
+    return _build_selection(threads, max_results, service, sender_email, fetch_workers, log_prefix)
+
+
+def _build_selection(
+    threads: List[Dict[str, Any]],
+    max_results: int,
+    service,
+    sender_email: str,
+    fetch_workers: Optional[int] = None,
+    log_prefix: str = ""
+) -> Dict[str, Any]:
+    """
+    Select the top max_results of listed threads by latest activity.
+
+    Stored threads are ranked by the dates in the message store, the rest
+    from a metadata-only fetch (GMAIL_METADATA_FIRST) or, with metadata-first
+    off, from full downloads. Only IDs and dates are kept: bodies of selected
+    threads are loaded or downloaded later, chunk by chunk (see _resolve_threads).
+
+    Args:
+        threads: Thread stubs from threads().list()
+        max_results: Maximum number of THREADS to select
+        service: Gmail API service object
+        sender_email: Email address to filter by
+        fetch_workers: Optional override for concurrent workers
+        log_prefix: Task log prefix
+
+    Returns:
+        Dictionary with:
+        - listed: Thread stubs from threads().list()
+        - thread_ids: Selected thread IDs, latest activity first (listing order
+          when every listed thread is kept)
+        - stored: Selected thread IDs to load from the message store
+        - resolved: {thread_id: messages} already in memory (full downloads
+          while ranking with the message store off)
+        - history_ids: Listed historyId per thread ID
+        - reused: Listed threads served from the message store
+        - downloaded: Full threads downloaded while ranking
+        - failed: Threads that failed to fetch while ranking
+    """
+    # Step 3: Resolve threads - reuse unchanged stored threads (incremental sync)
+    thread_ids = [thread["id"] for thread in threads]
+    history_ids = {thread["id"]: thread.get("historyId") for thread in threads}
+    reusable: Dict[str, dt] = {}
+    if GMAIL_INCREMENTAL_SYNC and threads:
+        logger.info(f"{log_prefix} [FETCH] Step 3: Incremental sync - checking message store")
+        reusable = _get_reusable_threads(threads, log_prefix)
+
+    selection = {
+        "listed": threads,
+        "thread_ids": thread_ids,
+        "stored": set(reusable),
+        "resolved": {},
+        "history_ids": history_ids,
+        "reused": len(reusable),
+        "downloaded": 0,
+        "failed": 0,
+    }
+    if len(thread_ids) <= max_results:
+        return selection
+
+    # Step 4: Rank by latest activity - metadata-first fetches only Date/From/Subject
+    # for the candidates and leaves full bodies to the caller (top N only)
+    candidates = [tid for tid in thread_ids if tid not in reusable]
+    ranked = list(reusable.items())
+    if GMAIL_METADATA_FIRST and candidates:
+        logger.info(f"{log_prefix} [FETCH] Step 4: Ranking {len(candidates)} threads by metadata")
+        metadata_results = _fetch_threads(
+            service=service,
+            thread_ids=candidates,
+            sender_email=sender_email,
+            fetch_workers=fetch_workers,
+            log_prefix=log_prefix,
+            format="metadata"
+        )
+        ranked += [(tid, _latest_date(msgs)) for tid, msgs in zip(candidates, metadata_results) if msgs is not None]
+        selection["failed"] = sum(1 for msgs in metadata_results if msgs is None)
+    else:
+        logger.info(f"{log_prefix} [FETCH] Step 4: Ranking {len(candidates)} threads by full download")
+        fetched, selection["failed"] = _fetch_and_store(
+            service=service,
+            thread_ids=candidates,
+            history_ids=history_ids,
+            sender_email=sender_email,
+            fetch_workers=fetch_workers,
+            log_prefix=log_prefix
+        )
+        ranked += [(tid, _latest_date(msgs)) for tid, msgs in fetched.items()]
+        if GMAIL_INCREMENTAL_SYNC:
+            selection["stored"].update(fetched)  # Saved by _fetch_and_store - reloaded per chunk
+        else:
+            selection["resolved"] = fetched
+        selection["downloaded"] = len(fetched)
+
+    ranked.sort(key=lambda x: x[1], reverse=True)
+    selection["thread_ids"] = [tid for tid, _ in ranked[:max_results]]
+    kept = set(selection["thread_ids"])
+    selection["stored"] &= kept
+    selection["resolved"] = {tid: msgs for tid, msgs in selection["resolved"].items() if tid in kept}
+    logger.info(
+        f"{log_prefix} [FETCH] Ranking: kept top {len(kept)} of {len(ranked)} threads, "
+        f"{len(kept) - len(selection['stored']) - len(selection['resolved'])} need full bodies"
+    )
+    return selection
+
+
+def _resolve_threads(
+    service,
+    thread_ids: List[str],
+    selection: Dict[str, Any],
+    sender_email: str,
+    fetch_workers: Optional[int] = None,
+    log_prefix: str = ""
+) -> Tuple[Dict[str, List[Dict[str, Any]]], int, int]:
+    """
+    Get the full messages of selected threads: load stored ones from the
+    message store, take in-memory ones from the selection (popped, so they
+    are released once used) and download the rest.
+
+    Args:
+        service: Gmail API service object
+        thread_ids: Selected thread IDs to resolve
+        selection: Selection the threads belong to (see _build_selection)
+        sender_email: Sender being synced
+        fetch_workers: Optional override for concurrent workers
+        log_prefix: Task log prefix
+
+    Returns:
+        Tuple of ({thread_id: messages}, threads downloaded, threads failed)
+    """
+    stored_ids = [tid for tid in thread_ids if tid in selection["stored"]]
+    stored = message_store.get_threads(stored_ids, BODY_FORMAT_VERSION) if stored_ids else {}
+
+    resolved: Dict[str, List[Dict[str, Any]]] = {}
+    for tid in thread_ids:
+        messages = selection["resolved"].pop(tid, None) or (stored.get(tid) or {}).get("messages")
+        if messages:
+            resolved[tid] = messages
+
+    # Threads removed from the store since selection are downloaded like new ones
+    fetched, failed = _fetch_and_store(
+        service=service,
+        thread_ids=[tid for tid in thread_ids if tid not in resolved],
+        history_ids=selection["history_ids"],
+        sender_email=sender_email,
+        fetch_workers=fetch_workers,
+        log_prefix=log_prefix
+    )
+    resolved.update(fetched)
+    return resolved, len(fetched), failed
+
+
+def _list_threads(service, query: str, limit: int, log_prefix: str = "") -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lazily page through threads().list() results, following nextPageToken.
+
+    Args:
+        service: Gmail API service object
+        query: Gmail search query (e.g., "from:admin@f5bot.com")
+        limit: Maximum number of threads to list in total
+        log_prefix: Task log prefix
+
+    Yields:
+        Pages of thread stubs (id, snippet, historyId)
+    """
+    listed = 0
+    page_token = None
+    page_num = 0
+
+    while listed < limit:
+        page_num += 1
+        page_size = min(limit - listed, GMAIL_LIST_PAGE_SIZE)
+        logger.info(f"{log_prefix} [FETCH] Executing threads().list() page {page_num} (query: {query}, size: {page_size})")
+        try:
+            response = service.users().threads().list(
+                userId="me",
+                q=query,
+                maxResults=page_size,
+                pageToken=page_token
+            ).execute()
+        except Exception as api_error:
+            logger.error(f"{log_prefix} [FETCH] ✗ API call failed: {api_error}")
+            logger.error(f"{log_prefix} [FETCH] Error type: {type(api_error).__name__}")
+            raise
+
+        page = response.get("threads", [])[:limit - listed]
+        if page:
+            listed += len(page)
+            yield page
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+
+def _fetch_and_store(
+    service,
+    thread_ids: List[str],
+    history_ids: Dict[str, Optional[str]],
+    sender_email: str,
+    fetch_workers: Optional[int] = None,
+    log_prefix: str = ""
+) -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+    """
+    Fetch full threads and save them to the message store (incremental sync).
+
+    Args:
+        service: Gmail API service object
+        thread_ids: Thread IDs to fetch
+        history_ids: Listed historyId per thread ID
+        sender_email: Sender being synced
+        fetch_workers: Optional override for concurrent workers
+        log_prefix: Task log prefix
+
+    Returns:
+        Tuple of ({thread_id: messages} for fetched threads, number of failed threads)
+    """
+    if not thread_ids:
+        return {}, 0
+
+    results = _fetch_threads(
+        service=service,
+        thread_ids=thread_ids,
+        sender_email=sender_email,
+        fetch_workers=fetch_workers,
+        log_prefix=log_prefix
+    )
+
+    fetched: Dict[str, List[Dict[str, Any]]] = {}
+    for thread_id, messages in zip(thread_ids, results):
+        if messages is None:
+            continue
+        fetched[thread_id] = messages
+        if GMAIL_INCREMENTAL_SYNC:
+            message_store.save_thread(
+                sender_email=sender_email,
+                thread_id=thread_id,
+                history_id=history_ids.get(thread_id),
+                messages=messages,
+                body_version=BODY_FORMAT_VERSION
+            )
+
+    return fetched, len(thread_ids) - len(fetched)
+
+
+def _fetch_threads(
+    service,
+    thread_ids: List[str],
+    sender_email: str,
+    fetch_workers: Optional[int] = None,
+    log_prefix: str = "",
+    format: str = "full"
+) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Fetch thread details using the configured GMAIL_FETCH_MODE.
+
+    Args:
+        service: Gmail API service object
+        thread_ids: Thread IDs in Gmail listing order
+        sender_email: Fallback sender for messages without From header
+        fetch_workers: Optional override for concurrent workers
+        log_prefix: Task log prefix
+        format: "full" (bodies) or "metadata" (Date/From/Subject headers only)
+
+    Returns:
+        Per-thread message lists aligned with thread_ids (None for failed threads)
+    """
+    if GMAIL_FETCH_MODE == "batch":
+        logger.info(f"{log_prefix} [FETCH] Fetching {len(thread_ids)} threads, format={format} (batch size={GMAIL_BATCH_SIZE})")
+        return _fetch_thread_details_batched(
+            service=service,
+            thread_ids=thread_ids,
+            sender_email=sender_email,
+            batch_size=GMAIL_BATCH_SIZE,
+            log_prefix=log_prefix,
+            format=format
+        )
+
+    workers = fetch_workers if fetch_workers is not None else GMAIL_FETCH_WORKERS
+    if GMAIL_FETCH_MODE == "sequential":
+        workers = 1
+    logger.info(f"{log_prefix} [FETCH] Fetching {len(thread_ids)} threads, format={format} (workers={workers})")
+    return _fetch_thread_details(
+        service=service,
+        thread_ids=thread_ids,
+        sender_email=sender_email,
+        workers=workers,
+        log_prefix=log_prefix,
+        format=format
+    )
+
+
+def _get_reusable_threads(threads: List[Dict[str, Any]], log_prefix: str = "") -> Dict[str, dt]:
+    """
+    Find listed threads that can be served from the local message store.
+    Gmail bumps a thread's historyId whenever one of its messages is added,
+    deleted or modified, so a stored thread is reused only while its stored
+    historyId matches the listed one.
+
+    Stored messages are read GMAIL_LIST_PAGE_SIZE threads at a time and only
+    their latest date is kept (bodies are loaded again when yielded).
+
+    Args:
+        threads: Thread stubs from threads().list() (id + historyId)
+        log_prefix: Task log prefix
+
+    Returns:
+        Dictionary {thread_id: latest message date} for unchanged threads
+    """
+    reusable: Dict[str, dt] = {}
+    for start in range(0, len(threads), GMAIL_LIST_PAGE_SIZE):
+        page = threads[start:start + GMAIL_LIST_PAGE_SIZE]
+        stored = message_store.get_threads([thread["id"] for thread in page], BODY_FORMAT_VERSION)
+        for thread in page:
+            cached = stored.get(thread["id"])
+            if cached is None or not cached["messages"]:
+                continue
+            if not thread.get("historyId") or cached["history_id"] != thread["historyId"]:
+                continue
+            reusable[thread["id"]] = _latest_date(cached["messages"])
+
+    logger.info(f"{log_prefix} [FETCH] Message store: {len(reusable)} threads reused, {len(threads) - len(reusable)} to fetch")
+    return reusable
+
+
+def _latest_date(messages: List[Dict[str, Any]]) -> dt:
+    """Parse RFC 2822 dates from messages, return the most recent one."""
+    latest = None
+    for m in messages:
+        try:
+            parsed = email.utils.parsedate_to_datetime(m["date"])
+            if latest is None or parsed > latest:
+                latest = parsed
+        except Exception:
+            continue
+    # Use timezone-aware minimum to avoid TypeError when compared with
+    # Gmail's timezone-aware dates during sorted()
+    return latest or dt.min.replace(tzinfo=timezone.utc)
+
+
+def _thread_get_request(service, thread_id: str, format: str = "full"):
+    """
+    Build a threads().get() request.
+    Metadata requests only ask for the headers used for ranking.
+
+    Args:
+        service: Gmail API service object
+        thread_id: Gmail thread ID
+        format: "full" or "metadata"
+
+    Returns:
+        Unexecuted Gmail API request
+    """
+    if format == "metadata":
+        return service.users().threads().get(
+            userId="me",
+            id=thread_id,
+            format="metadata",
+            metadataHeaders=_METADATA_HEADERS
+        )
+    return service.users().threads().get(userId="me", id=thread_id, format="full")
+
+
+def _get_thread_http(creds: "Credentials") -> "google_auth_httplib2.AuthorizedHttp":
+    """
+    Return an authorized HTTP transport owned by the calling thread.
+    The shared service transport must not be used from several threads at once.
+
+    Args:
+        creds: OAuth credentials to authorize requests with
+
+    Returns:
+        AuthorizedHttp bound to the current thread
+    """
+    import google_auth_httplib2
+    from googleapiclient.http import build_http
+
+    http = getattr(_thread_local, "http", None)
+    if http is None or http.credentials is not creds:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=build_http())
+        _thread_local.http = http
+    return http
+
+
+def _thread_to_messages(thread_detail: Dict, thread_id: str, sender_email: str) -> List[Dict[str, Any]]:
+    """
+    Split a full Gmail thread into INDIVIDUAL MESSAGE dictionaries.
+
+    Args:
+        thread_detail: Gmail API thread object (format="full", or "metadata" for empty bodies)
+        thread_id: Parent thread identifier
+        sender_email: Fallback sender when a message has no From header
+
+    Returns:
+        List of message dictionaries in thread order
+    """
+    messages = thread_detail.get("messages", [])
+    total_in_thread = len(messages)
+
+    # Get thread subject from first message
+    first_headers = messages[0]["payload"]["headers"] if messages else []
+    thread_subject = next((h["value"] for h in first_headers if h["name"] == "Subject"), "No Subject")
+
+    message_objs = []
+    for msg_num, message in enumerate(messages, 1):
+        msg_headers = message["payload"]["headers"]
+
+        # Extract message metadata
+        msg_from = next((h["value"] for h in msg_headers if h["name"] == "From"), sender_email)
+        msg_date = next((h["value"] for h in msg_headers if h["name"] == "Date"), "Unknown")
+        msg_body = _extract_body_with_links(message["payload"])
+
+        # Create individual message object with thread metadata
+        message_objs.append({
+            "message_id": message["id"],  # Unique message ID
+            "thread_id": thread_id,  # Parent thread ID
+            "message_number": msg_num,  # Position in thread (1, 2, 3...)
+            "total_in_thread": total_in_thread,  # Total messages in thread
+            "subject": thread_subject,  # Thread subject
+            "from": msg_from,  # Sender
+            "date": msg_date,  # Message date
+            "body": msg_body  # Message body with hyperlinks
+        })
+
+    return message_objs
+
+
+def _fetch_thread_details(
+    service,
+    thread_ids: List[str],
+    sender_email: str,
+    workers: int,
+    log_prefix: str = "",
+    format: str = "full"
+) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Fetch thread details and extract individual messages, optionally in parallel.
+    Failed threads are logged and skipped (None in the result) as in sequential mode.
+
+    Args:
+        service: Gmail API service object
+        thread_ids: Thread IDs in Gmail listing order
+        sender_email: Fallback sender for messages without From header
+        workers: Maximum concurrent threads().get() calls (1 = sequential)
+        log_prefix: Task log prefix
+        format: "full" or "metadata"
+
+    Returns:
+        Per-thread message lists aligned with thread_ids (None for failed threads)
+    """
+    from googleapiclient.errors import HttpError
+
+    total = len(thread_ids)
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * total
+
+    def _fetch_one(index: int) -> Optional[List[Dict[str, Any]]]:
+        thread_id = thread_ids[index]
+        logger.debug(f"{log_prefix} [FETCH] Processing thread {index + 1}/{total} - ID: {thread_id[:12]}...")
+
+        try:
+            logger.debug(f"{log_prefix} [FETCH]   → Calling threads().get() for thread {index + 1}")
+            thread_detail = _thread_get_request(service, thread_id, format).execute()
+
+            messages = _thread_to_messages(thread_detail, thread_id, sender_email)
+            logger.debug(f"{log_prefix} [FETCH]   ✓ Extracted {len(messages)} messages from thread {index + 1}")
+            return messages
+
+        except HttpError as e:
+            logger.error(f"{log_prefix} [FETCH]   ✗ Failed to fetch thread {thread_id}: {e}")
+            logger.error(f"{log_prefix} [FETCH]   Error code: {e.resp.status if hasattr(e, 'resp') else 'unknown'}")
+            return None
+        except Exception as e:
+            logger.error(f"{log_prefix} [FETCH]   ✗ Unexpected error parsing thread {thread_id}: {e}")
+            logger.error(f"{log_prefix} [FETCH]   Error type: {type(e).__name__}")
+            return None
+
+    def _log_progress(done: int) -> None:
+        # Progress logging every 5 threads
+        if done % 5 == 0:
+            message_count = sum(len(r) for r in results if r)
+            logger.info(f"{log_prefix} [FETCH] Progress: {done}/{total} threads processed ({message_count} total messages)")
+
+    if workers <= 1 or total <= 1:
+        for index in range(total):
+            results[index] = _fetch_one(index)
+            _log_progress(index + 1)
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(workers, total), thread_name_prefix="gmail-fetch") as executor:
+        futures = {executor.submit(_fetch_one, index): index for index in range(total)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            _log_progress(done)
+
+    return results
+
+
+def _is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether a failed Gmail sub-request is worth retrying.
+
+    Args:
+        error: Exception reported for the request
+
+    Returns:
+        True for rate limits and transient server errors
+    """
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(error, HttpError):
+        return False
+
+    status = error.resp.status if hasattr(error, "resp") else None
+    if status in _RETRYABLE_STATUSES:
+        return True
+
+    # Gmail reports per-user rate limits as 403 with a specific reason
+    return status == 403 and "ratelimitexceeded" in str(error).lower().replace(" ", "")
+
+
+def _fetch_thread_details_batched(
+    service,
+    thread_ids: List[str],
+    sender_email: str,
+    batch_size: int,
+    log_prefix: str = "",
+    format: str = "full"
+) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Fetch full thread details using Gmail HTTP batch requests.
+    Packs up to batch_size threads().get() calls into one round-trip and
+    resends only the sub-requests that failed with a retryable error.
+
+    Args:
+        service: Gmail API service object
+        thread_ids: Thread IDs in Gmail listing order
+        sender_email: Fallback sender for messages without From header
+        batch_size: Maximum sub-requests per HTTP batch
+        log_prefix: Task log prefix
+        format: "full" or "metadata"
+
+    Returns:
+        Per-thread message lists aligned with thread_ids (None for failed threads)
+    """
+    total = len(thread_ids)
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * total
+    batch_size = max(1, min(batch_size, 100))
+
+    for chunk_start in range(0, total, batch_size):
+        pending = list(range(chunk_start, min(chunk_start + batch_size, total)))
+        attempt = 0
+
+        while pending:
+            failed: Dict[int, Exception] = {}
+
+            def _callback(request_id: str, response: Dict, exception: Optional[Exception]) -> None:
+                index = int(request_id)
+                if exception is not None:
+                    failed[index] = exception
+                    return
+                try:
+                    results[index] = _thread_to_messages(response, thread_ids[index], sender_email)
+                except Exception as e:
+                    # Parse errors are not transient - skip without retrying
+                    logger.error(f"{log_prefix} [FETCH]   ✗ Unexpected error parsing thread {thread_ids[index]}: {e}")
+                    logger.error(f"{log_prefix} [FETCH]   Error type: {type(e).__name__}")
+
+            batch = service.new_batch_http_request(callback=_callback)
+            for index in pending:
+                batch.add(_thread_get_request(service, thread_ids[index], format), request_id=str(index))
+
+            logger.debug(f"{log_prefix} [FETCH]   → Executing batch of {len(pending)} threads().get() calls (attempt {attempt + 1})")
+            try:
+                batch.execute()
+            except Exception as e:
+                # Whole batch failed (e.g. connection reset) - every sub-request is pending again
+                logger.warning(f"{log_prefix} [FETCH]   ⚠ Batch request failed: {e}")
+                failed = {index: e for index in pending if results[index] is None}
+                retryable = sorted(failed)
+            else:
+                retryable = sorted(i for i, err in failed.items() if _is_retryable_error(err))
+
+            # Log and skip permanent failures
+            for index, err in failed.items():
+                if index not in retryable or attempt >= GMAIL_BATCH_RETRIES:
+                    logger.error(f"{log_prefix} [FETCH]   ✗ Failed to fetch thread {thread_ids[index]}: {err}")
+
+            if not retryable or attempt >= GMAIL_BATCH_RETRIES:
+                break
+
+            attempt += 1
+            delay = min(2 ** attempt, 30)
+            logger.info(f"{log_prefix} [FETCH] Retrying {len(retryable)} failed sub-requests in {delay}s (retry {attempt}/{GMAIL_BATCH_RETRIES})")
+            time.sleep(delay)
+            pending = retryable
+
+        done = min(chunk_start + batch_size, total)
+        message_count = sum(len(r) for r in results if r)
+        logger.info(f"{log_prefix} [FETCH] Progress: {done}/{total} threads processed ({message_count} total messages)")
+
+    return results
+
+
 def _parse_thread(thread: Dict) -> Dict[str, str]:
     """
     Parse Gmail thread and combine all messages within it.
@@ -376,91 +1275,188 @@ def _parse_message(message: Dict) -> Dict[str, str]:
     }
 
 
-def _extract_body_with_links(payload: Dict) -> str:
+def _iter_mime_leaves(part: Dict) -> Iterator[Dict]:
     """
-    Extract email body and preserve hyperlinks.
-    Handles both plain text and HTML parts.
+    Walk a MIME tree depth-first, yielding leaf parts in document order.
+    Nothing is decoded here, so callers can stop as soon as they find
+    the part they want.
+
+    Args:
+        part: Gmail message payload or sub-part
+
+    Yields:
+        Leaf part dictionaries (parts without sub-parts)
+    """
+    if part.get("parts"):
+        for sub_part in part["parts"]:
+            yield from _iter_mime_leaves(sub_part)
+    else:
+        yield part
+
+
+def _select_body_part(payload: Dict) -> Optional[Dict]:
+    """
+    Pick the part to use as the message body: first text/html part
+    (keeps hyperlinks), otherwise first text/plain part.
+    Attachments (parts with a filename) are ignored.
 
     Args:
         payload: Gmail message payload
 
     Returns:
-        Email body text with hyperlinks preserved
+        Selected part or None if the message has no inline text body
+    """
+    plain_part = None
+    for part in _iter_mime_leaves(payload):
+        if part.get("filename") or "data" not in part.get("body", {}):
+            continue
+        mime_type = part.get("mimeType", "").lower()
+        if mime_type == "text/html":
+            return part
+        if mime_type == "text/plain" and plain_part is None:
+            plain_part = part
+    return plain_part
+
+
+def _part_charset(part: Dict) -> str:
     """
-    body = ""
+    Read the charset from a part's Content-Type header.
 
-    # Check for body data in payload
-    if "body" in payload and "data" in payload["body"]:
-        body = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
+    Args:
+        part: Gmail message part
 
-    # Check for multipart message (parts array)
-    elif "parts" in payload:
-        for part in payload["parts"]:
-            mime_type = part.get("mimeType", "")
+    Returns:
+        Charset name (defaults to utf-8)
+    """
+    for header in part.get("headers", []):
+        if header.get("name", "").lower() == "content-type":
+            match = re.search(r'charset="?([^";\s]+)', header.get("value", ""), re.IGNORECASE)
+            if match:
+                return match.group(1)
+    return "utf-8"
 
-            # Prefer HTML for hyperlink preservation
-            if mime_type == "text/html" and "data" in part["body"]:
-                html_body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-                body = _html_to_text_with_links(html_body)
-                break
 
-            # Fallback to plain text
-            elif mime_type == "text/plain" and "data" in part["body"]:
-                body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
+def _decode_part(part: Dict) -> str:
+    """
+    Decode a part's base64url body, tolerating bad bytes and unknown charsets.
 
-    return body.strip()
+    Args:
+        part: Gmail message part with body.data
 
+    Returns:
+        Decoded text (invalid bytes replaced with U+FFFD)
+    """
+    data = part["body"]["data"]
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    try:
+        return raw.decode(_part_charset(part), errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
 
-def _html_to_text_with_links(html: str) -> str:
+
+def _extract_body_with_links(payload: Dict) -> str:
     """
-    Convert HTML to plain text while preserving hyperlinks.
-    Extracts <a> tags and formats as "text (url)".
+    Extract email body and preserve hyperlinks.
+    Walks nested multiparts (e.g. multipart/alternative inside
+    multipart/mixed), selects the HTML part if there is one and decodes
+    only that part.
 
     Args:
-        html: HTML content string
+        payload: Gmail message payload
 
     Returns:
-        Plain text with URLs preserved
+        Email body text with hyperlinks preserved
     """
-    # Extract links using regex: <a href="url">text</a>
-    link_pattern = re.compile(r'<a[^>]+href=["\'](.*?)["\'][^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+    part = _select_body_part(payload)
+    if part is None:
+        return ""
 
-    # Replace links with "text (url)" format
-    def replace_link(match):
-        url = match.group(1)
-        text = re.sub(r'<.*?>', '', match.group(2)).strip()  # Strip HTML tags from link text
-        return f"{text} ({url})" if text else url
+    body = _decode_part(part)
 
-    text = link_pattern.sub(replace_link, html)
+    # Prefer HTML for hyperlink preservation
+    if part.get("mimeType", "").lower() == "text/html":
+        body = _html_to_text_with_links(body)
 
-    # Remove remaining HTML tags using regex
-    text = re.sub(r'<.*?>', '', text)
+    return body.strip()
 
-    # Clean up whitespace
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'\n\s*\n', '\n\n', text)
 
-    return text.strip()
+def _link_start_marker(attributes: str) -> str:
+    """
+    Build the link start marker for an <a> tag.
 
+    Args:
+        attributes: Raw attribute text of the tag
 
-def strip_metadata_with_llm(email_text: str, task_id: Optional[str] = None) -> str:
+    Returns:
+        Link start + url + url end markers, "" if the tag has no href
     """
-    Strip email metadata using LLM.
-    Removes signatures, headers, timestamps, and other non-content elements.
+    href = _HREF_RE.search(attributes)
+    if not href:
+        return ""
+    url = next(group for group in href.groups() if group is not None)
+    return f"{_MARK_LINK}{url.strip()}{_MARK_HREF_END}"
+
+
+def _render_link(match: re.Match) -> str:
+    """Render a link marker span as "text (url)" (or just the url)."""
+    url = match.group(1)
+    text = " ".join(match.group(2).translate(_INLINE_MARKERS).split())
+    if not url:
+        return text
+    return f"{text} ({url})" if text and text != url else url
+
+
+def _html_to_text_with_links(html: str) -> str:
+    """
+    Convert HTML to plain text while preserving hyperlinks.
+    Extracts <a> tags and formats as "text (url)"; block-level tags become
+    line breaks so paragraph structure survives, entities are decoded and
+    script/style content is dropped.
 
     Args:
-        email_text: Combined email text to clean
-        task_id: Optional task ID for logging
+        html: HTML content string
 
     Returns:
-        Cleaned email text with only message bodies
+        Plain text with URLs preserved
     """
-    log_prefix = f"[{task_id}]" if task_id else ""
+    # Tags → markers in a single pass (stray marker characters removed first).
+    # split() keeps the text between tags; a plain loop over the tags is much
+    # cheaper than a sub() callback per tag
+    parts = _HTML_TOKEN_RE.split(html.translate(_STRIP_MARKERS))
+    pieces = [parts[0]]
+    for i in range(1, len(parts), 5):
+        tag = parts[i + 2]
+        if tag is not None:  # None: comment or script/style/head block
+            tag = tag.lower()
+            if parts[i + 1]:
+                pieces.append(_CLOSE_TAG_MARKERS.get(tag, ""))
+            elif tag == "a":
+                pieces.append(_link_start_marker(parts[i + 3]))
+            else:
+                pieces.append(_OPEN_TAG_MARKERS.get(tag, ""))
+        pieces.append(parts[i + 4])
+    text = "".join(pieces)
+
+    if "&" in text:
+        text = unescape(text)
+    text = " ".join(text.split())  # Markers are not whitespace, so they survive
+
+    # Links → "text (url)"; drop unmatched link-end markers
+    if _MARK_LINK in text:
+        text = _LINK_RE.sub(_render_link, text)
+    text = text.replace(_MARK_LINK_END, "")
+
+    # Trim spaces around breaks, then render break markers as newlines
+    for marker in (_MARK_PARA, _MARK_LINE, _MARK_BR):
+        text = text.replace(f" {marker}", marker).replace(f"{marker} ", marker)
+    text = _DOUBLE_BR_RE.sub(_MARK_PARA, text)  # <br><br> reads as a paragraph break
+    text = _PARAGRAPH_RUN_RE.sub("\n\n", text)
+    text = _LINE_RUN_RE.sub("\n", text)
+    return text.strip()
 
-    logger.debug(f"{log_prefix} Stripping metadata using LLM ({len(email_text)} chars)")
 
-    # System prompt for metadata stripping
-    system_prompt = """You are an email cleaning assistant. Your job is to remove email metadata and keep only the actual message content.
+# System prompt for metadata stripping (LLM Call #1)
+_STRIP_SYSTEM_PROMPT = """You are an email cleaning assistant. Your job is to remove email metadata and keep only the actual message content.
 
 **CRITICAL: PRESERVE Thread Separators**
 ALWAYS KEEP separators that look like "--- Message X of Y ---" or similar. These indicate multi-message threads and MUST be preserved!
@@ -483,12 +1479,39 @@ Keep the following:
 
 Return ONLY the cleaned message content WITH all thread separators preserved."""
 
+
+# Per-message strip results are cached under a key built from this version, the
+# body format, the strip model and the message body - a change to any of them
+# invalidates them
+_STRIP_PROMPT_VERSION = hashlib.sha256(_STRIP_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+# Message boundaries in per-message strip calls (the LLM is asked to keep them)
+_STRIP_MARKER = "<<<MESSAGE {}>>>"
+_STRIP_MARKER_RE = re.compile(r"^[ \t]*<<<MESSAGE ([^>\s]+)>>>[ \t]*$", re.MULTILINE)
+
+
+def strip_metadata_with_llm(email_text: str, task_id: Optional[str] = None) -> str:
+    """
+    Strip email metadata using LLM.
+    Removes signatures, headers, timestamps, and other non-content elements.
+
+    Args:
+        email_text: Combined email text to clean
+        task_id: Optional task ID for logging
+
+    Returns:
+        Cleaned email text with only message bodies
+    """
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    logger.debug(f"{log_prefix} Stripping metadata using LLM ({len(email_text)} chars)")
+
     user_prompt = f"Clean the following email content:\n\n{email_text}"
 
     try:
         # Call LLM to strip metadata
         cleaned_text = llm_service.analyze_with_llm(
-            system_prompt=system_prompt,
+            system_prompt=_STRIP_SYSTEM_PROMPT,
             user_prompt=user_prompt,
             task_id=task_id
         )
@@ -504,6 +1527,521 @@ Return ONLY the cleaned message content WITH all thread separators preserved."""
         return email_text
 
 
+async def strip_metadata_with_llm_async(email_text: str, task_id: Optional[str] = None) -> str:
+    """
+    Async variant of strip_metadata_with_llm (runs on the event loop).
+
+    Args:
+        email_text: Combined email text to clean
+        task_id: Optional task ID for logging
+
+    Returns:
+        Cleaned email text with only message bodies
+    """
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    logger.debug(f"{log_prefix} Stripping metadata using LLM ({len(email_text)} chars)")
+
+    user_prompt = f"Clean the following email content:\n\n{email_text}"
+
+    try:
+        cleaned_text = await llm_service.analyze_with_llm_async(
+            system_prompt=_STRIP_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            task_id=task_id
+        )
+
+        logger.debug(f"{log_prefix} Metadata stripped: {len(email_text)} → {len(cleaned_text)} chars")
+
+        return cleaned_text
+
+    except Exception as e:
+        logger.error(f"{log_prefix} Metadata stripping failed: {str(e)}")
+        # Return original text if stripping fails
+        logger.warning(f"{log_prefix} Using original text (metadata stripping failed)")
+        return email_text
+
+
+def strip_messages(
+    emails: List[Dict[str, Any]],
+    task_id: Optional[str] = None,
+    combined_text: Optional[str] = None,
+    stripper: str = "llm"
+) -> str:
+    """
+    Strip metadata for a batch of messages (LLM Call #1).
+
+    STRIP_MODE "batch" (default) cleans the combined batch text in one call.
+    STRIP_MODE "per_message" reuses cleaned text stored per message (see _strip_keys), sends
+    only the uncached messages to the LLM (grouped into calls of up to
+    STRIP_MAX_CHARS) and reassembles the batch with "--- Message X of Y ---"
+    separators - so shifted batch boundaries on a rerun still hit the cache.
+
+    stripper "rules" cleans the combined text with strip_metadata_with_rules
+    instead and only falls back to the LLM if the rules fail their checks.
+
+    Args:
+        emails: Individual message dictionaries in the batch
+        task_id: Optional task ID for logging
+        combined_text: combine_emails(emails) if the caller already built it
+        stripper: "llm" or "rules" (sender's metadata_stripper setting)
+
+    Returns:
+        Cleaned batch text
+    """
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    if stripper == "rules":
+        combined_text = combined_text or combine_emails(emails)
+        cleaned_text = _strip_with_rules_checked(combined_text, log_prefix)
+        if cleaned_text is not None:
+            return cleaned_text
+
+    if STRIP_MODE != "per_message":
+        return strip_metadata_with_llm(combined_text or combine_emails(emails), task_id)
+
+    cleaned, chunks = _plan_message_strip(emails, log_prefix)
+
+    for chunk in chunks:
+        try:
+            response = llm_service.analyze_with_llm(
+                system_prompt=_STRIP_SYSTEM_PROMPT,
+                user_prompt=_strip_chunk_prompt(chunk),
+                task_id=task_id
+            )
+        except Exception as e:
+            logger.error(f"{log_prefix} Metadata stripping failed: {str(e)}")
+            response = ""
+        cleaned.update(_split_stripped_chunk(chunk, response, log_prefix))
+
+    return _assemble_stripped(emails, cleaned)
+
+
+async def strip_messages_async(
+    emails: List[Dict[str, Any]],
+    task_id: Optional[str] = None,
+    combined_text: Optional[str] = None,
+    stripper: str = "llm"
+) -> str:
+    """
+    Async variant of strip_messages (per-message LLM calls run concurrently).
+
+    Args:
+        emails: Individual message dictionaries in the batch
+        task_id: Optional task ID for logging
+        combined_text: combine_emails(emails) if the caller already built it
+        stripper: "llm" or "rules" (sender's metadata_stripper setting)
+
+    Returns:
+        Cleaned batch text
+    """
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    if stripper == "rules":
+        combined_text = combined_text or combine_emails(emails)
+        cleaned_text = _strip_with_rules_checked(combined_text, log_prefix)
+        if cleaned_text is not None:
+            return cleaned_text
+
+    if STRIP_MODE != "per_message":
+        return await strip_metadata_with_llm_async(combined_text or combine_emails(emails), task_id)
+
+    # Strip cache is SQLite - read/write it from a worker thread, not the event loop
+    cleaned, chunks = await asyncio.to_thread(_plan_message_strip, emails, log_prefix)
+
+    async def strip_chunk(chunk: List[Dict[str, Any]]) -> Dict[str, str]:
+        try:
+            response = await llm_service.analyze_with_llm_async(
+                system_prompt=_STRIP_SYSTEM_PROMPT,
+                user_prompt=_strip_chunk_prompt(chunk),
+                task_id=task_id
+            )
+        except Exception as e:
+            logger.error(f"{log_prefix} Metadata stripping failed: {str(e)}")
+            response = ""
+        return await asyncio.to_thread(_split_stripped_chunk, chunk, response, log_prefix)
+
+    for chunk_cleaned in await asyncio.gather(*(strip_chunk(chunk) for chunk in chunks)):
+        cleaned.update(chunk_cleaned)
+
+    return _assemble_stripped(emails, cleaned)
+
+
+def _plan_message_strip(
+    emails: List[Dict[str, Any]],
+    log_prefix: str = ""
+) -> Tuple[Dict[str, str], List[List[Dict[str, Any]]]]:
+    """
+    Split a batch into cached cleaned text and chunks still to be stripped.
+
+    Args:
+        emails: Individual message dictionaries in the batch
+        log_prefix: Task log prefix
+
+    Returns:
+        Tuple of ({message_id: cleaned text} from the store, chunks of uncached messages)
+    """
+    try:
+        cleaned = message_store.get_stripped(_strip_keys(emails))
+    except Exception as e:
+        logger.warning(f"{log_prefix} [STRIP] ⚠ Strip cache lookup failed: {str(e)}")
+        cleaned = {}
+
+    chunks: List[List[Dict[str, Any]]] = []
+    chunk: List[Dict[str, Any]] = []
+    chunk_chars = 0
+    seen = set(cleaned)
+    for msg in emails:
+        message_id = msg.get("message_id")
+        if not message_id or message_id in seen:
+            continue
+        seen.add(message_id)
+
+        size = len(msg.get("body", ""))
+        if chunk and chunk_chars + size > STRIP_MAX_CHARS:
+            chunks.append(chunk)
+            chunk, chunk_chars = [], 0
+        chunk.append(msg)
+        chunk_chars += size
+    if chunk:
+        chunks.append(chunk)
+
+    uncached = sum(len(c) for c in chunks)
+    logger.info(
+        f"{log_prefix} [STRIP] {len(emails) - uncached}/{len(emails)} messages cached, "
+        f"{uncached} to strip in {len(chunks)} LLM call(s)"
+    )
+    return cleaned, chunks
+
+
+def _strip_keys(emails: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Build the strip cache key of each message: strip prompt version, body
+    format version, strip model and a hash of the body the text is cleaned from.
+
+    Args:
+        emails: Individual message dictionaries
+
+    Returns:
+        Dictionary {message_id: strip key} (messages without an id are skipped)
+    """
+    prefix = f"{_STRIP_PROMPT_VERSION}\0{BODY_FORMAT_VERSION}\0{llm_service.get_primary_model()}\0"
+    return {
+        msg["message_id"]: hashlib.sha256((prefix + msg.get("body", "")).encode("utf-8")).hexdigest()
+        for msg in emails
+        if msg.get("message_id")
+    }
+
+
+def _strip_chunk_prompt(chunk: List[Dict[str, Any]]) -> str:
+    """
+    Build the user prompt for stripping several messages in one call.
+
+    Args:
+        chunk: Messages to strip
+
+    Returns:
+        User prompt with each message preceded by its marker line
+    """
+    parts = [
+        "Clean each of the following emails separately. Each email starts with a marker line "
+        "like <<<MESSAGE id>>>. Copy every marker line unchanged, in the same order, "
+        "followed by that email's cleaned content.\n"
+    ]
+    for msg in chunk:
+        parts.append(_STRIP_MARKER.format(msg["message_id"]))
+        parts.append(f"{msg.get('body', '')}\n")
+    return "\n".join(parts)
+
+
+def _split_stripped_chunk(chunk: List[Dict[str, Any]], response: str, log_prefix: str = "") -> Dict[str, str]:
+    """
+    Split a per-message strip response on its marker lines and cache the parts.
+    Messages whose marker is missing fall back to their original body (not cached).
+
+    Args:
+        chunk: Messages sent in the call
+        response: LLM response ("" if the call failed)
+        log_prefix: Task log prefix
+
+    Returns:
+        Dictionary {message_id: cleaned text} for every message in the chunk
+    """
+    expected = {msg["message_id"] for msg in chunk}
+    pieces = _STRIP_MARKER_RE.split(response)
+
+    # split() gives [preamble, id1, text1, id2, text2, ...]
+    stripped = {
+        message_id: text.strip()
+        for message_id, text in zip(pieces[1::2], pieces[2::2])
+        if message_id in expected
+    }
+
+    if stripped:
+        try:
+            message_store.save_stripped(stripped, _strip_keys(chunk))
+        except Exception as e:
+            logger.warning(f"{log_prefix} [STRIP] ⚠ Strip cache write failed: {str(e)}")
+
+    missing = [msg for msg in chunk if msg["message_id"] not in stripped]
+    if missing:
+        logger.warning(f"{log_prefix} [STRIP] ⚠ {len(missing)} message(s) not returned by LLM - using original text")
+
+    result = dict(stripped)
+    for msg in missing:
+        result[msg["message_id"]] = msg.get("body", "").strip()
+    return result
+
+
+def _assemble_stripped(emails: List[Dict[str, Any]], cleaned: Dict[str, str]) -> str:
+    """
+    Reassemble per-message cleaned text into batch text.
+
+    Args:
+        emails: Individual message dictionaries in batch order
+        cleaned: Dictionary {message_id: cleaned text}
+
+    Returns:
+        Batch text with "--- Message X of Y ---" separators, each followed by
+        the thread context lines combine_emails emits
+    """
+    total = len(emails)
+    parts = []
+    for i, msg in enumerate(emails, 1):
+        lines = [f"--- Message {i} of {total} ---"]
+        if "thread_id" in msg:
+            lines.append(f"Thread Context: Message {msg.get('message_number', 1)} of {msg.get('total_in_thread', 1)}")
+        if "message_count" in msg:
+            lines.append(f"Messages in thread: {msg['message_count']}")
+        lines.append(cleaned.get(msg.get("message_id"), msg.get("body", "").strip()))
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
+
+
+# Rule-based metadata stripping (alternative to LLM Call #1, selected per sender
+# with "metadata_stripper": "rules" in config/senders.json)
+
+# Lines that start a message block - always kept verbatim
+_RULES_BLOCK_START_RE = re.compile(r"^(?:=== MESSAGE \d+ ===|--- Message \d+ of \d+ ---)\s*$")
+
+# Lines inside the block header that are always kept verbatim
+_RULES_KEEP_RE = re.compile(r"^(?:Subject:|Thread Context: Message \d+ of \d+|Messages in thread:)")
+
+# Header lines dropped from the top of a block
+_RULES_HEADER_RE = re.compile(
+    r"^(?:From|To|Cc|Bcc|Date|Sent|Reply-To|Return-Path|Received|Message-ID|In-Reply-To|References|"
+    r"MIME-Version|Content-Type|Content-Transfer-Encoding|X-[\w-]+):",
+    re.IGNORECASE
+)
+
+# Start of quoted earlier messages - everything from here to the block end is dropped
+_RULES_REPLY_CUT_RE = re.compile(
+    r"^(?:On .{4,200} wrote:|-{2,}\s*Original Message\s*-{2,})\s*$",
+    re.IGNORECASE
+)
+# Outlook reply separator: a rule of underscores directly followed by "From:"
+# (a rule on its own is an item divider in digests and newsletters)
+_RULES_OUTLOOK_RULE_RE = re.compile(r"^_{10,}$")
+_RULES_FROM_RE = re.compile(r"^From:", re.IGNORECASE)
+_RULES_REPLY_INTRO_RE = re.compile(r"^On .{4,200}$")
+_RULES_WROTE_RE = re.compile(r"^.{0,200}\bwrote:\s*$", re.IGNORECASE)
+
+# Signature delimiter ("-- ") - everything after it is the signature
+_RULES_SIGNATURE_RE = re.compile(r"^--\s?$")
+
+# Sign-off line; cut only when followed by a few short lines (name, title, phone)
+_RULES_SIGNOFF_RE = re.compile(
+    r"^(?:best|best regards|kind regards|warm regards|regards|cheers|thanks|many thanks|"
+    r"thank you|sincerely|yours truly|all the best)[,.!]?$",
+    re.IGNORECASE
+)
+_RULES_SIGNOFF_MAX_LINES = 4
+_RULES_SIGNOFF_MAX_LINE_CHARS = 60
+
+# Single lines dropped wherever they appear
+_RULES_DROP_LINE_RE = re.compile(
+    r"^(?:Sent from my |Sent from Mail for |Get Outlook for |Sent via )|"
+    r"^(?:View|Read) (?:this (?:email|message) )?(?:in|on) (?:your |a |the )?(?:browser|web)",
+    re.IGNORECASE
+)
+
+# Footer / unsubscribe text. A footer tail is cut only when it starts with one of
+# these lines near the block end and every line from there on is short.
+_RULES_FOOTER_RE = re.compile(
+    r"unsubscribe|you(?:'re| are) receiving this|to stop receiving|manage (?:your )?(?:email )?"
+    r"(?:preferences|subscriptions?|notifications)|update your (?:email )?preferences",
+    re.IGNORECASE
+)
+
+# Legal boilerplate - too common in content to cut on; only short lines of it at
+# the very end of a block are dropped
+_RULES_LEGAL_LINE_RE = re.compile(r"privacy policy|all rights reserved|©|\(c\) \d{4}", re.IGNORECASE)
+_RULES_FOOTER_TAIL_LINES = 8
+_RULES_FOOTER_MAX_LINE_CHARS = 120
+
+_RULES_BLANK_RUN_RE = re.compile(r"\n{3,}")
+
+
+def strip_metadata_with_rules(email_text: str) -> str:
+    """
+    Strip email metadata with deterministic rules (no LLM call).
+    Removes header lines, quoted replies, signatures, mobile sign-offs,
+    footers and unsubscribe text. "=== MESSAGE N ===", "--- Message X of Y ---",
+    Subject and "Thread Context" lines are always kept.
+
+    Args:
+        email_text: Combined email text (combine_emails output)
+
+    Returns:
+        Cleaned email text
+    """
+    blocks: List[List[str]] = [[]]
+    for line in email_text.splitlines():
+        if _RULES_BLOCK_START_RE.match(line.strip()):
+            blocks.append([line.strip()])
+        else:
+            blocks[-1].append(line.rstrip())
+
+    cleaned = []
+    for block in blocks:
+        if not block:
+            continue
+        if _RULES_BLOCK_START_RE.match(block[0]):
+            cleaned.append("\n".join([block[0]] + _clean_rules_block(block[1:])))
+        else:
+            cleaned.append("\n".join(_clean_rules_block(block)))
+
+    text = "\n\n".join(part.strip() for part in cleaned if part.strip())
+    return _RULES_BLANK_RUN_RE.sub("\n\n", text).strip()
+
+
+def _clean_rules_block(lines: List[str]) -> List[str]:
+    """
+    Clean the lines of one message block (everything after its start line).
+
+    Args:
+        lines: Block lines
+
+    Returns:
+        Cleaned lines (header lines kept by _RULES_KEEP_RE first)
+    """
+    # Header region: leading header/keep lines up to the first other line
+    kept_header = []
+    start = 0
+    while start < len(lines):
+        line = lines[start].strip()
+        if _RULES_KEEP_RE.match(line):
+            kept_header.append(line)
+        elif line and not _RULES_HEADER_RE.match(line):
+            break
+        start += 1
+
+    body = []
+    for i in range(start, len(lines)):
+        line = lines[i].strip()
+        if _RULES_SIGNATURE_RE.match(lines[i]) or _RULES_REPLY_CUT_RE.match(line):
+            break
+        if (
+            _RULES_OUTLOOK_RULE_RE.match(line) and i + 1 < len(lines)
+            and _RULES_FROM_RE.match(lines[i + 1].strip())
+        ):
+            break
+        # "On <date>, <name> <addr>" wrapped onto a second "wrote:" line
+        if (
+            _RULES_REPLY_INTRO_RE.match(line) and i + 1 < len(lines)
+            and _RULES_WROTE_RE.match(lines[i + 1].strip()) and not line.endswith((".", "?", "!"))
+        ):
+            break
+        if line.startswith(">") or _RULES_DROP_LINE_RE.match(line):
+            continue
+        body.append(line)
+
+    body = _cut_signoff(body)
+    body = _cut_footer(body)
+    return kept_header + [""] + body if kept_header else body
+
+
+def _cut_signoff(body: List[str]) -> List[str]:
+    """Cut a trailing "Best regards,\\nName\\nTitle" style signature."""
+    content = [i for i, line in enumerate(body) if line]
+    for position in range(max(0, len(content) - _RULES_SIGNOFF_MAX_LINES - 1), len(content)):
+        index = content[position]
+        if not _RULES_SIGNOFF_RE.match(body[index]):
+            continue
+        tail = [body[i] for i in content[position + 1:]]
+        if all(len(line) <= _RULES_SIGNOFF_MAX_LINE_CHARS for line in tail):
+            return body[:index]
+    return body
+
+
+def _cut_footer(body: List[str]) -> List[str]:
+    """
+    Cut a footer tail: the first unsubscribe/preferences line among the last few
+    lines, provided it and everything after it are short. Short legal lines
+    (copyright, privacy policy) left at the very end are dropped too.
+    """
+    content = [i for i, line in enumerate(body) if line]
+    tail_start = content[-_RULES_FOOTER_TAIL_LINES] if len(content) >= _RULES_FOOTER_TAIL_LINES else 0
+
+    for i in range(tail_start, len(body)):
+        if not _RULES_FOOTER_RE.search(body[i]):
+            continue
+        if all(len(line) <= _RULES_FOOTER_MAX_LINE_CHARS for line in body[i:]):
+            body = body[:i]
+            break
+
+    end = len(body)
+    while end and (
+        not body[end - 1]
+        or (len(body[end - 1]) <= _RULES_FOOTER_MAX_LINE_CHARS and _RULES_LEGAL_LINE_RE.search(body[end - 1]))
+    ):
+        end -= 1
+    return body[:end]
+
+
+def _strip_with_rules_checked(email_text: str, log_prefix: str = "") -> Optional[str]:
+    """
+    Run strip_metadata_with_rules and sanity-check the result.
+
+    Args:
+        email_text: Combined email text
+        log_prefix: Task log prefix
+
+    Returns:
+        Cleaned text, or None if the rules failed and the LLM should be used
+    """
+    try:
+        start = time.perf_counter()
+        cleaned = strip_metadata_with_rules(email_text)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        logger.warning(f"{log_prefix} [STRIP] ⚠ Rule-based strip failed: {str(e)} - falling back to LLM")
+        return None
+
+    def separators(text: str) -> List[str]:
+        return [line.strip() for line in text.splitlines() if _RULES_BLOCK_START_RE.match(line.strip())]
+
+    def empty_blocks(text: str) -> int:
+        blocks = re.split(r"^(?:=== MESSAGE \d+ ===|--- Message \d+ of \d+ ---)\s*$", text, flags=re.MULTILINE)
+        return sum(
+            1 for block in blocks[1:]
+            if not [l for l in block.splitlines() if l.strip() and not _RULES_KEEP_RE.match(l.strip())]
+        )
+
+    if separators(cleaned) != separators(email_text):
+        logger.warning(f"{log_prefix} [STRIP] ⚠ Rule-based strip lost message separators - falling back to LLM")
+        return None
+    if empty_blocks(cleaned) > empty_blocks(email_text):
+        logger.warning(f"{log_prefix} [STRIP] ⚠ Rule-based strip emptied a message - falling back to LLM")
+        return None
+
+    logger.info(
+        f"{log_prefix} [STRIP] ✓ Rule-based strip: {len(email_text)} → {len(cleaned)} chars "
+        f"in {elapsed_ms:.1f}ms"
+    )
+    return cleaned
+
+
 def combine_emails(emails: List[Dict[str, str]]) -> str:
     """
     Combine multiple individual messages into single text block for LLM analysis.
@@ -0,0 +1,271 @@
+"""
+Content-addressed cache of LLM completions.
+Two tiers: an in-memory LRU in front of a SQLite file, both with TTL and
+size-based eviction. Keys are a hash of provider, model, prompts and call
+parameters, so identical calls (e.g. re-running an overlapping batch)
+return instantly without an API call.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Configure logging for cache operations
+logger = logging.getLogger(__name__)
+
+# Master switch
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+# SQLite file location (relative paths resolve against the backend directory)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db")
+
+# Entries older than this are treated as missing and evicted (seconds, default 7 days)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Size limits per tier (least recently used entries are evicted first)
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# SQLite eviction runs once every this many writes (the table may exceed
+# LLM_CACHE_MAX_ENTRIES by up to this many rows in between)
+_EVICT_EVERY_WRITES = 100
+
+# Memory tier: {key: (created_at, value)} in LRU order (most recent last)
+_memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+# Serialize memory tier updates, counters and one-time schema creation across
+# worker threads (SQLite I/O runs outside it - SQLite serializes its own writers)
+_lock = threading.RLock()
+_initialized = False
+
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "writes": 0,
+    "evictions": 0,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    cache_key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions (last_used_at);
+"""
+
+
+def _get_cache_path() -> Path:
+    """
+    Resolve the SQLite file path from LLM_CACHE_PATH.
+
+    Returns:
+        Absolute path to the cache file
+    """
+    path = Path(LLM_CACHE_PATH)
+    if not path.is_absolute():
+        path = Path(__file__).parent / path
+    return path
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """
+    Open a short-lived connection, creating the schema on first use.
+
+    Yields:
+        SQLite connection (committed on successful exit)
+    """
+    global _initialized
+
+    path = _get_cache_path()
+    if not _initialized:
+        with _lock:
+            if not _initialized:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with sqlite3.connect(path) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                _initialized = True
+                logger.info(f"[CACHE] LLM cache ready at {path}")
+
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def make_key(provider: str, model: str, system_prompt: str, user_prompt: str, **params: Any) -> str:
+    """
+    Build the content-addressed key for an LLM call.
+
+    Args:
+        provider: LLM provider (e.g., "openai", "groq")
+        model: Model name
+        system_prompt: System prompt
+        user_prompt: User prompt
+        **params: Other parameters that change the output (e.g., response_format)
+
+    Returns:
+        SHA-256 hex digest
+    """
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "params": params,
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """
+    Look up a cached completion (memory first, then SQLite).
+
+    Args:
+        key: Key from make_key
+
+    Returns:
+        Cached completion text or None on a miss/expired entry
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    now = time.time()
+
+    with _lock:
+        entry = _memory.get(key)
+        if entry and now - entry[0] < LLM_CACHE_TTL:
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return entry[1]
+        if entry:
+            del _memory[key]  # Expired
+
+    try:
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM completions WHERE cache_key = ? AND created_at > ?",
+                (key, now - LLM_CACHE_TTL)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE completions SET last_used_at = ? WHERE cache_key = ?", (now, key))
+    except sqlite3.Error as e:
+        logger.warning(f"[CACHE] ⚠ Disk lookup failed: {str(e)}")
+        row = None
+
+    with _lock:
+        if row:
+            _stats["disk_hits"] += 1
+            _remember(key, row[1], row[0])
+            return row[0]
+        _stats["misses"] += 1
+    return None
+
+
+def put(key: str, value: str) -> None:
+    """
+    Store a completion in both tiers. The memory tier is trimmed on every
+    write, the SQLite tier every _EVICT_EVERY_WRITES writes (see _evict).
+
+    Args:
+        key: Key from make_key
+        value: Completion text
+    """
+    if not LLM_CACHE_ENABLED:
+        return
+
+    now = time.time()
+
+    with _lock:
+        _remember(key, now, value)
+        _stats["writes"] += 1
+        evict = _stats["writes"] % _EVICT_EVERY_WRITES == 0
+
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (cache_key, value, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            evicted = _evict(conn, now) if evict else 0
+    except sqlite3.Error as e:
+        logger.warning(f"[CACHE] ⚠ Disk write failed: {str(e)}")
+        return
+
+    if evicted:
+        with _lock:
+            _stats["evictions"] += evicted
+
+
+def _evict(conn: sqlite3.Connection, now: float) -> int:
+    """
+    Delete expired entries, then the least recently used ones beyond LLM_CACHE_MAX_ENTRIES.
+
+    Args:
+        conn: Open cache connection
+        now: Current time (epoch seconds)
+
+    Returns:
+        Number of rows deleted
+    """
+    evicted = conn.execute("DELETE FROM completions WHERE created_at <= ?", (now - LLM_CACHE_TTL,)).rowcount
+    excess = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - LLM_CACHE_MAX_ENTRIES
+    if excess > 0:
+        evicted += conn.execute(
+            "DELETE FROM completions WHERE cache_key IN "
+            "(SELECT cache_key FROM completions ORDER BY last_used_at ASC LIMIT ?)",
+            (excess,)
+        ).rowcount
+    return evicted
+
+
+def _remember(key: str, created_at: float, value: str) -> None:
+    """Insert into the memory tier and trim it to LLM_CACHE_MEMORY_ENTRIES (caller holds _lock)."""
+    _memory[key] = (created_at, value)
+    _memory.move_to_end(key)
+    while len(_memory) > LLM_CACHE_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def get_stats() -> Dict[str, Any]:
+    """
+    Get hit/miss counters since startup.
+
+    Returns:
+        Dictionary with counters, hit rate and memory tier size
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory)
+
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+    stats["enabled"] = LLM_CACHE_ENABLED
+    return stats
+
+
+def clear() -> None:
+    """Delete all cached completions from both tiers."""
+    with _lock, _connect() as conn:
+        _memory.clear()
+        conn.execute("DELETE FROM completions")
+    logger.info("[CACHE] Cleared LLM cache")
@@ -3,11 +3,29 @@ LLM service with switchable providers (OpenAI/GROQ).
 Handles LLM API calls with 180-second timeout and detailed logging.
 """
 
+import asyncio
+import collections
+import concurrent.futures
+import email.utils  # HTTP-date Retry-After values
+import hashlib
+import json
 import logging
 import os
-from typing import Dict, Optional
-from openai import OpenAI
-from groq import Groq
+import random
+import re
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import httpx
+import groq
+import openai
+from openai import AsyncOpenAI, OpenAI, BadRequestError as OpenAIBadRequestError
+from groq import AsyncGroq, Groq, BadRequestError as GroqBadRequestError
+
+import llm_cache
+import markdown_parser
 
 # Configure logging for LLM operations
 logger = logging.getLogger(__name__)
@@ -15,18 +33,180 @@ logger = logging.getLogger(__name__)
 # LLM timeout in seconds from env or default
 LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "180"))
 
+# Timeout for the markdown → JSON parsing call (LLM Call #3)
+PARSE_TIMEOUT = 30
+
+# Markdown → JSON parsing mode: "local" parses with markdown_parser and only
+# calls the LLM for output that doesn't validate; "llm" always calls the LLM
+PARSE_MODE = os.getenv("PARSE_MODE", "local").lower()
+
+# Streaming for analysis calls that report partial output (analyze_with_llm's
+# on_partial): token deltas are forwarded as they arrive, and a stream that
+# produces nothing for LLM_STREAM_TTFT_TIMEOUT seconds - before the first token
+# or between tokens - is aborted and retried instead of waiting out LLM_TIMEOUT
+LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+LLM_STREAM_TTFT_TIMEOUT = float(os.getenv("LLM_STREAM_TTFT_TIMEOUT", "30"))
+
+# Minimum seconds between partial output updates while streaming
+_STREAM_PARTIAL_INTERVAL = 1.0
+
+# Capability table: which provider/model combinations support JSON mode,
+# json_schema structured output and streaming. Learned from the first request
+# that uses a feature and persisted, so a rejected feature is never sent again
+LLM_CAPABILITIES_PATH = os.getenv("LLM_CAPABILITIES_PATH", "data/llm_capabilities.json")
+
+# Token usage per call (prompt, cached prompt and completion tokens), totalled
+# since startup and per task. Cached tokens come from provider-side prompt
+# caching of the static system prompt prefix (see _cache_params)
+_usage_lock = threading.Lock()
+_usage_totals: Dict[str, int] = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+_task_usage: Dict[str, Dict[str, int]] = {}
+
+# Connection pool limits for the shared LLM HTTP clients
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# Retries for transient errors (429, 5xx, timeouts, connection errors): up to
+# LLM_MAX_RETRIES retries with full-jitter exponential backoff (or the server's
+# Retry-After), all within LLM_RETRY_DEADLINE seconds per call. The SDKs' own
+# retries are disabled so every retry is counted here.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+LLM_RETRY_DEADLINE = float(os.getenv("LLM_RETRY_DEADLINE", "300"))
+
+# Status codes worth retrying besides 429 and 5xx
+_RETRYABLE_STATUSES = {408, 409}
+
+# Don't start an attempt with less time than this left in the deadline
+_MIN_ATTEMPT_SECONDS = 5.0
+
+# Process-wide rate limits per provider (requests and tokens per minute, 0 =
+# unlimited), shared by every task. Groq's token limits differ per model, so
+# set them per model in LLM_RATE_LIMITS, a JSON object keyed by "provider" or
+# "provider:model", e.g. {"groq:llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000}}
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+
+# Output tokens counted against the tokens/min budget per request (providers
+# count the completion too, which isn't known until the response arrives)
+_RATE_OUTPUT_TOKENS = 1000
+
+# Token buckets: {(provider, model): {"rpm", "tpm", "requests", "tokens", "updated", "paused_until"}}
+# Levels go negative when callers reserve ahead; each caller sleeps off its own
+# debt, so requests are admitted in the order they arrived (FIFO across tasks)
+_rate_lock = threading.Lock()
+_rate_buckets: Dict[Tuple[str, str], Dict[str, float]] = {}
+_rate_stats: Dict[str, Dict[str, Any]] = {}
+_rate_overrides: Optional[Dict[str, Dict[str, int]]] = None
+
+# Provider chain for analysis calls: LLM_PROVIDERS lists providers in order of
+# preference (default: just LLM_PROVIDER); a call falls over to the next one
+# when a provider fails after its retries. Providers without an API key are skipped.
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+
+# Circuit breaker: after LLM_BREAKER_FAILURES consecutive failed calls a provider
+# is skipped for LLM_BREAKER_COOLDOWN seconds, then gets one trial call
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+
+# Hedging: when a call runs longer than the provider's LLM_HEDGE_PERCENTILE
+# latency, the next provider in the chain is asked too and the first answer wins.
+# LLM_HEDGE_DELAY is used until LLM_HEDGE_MIN_SAMPLES latencies are recorded.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "30"))
+
+# Latency samples kept per provider for the hedge threshold
+_LATENCY_SAMPLES = 200
+
+# Provider health: {provider: {"state", "consecutive_failures", "opened_at", "trial_running",
+# "calls", "failures", "hedged_calls", "hedge_wins", "latencies"}}
+_health_lock = threading.Lock()
+_provider_health: Dict[str, Dict[str, Any]] = {}
+
+_retry_lock = threading.Lock()
+_retry_stats: Dict[str, Any] = {
+    "calls": 0,
+    "retries": 0,
+    "retries_by_reason": {},
+    "recovered_calls": 0,
+    "failed_calls": 0,
+    "retry_wait_seconds": 0.0,
+}
+
+# Token estimates: tiktoken's encoding when the package is installed, otherwise
+# characters / LLM_CHARS_PER_TOKEN (email text with URLs runs ~3.5 chars per token)
+LLM_TOKEN_ENCODING = os.getenv("LLM_TOKEN_ENCODING", "o200k_base")
+LLM_CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", "3.5"))
+
+# Lazily loaded tiktoken encoder (False = tiktoken unavailable)
+_token_encoder: Any = None
+
+# {"provider:model": {"json_mode": bool, "json_schema": bool, "streaming": bool}} (None = not loaded yet)
+_capabilities: Optional[Dict[str, Dict[str, bool]]] = None
+_capabilities_lock = threading.Lock()
+
+# (provider:model, feature) pairs probed (or being probed) by this process
+_probed: set = set()
+
+# Shared SDK clients: {(provider, timeout): (api_key, client)}
+# Reused across calls so batches keep warm TCP/TLS connections
+_clients: Dict[Tuple[str, float], Tuple[str, Any]] = {}
+
+# Async SDK clients per event loop (httpx async pools are bound to one loop):
+# {loop: {(provider, timeout): (api_key, client)}}, weakly keyed by the loop itself
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, float], Tuple[str, Any]]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+# close() tasks of replaced async clients (referenced until they finish)
+_closing_tasks: set = set()
+
+# Minimal request used to probe a feature (see _probe_capabilities)
+_PROBE_MESSAGES = [
+    {"role": "system", "content": 'Reply with the JSON object {"ok": true}.'},
+    {"role": "user", "content": "ok"}
+]
+_PROBE_SCHEMA = {"type": "object", "properties": {"ok": {"type": "boolean"}}, "required": ["ok"]}
+_PROBE_TIMEOUT = 30.0
+
+# System prompt for markdown → JSON parsing (LLM Call #3)
+_PARSE_SYSTEM_PROMPT = """You are a markdown to JSON converter. Convert the provided markdown analysis into a clean, structured JSON format.
 
-def _get_provider_config() -> Dict[str, str]:
+CRITICAL RULES:
+1. Output ONLY valid JSON - no explanations, no markdown code blocks, no extra text
+2. Do NOT wrap the JSON in ```json``` or any markdown formatting
+3. Start your response directly with { and end with }
+4. Preserve ALL information from the markdown
+5. Keep ALL hyperlinks exactly as they appear
+6. Maintain hierarchical structure from markdown
+7. Use consistent key names across all sections
+
+EXAMPLE OUTPUT FORMAT (adapt structure to match input):
+{"sections":[{"title":"SECTION 1","opportunities":[{"name":"...","link":"...","priority":"High"}]}]}"""
+
+
+def _get_provider_config(provider: Optional[str] = None) -> Dict[str, str]:
     """
     Read LLM provider configuration from environment variables.
 
+    Args:
+        provider: "openai" or "groq" (default: LLM_PROVIDER)
+
     Returns:
         Dictionary with provider, api_key, and model
 
     Raises:
         ValueError: If required environment variables are missing
     """
-    provider = os.getenv("LLM_PROVIDER", "openai").lower()
+    provider = (provider or os.getenv("LLM_PROVIDER", "openai")).lower()
 
     if provider == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
@@ -52,77 +232,410 @@ def _get_provider_config() -> Dict[str, str]:
     }
 
 
+def _get_provider_chain() -> List[Dict[str, str]]:
+    """
+    Read the ordered provider chain for analysis calls (LLM_PROVIDERS).
+
+    Returns:
+        Provider configs in order of preference (see _get_provider_config)
+
+    Raises:
+        ValueError: If no provider in the chain is configured
+    """
+    names = [p.strip() for p in LLM_PROVIDERS.split(",") if p.strip()] or [None]
+
+    chain = []
+    first_error = None
+    for name in names:
+        try:
+            config = _get_provider_config(name)
+        except ValueError as e:
+            first_error = first_error or e
+            logger.debug(f"Skipping provider {name}: {str(e)}")
+            continue
+        if config["provider"] not in (c["provider"] for c in chain):
+            chain.append(config)
+
+    if not chain:
+        raise first_error
+    return chain
+
+
+def get_primary_model() -> str:
+    """
+    Identify the provider/model analysis calls go to first.
+
+    Returns:
+        "provider:model" of the first configured provider in the chain
+    """
+    config = _get_provider_chain()[0]
+    return f"{config['provider']}:{config['model']}"
+
+
+def _get_cached_response(
+    chain: List[Dict[str, str]],
+    system_prompt: str,
+    user_prompt: str,
+    cache_params: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Look up a cached analysis response from any provider in the chain.
+
+    Args:
+        chain: Provider configs (see _get_provider_chain)
+        system_prompt: System instructions for LLM
+        user_prompt: User query/content to analyze
+        cache_params: Extra request parameters that are part of the cache key
+
+    Returns:
+        Cached response text, or None if no provider has answered this call
+    """
+    for config in chain:
+        cached = llm_cache.get(llm_cache.make_key(config["provider"], config["model"], system_prompt, user_prompt, **cache_params))
+        if cached is not None:
+            return cached
+    return None
+
+
+def _get_client(provider: str, api_key: str, timeout: float, use_async: bool = False) -> Any:
+    """
+    Get the shared OpenAI/Groq client for a provider and timeout.
+    Created lazily on first use; rebuilt when the API key changes so
+    .env/config edits are picked up without a restart (the replaced client
+    is closed, see _close_client).
+
+    Async clients are kept per event loop (httpx async pools cannot be
+    shared between loops), so call this from inside the running loop.
+    Clients of loops that have been closed are dropped.
+
+    Args:
+        provider: "openai" or "groq"
+        api_key: Provider API key
+        timeout: Request timeout in seconds
+        use_async: Return AsyncOpenAI/AsyncGroq instead of the sync client
+
+    Returns:
+        SDK client backed by a pooled, keep-alive httpx client
+
+    Raises:
+        ValueError: If the provider is unknown
+    """
+    loop = asyncio.get_running_loop() if use_async else None
+    key = (provider, timeout)
+
+    with _clients_lock:
+        if loop is None:
+            clients = _clients
+        else:
+            # A closed loop's pools are unusable (and its id may be reused by a new loop)
+            for closed in [other for other in _async_clients if other.is_closed()]:
+                del _async_clients[closed]
+            clients = _async_clients.setdefault(loop, {})
+
+        cached = clients.get(key)
+        if cached and cached[0] == api_key:
+            return cached[1]
+
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        )
+        if provider == "openai":
+            client_class, http_client_class = (AsyncOpenAI, httpx.AsyncClient) if use_async else (OpenAI, httpx.Client)
+        elif provider == "groq":
+            client_class, http_client_class = (AsyncGroq, httpx.AsyncClient) if use_async else (Groq, httpx.Client)
+        else:
+            raise ValueError(f"Unsupported provider: {provider}")
+
+        client = client_class(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=0,  # Retried by _call_with_retries
+            http_client=http_client_class(limits=limits, timeout=timeout)
+        )
+        clients[key] = (api_key, client)
+
+    if cached:
+        _close_client(cached[1], loop)
+
+    logger.info(
+        f"LLM client {'created' if not cached else 'rebuilt (API key changed)'} - "
+        f"provider={provider}, timeout={timeout}s, async={use_async}"
+    )
+    return client
+
+
+def _close_client(client: Any, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """
+    Close a replaced SDK client and its httpx connection pool.
+    A call still running on it fails with a connection error and is retried
+    with the new client (request functions look the client up per attempt).
+
+    Args:
+        client: SDK client that is no longer handed out
+        loop: Event loop the async client belongs to (None for sync clients)
+    """
+    try:
+        if loop is None:
+            client.close()
+        else:
+            task = loop.create_task(client.close())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+    except Exception as e:
+        logger.warning(f"Closing replaced LLM client failed: {str(e)}")
+
+
 def analyze_with_llm(
     system_prompt: str,
     user_prompt: str,
-    task_id: Optional[str] = None
+    task_id: Optional[str] = None,
+    json_schema: Optional[Dict[str, Any]] = None,
+    on_partial: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True
 ) -> str:
     """
-    Analyze content using configured LLM provider.
+    Call LLM API with system and user prompts.
+    Tries the providers of the chain in order (see _call_chain), skipping
+    ones whose circuit breaker is open. With LLM_STREAMING and on_partial,
+    the response is streamed and the text so far is reported as it grows.
 
     Args:
         system_prompt: System instructions for LLM
         user_prompt: User query/content to analyze
         task_id: Optional task ID for logging
+        json_schema: Request structured JSON output matching this schema
+            (falls back to JSON mode if the model rejects json_schema)
+        on_partial: Called with the response text received so far (streaming only)
+        use_cache: Read and write the LLM response cache (False always calls the provider)
 
     Returns:
         LLM response text
 
     Raises:
-        Exception: If LLM call fails or times out
+        Exception: If LLM call fails or times out on every provider
     """
-    config = _get_provider_config()
-    provider = config["provider"]
-    model = config["model"]
+    chain = _get_provider_chain()
 
     log_prefix = f"[{task_id}]" if task_id else ""
 
-    logger.info(f"{log_prefix} LLM call - provider={provider}, model={model}")
+    logger.info(f"{log_prefix} LLM call - {_describe_chain(chain)}")
     logger.debug(f"{log_prefix} LLM timeout: {LLM_TIMEOUT}s")
     logger.debug(f"{log_prefix} System prompt length: {len(system_prompt)} chars")
     logger.debug(f"{log_prefix} User prompt length: {len(user_prompt)} chars")
 
+    # Identical call already answered by any provider? (content-addressed cache, see llm_cache)
+    cache_params = {"json_schema": json_schema} if json_schema else {}
+    cached = _get_cached_response(chain, system_prompt, user_prompt, cache_params) if use_cache else None
+    if cached is not None:
+        logger.info(f"{log_prefix} LLM cache hit - skipping API call ({len(cached)} chars)")
+        return cached
+
+    stream = LLM_STREAMING and on_partial is not None
+
+    def call(config: Dict[str, str]) -> str:
+        provider = config["provider"]
+        model = config["model"]
+
+        # Static system prompt first, batch content last: the shared prefix is
+        # what provider-side prompt caching can reuse across batches
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        cache_hint = _cache_params(provider, system_prompt)
+
+        def request(timeout: float) -> Tuple[str, Any]:
+            # Shared OpenAI/GROQ client (pooled connections, see _get_client) - looked
+            # up per attempt so a retry after a key change uses the rebuilt client
+            client = _get_client(provider, config["api_key"], LLM_TIMEOUT)
+
+            # Features this model hasn't been seen with are probed with a tiny request first
+            if json_schema:
+                _probe_capabilities(client, provider, model, ["json_schema", "json_mode"], log_prefix)
+            if stream:
+                _probe_capabilities(client, provider, model, ["streaming"], log_prefix)
+
+            # Make API call with chat completion, skipping features the capability
+            # table knows the model rejects (next response format if it rejects one now)
+            formats = _response_formats(provider, model, json_schema)
+            use_stream = stream and _supports(provider, model, "streaming") is not False
+            index = 0
+            while True:
+                feature, response_format = formats[index]
+                try:
+                    if use_stream:
+                        started = time.monotonic()
+                        chunks = client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            timeout=httpx.Timeout(timeout, read=LLM_STREAM_TTFT_TIMEOUT),
+                            stream=True,
+                            **_stream_params(provider),
+                            **cache_hint,
+                            **response_format
+                        )
+                        result, usage = _read_stream(chunks, started, timeout, on_partial, log_prefix)
+                    else:
+                        response = client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            timeout=timeout,
+                            **cache_hint,
+                            **response_format
+                        )
+                        result, usage = response.choices[0].message.content, response.usage
+                    _record_capabilities(provider, model, [feature, "streaming" if use_stream else None], True)
+                    return result, usage
+                except (OpenAIBadRequestError, GroqBadRequestError) as e:
+                    if use_stream and _rejects_feature(e, "stream"):
+                        _record_capabilities(provider, model, ["streaming"], False, log_prefix)
+                        use_stream = False
+                        continue
+                    if index == len(formats) - 1:
+                        raise
+                    if _rejects_feature(e, "response_format"):
+                        _record_capabilities(provider, model, [feature], False, log_prefix)
+                    logger.debug(f"{log_prefix} Response format not supported ({str(e)}) - trying next")
+                    index += 1
+
+        rate = _rate_request(provider, model, system_prompt, user_prompt)
+        result, usage = _call_with_retries(request, LLM_TIMEOUT, log_prefix, rate)
+        _record_usage(usage, provider, model, task_id, log_prefix)
+
+        if result and use_cache:
+            llm_cache.put(llm_cache.make_key(provider, model, system_prompt, user_prompt, **cache_params), result)
+        return result
+
     try:
-        if provider == "openai":
-            # Initialize OpenAI client with timeout
-            client = OpenAI(
-                api_key=config["api_key"],
-                timeout=LLM_TIMEOUT
-            )
+        result = _call_chain(chain, call, log_prefix)
 
-            # Make API call with chat completion
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                timeout=LLM_TIMEOUT
-            )
+        logger.info(f"{log_prefix} LLM call completed successfully")
+        logger.debug(f"{log_prefix} Response length: {len(result)} chars")
+        return result
 
-            result = response.choices[0].message.content
+    except Exception as e:
+        logger.error(f"{log_prefix} LLM call failed: {str(e)}")
+        raise Exception(f"LLM analysis failed: {str(e)}") from e
 
-        elif provider == "groq":
-            # Initialize GROQ client with timeout
-            client = Groq(
-                api_key=config["api_key"],
-                timeout=LLM_TIMEOUT
-            )
 
-            # Make API call with chat completion
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                timeout=LLM_TIMEOUT
-            )
+async def analyze_with_llm_async(
+    system_prompt: str,
+    user_prompt: str,
+    task_id: Optional[str] = None,
+    json_schema: Optional[Dict[str, Any]] = None,
+    on_partial: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True
+) -> str:
+    """
+    Async variant of analyze_with_llm using AsyncOpenAI / AsyncGroq.
+    Awaits the HTTP call on the event loop instead of blocking a thread.
 
-            result = response.choices[0].message.content
+    Args:
+        system_prompt: System instructions for LLM
+        user_prompt: User query/content to analyze
+        task_id: Optional task ID for logging
+        json_schema: Request structured JSON output matching this schema
+            (falls back to JSON mode if the model rejects json_schema)
+        on_partial: Called with the response text received so far (streaming only)
+        use_cache: Read and write the LLM response cache (False always calls the provider)
 
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+    Returns:
+        LLM response text
+
+    Raises:
+        Exception: If LLM call fails or times out on every provider
+    """
+    chain = _get_provider_chain()
+
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    logger.info(f"{log_prefix} LLM call (async) - {_describe_chain(chain)}")
+    logger.debug(f"{log_prefix} LLM timeout: {LLM_TIMEOUT}s")
+    logger.debug(f"{log_prefix} System prompt length: {len(system_prompt)} chars")
+    logger.debug(f"{log_prefix} User prompt length: {len(user_prompt)} chars")
+
+    # Identical call already answered by any provider? (SQLite cache - looked up in a worker thread)
+    cache_params = {"json_schema": json_schema} if json_schema else {}
+    cached = None
+    if use_cache:
+        cached = await asyncio.to_thread(_get_cached_response, chain, system_prompt, user_prompt, cache_params)
+    if cached is not None:
+        logger.info(f"{log_prefix} LLM cache hit - skipping API call ({len(cached)} chars)")
+        return cached
+
+    stream = LLM_STREAMING and on_partial is not None
+
+    async def call(config: Dict[str, str]) -> str:
+        provider = config["provider"]
+        model = config["model"]
+
+        # Static system prompt first, batch content last (cacheable prefix)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        cache_hint = _cache_params(provider, system_prompt)
+
+        async def request(timeout: float) -> Tuple[str, Any]:
+            client = _get_client(provider, config["api_key"], LLM_TIMEOUT, use_async=True)
+            if json_schema:
+                await _probe_capabilities_async(client, provider, model, ["json_schema", "json_mode"], log_prefix)
+            if stream:
+                await _probe_capabilities_async(client, provider, model, ["streaming"], log_prefix)
+            formats = _response_formats(provider, model, json_schema)
+            use_stream = stream and _supports(provider, model, "streaming") is not False
+            index = 0
+            while True:
+                feature, response_format = formats[index]
+                try:
+                    if use_stream:
+                        started = time.monotonic()
+                        chunks = await client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            timeout=httpx.Timeout(timeout, read=LLM_STREAM_TTFT_TIMEOUT),
+                            stream=True,
+                            **_stream_params(provider),
+                            **cache_hint,
+                            **response_format
+                        )
+                        result, usage = await _read_stream_async(chunks, started, timeout, on_partial, log_prefix)
+                    else:
+                        response = await client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            timeout=timeout,
+                            **cache_hint,
+                            **response_format
+                        )
+                        result, usage = response.choices[0].message.content, response.usage
+                    _record_capabilities(provider, model, [feature, "streaming" if use_stream else None], True)
+                    return result, usage
+                except (OpenAIBadRequestError, GroqBadRequestError) as e:
+                    if use_stream and _rejects_feature(e, "stream"):
+                        _record_capabilities(provider, model, ["streaming"], False, log_prefix)
+                        use_stream = False
+                        continue
+                    if index == len(formats) - 1:
+                        raise
+                    if _rejects_feature(e, "response_format"):
+                        _record_capabilities(provider, model, [feature], False, log_prefix)
+                    logger.debug(f"{log_prefix} Response format not supported ({str(e)}) - trying next")
+                    index += 1
+
+        rate = _rate_request(provider, model, system_prompt, user_prompt)
+        result, usage = await _call_with_retries_async(request, LLM_TIMEOUT, log_prefix, rate)
+        _record_usage(usage, provider, model, task_id, log_prefix)
+
+        if result and use_cache:
+            key = llm_cache.make_key(provider, model, system_prompt, user_prompt, **cache_params)
+            await asyncio.to_thread(llm_cache.put, key, result)
+        return result
+
+    try:
+        result = await _call_chain_async(chain, call, log_prefix)
 
         logger.info(f"{log_prefix} LLM call completed successfully")
         logger.debug(f"{log_prefix} Response length: {len(result)} chars")
@@ -130,20 +643,24 @@ def analyze_with_llm(
 
     except Exception as e:
         logger.error(f"{log_prefix} LLM call failed: {str(e)}")
-        raise Exception(f"LLM analysis failed: {str(e)}")
+        raise Exception(f"LLM analysis failed: {str(e)}") from e
 
 
 def parse_markdown_to_json(
     markdown_text: str,
-    task_id: Optional[str] = None
+    task_id: Optional[str] = None,
+    prompt_key: Optional[str] = None
 ) -> str:
     """
-    Parse markdown analysis output to structured JSON using fast/cheap LLM.
-    Uses GROQ llama-3.1-8b-instant for cost-effective parsing.
+    Parse markdown analysis output to structured JSON.
+    With PARSE_MODE "local" the markdown is parsed locally against the
+    prompt's Output Format; the fast/cheap LLM (GROQ llama-3.1-8b-instant)
+    only runs when that parse does not validate.
 
     Args:
         markdown_text: Markdown formatted analysis from main LLM
         task_id: Optional task ID for logging
+        prompt_key: Prompt that produced the markdown (schema for the local parse)
 
     Returns:
         JSON string with structured analysis data
@@ -151,14 +668,17 @@ def parse_markdown_to_json(
     Raises:
         Exception: If parsing fails
     """
-    import re
-    import json
-
     log_prefix = f"[{task_id}]" if task_id else ""
 
     logger.info(f"{log_prefix} Parsing markdown to JSON")
     logger.debug(f"{log_prefix} Input length: {len(markdown_text)} chars")
 
+    if PARSE_MODE == "local":
+        parsed = markdown_parser.parse_markdown(markdown_text, prompt_key, log_prefix)
+        if parsed is not None:
+            return parsed
+        logger.info(f"{log_prefix} Falling back to LLM parsing")
+
     # Get parsing model config (defaults to GROQ fast model)
     parsing_model = os.getenv("GROQ_PARSING_MODEL", "llama-3.1-8b-instant")
     groq_api_key = os.getenv("GROQ_API_KEY")
@@ -167,77 +687,146 @@ def parse_markdown_to_json(
         logger.warning(f"{log_prefix} GROQ_API_KEY not set, skipping parsing - returning raw markdown")
         return markdown_text
 
-    system_prompt = """You are a markdown to JSON converter. Convert the provided markdown analysis into a clean, structured JSON format.
+    messages = _parse_messages(markdown_text)
 
-CRITICAL RULES:
-1. Output ONLY valid JSON - no explanations, no markdown code blocks, no extra text
-2. Do NOT wrap the JSON in ```json``` or any markdown formatting
-3. Start your response directly with { and end with }
-4. Preserve ALL information from the markdown
-5. Keep ALL hyperlinks exactly as they appear
-6. Maintain hierarchical structure from markdown
-7. Use consistent key names across all sections
-
-EXAMPLE OUTPUT FORMAT (adapt structure to match input):
-{"sections":[{"title":"SECTION 1","opportunities":[{"name":"...","link":"...","priority":"High"}]}]}"""
-
-    user_prompt = f"Convert this markdown to structured JSON (output ONLY the JSON, no markdown formatting):\n\n{markdown_text}"
+    cache_key = llm_cache.make_key(
+        "groq", parsing_model, messages[0]["content"], messages[1]["content"], response_format="json_object"
+    )
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"{log_prefix} Parsing cache hit - skipping API call")
+        return cached
 
     try:
-        # Use GROQ fast model for parsing with JSON mode if supported
-        client = Groq(
-            api_key=groq_api_key,
-            timeout=30  # Shorter timeout for parsing (30 seconds)
-        )
-
         logger.debug(f"{log_prefix} Calling parsing LLM - model={parsing_model}")
 
-        # Try to use JSON mode (not all GROQ models support it)
-        try:
-            response = client.chat.completions.create(
-                model=parsing_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"},  # Force JSON output
-                timeout=30
-            )
-            logger.debug(f"{log_prefix} Used JSON mode for parsing")
-        except Exception:
-            # Fallback if JSON mode not supported
-            logger.debug(f"{log_prefix} JSON mode not supported, using regular mode")
-            response = client.chat.completions.create(
+        def request(timeout: float) -> Any:
+            # Use GROQ fast model for parsing with JSON mode if supported
+            # (shared client with the shorter parsing timeout)
+            client = _get_client("groq", groq_api_key, PARSE_TIMEOUT)
+            _probe_capabilities(client, "groq", parsing_model, ["json_mode"], log_prefix)
+
+            # Try to use JSON mode (not all GROQ models support it - skipped once
+            # the capability table knows the model rejects it)
+            if _supports("groq", parsing_model, "json_mode") is not False:
+                try:
+                    response = client.chat.completions.create(
+                        model=parsing_model,
+                        messages=messages,
+                        response_format={"type": "json_object"},  # Force JSON output
+                        timeout=timeout
+                    )
+                    _record_capabilities("groq", parsing_model, ["json_mode"], True)
+                    logger.debug(f"{log_prefix} Used JSON mode for parsing")
+                    return response
+                except (OpenAIBadRequestError, GroqBadRequestError) as e:
+                    # Fallback if JSON mode not supported
+                    if _rejects_feature(e, "response_format"):
+                        _record_capabilities("groq", parsing_model, ["json_mode"], False, log_prefix)
+                    logger.debug(f"{log_prefix} JSON mode not supported, using regular mode")
+            return client.chat.completions.create(
                 model=parsing_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                timeout=30
+                messages=messages,
+                timeout=timeout
             )
 
-        result = response.choices[0].message.content
+        rate = _rate_request("groq", parsing_model, *(m["content"] for m in messages))
+        response = _call_with_retries(request, PARSE_TIMEOUT, log_prefix, rate)
+        _record_usage(response.usage, "groq", parsing_model, task_id, log_prefix)
 
-        # Log raw parsing LLM output before post-processing
-        logger.debug(f"{log_prefix} Raw parsing LLM output (before extraction): {result[:500]}...")
+        result = _validate_parsed_json(response.choices[0].message.content, markdown_text, log_prefix)
+        if result is not markdown_text:
+            llm_cache.put(cache_key, result)  # Only cache valid JSON
+        return result
 
-        # Post-process: Extract JSON from markdown code blocks if present
-        result = _extract_json_from_text(result)
+    except Exception as e:
+        logger.error(f"{log_prefix} Parsing failed: {str(e)}")
+        # Return original markdown if parsing fails
+        logger.warning(f"{log_prefix} Using original markdown (parsing failed)")
+        return markdown_text
 
-        # Log after extraction
-        logger.debug(f"{log_prefix} After extraction: {result[:500]}...")
 
-        # Validate that it's valid JSON
-        try:
-            json.loads(result)  # Validate JSON
-            logger.info(f"{log_prefix} Parsing completed successfully - valid JSON")
-        except json.JSONDecodeError as e:
-            logger.warning(f"{log_prefix} Parsed output is not valid JSON: {e}")
-            logger.debug(f"{log_prefix} Invalid JSON output: {result[:200]}...")
-            # Return original markdown if JSON is invalid
-            return markdown_text
+async def parse_markdown_to_json_async(
+    markdown_text: str,
+    task_id: Optional[str] = None,
+    prompt_key: Optional[str] = None
+) -> str:
+    """
+    Async variant of parse_markdown_to_json (AsyncGroq, runs on the event loop).
+
+    Args:
+        markdown_text: Markdown formatted analysis from main LLM
+        task_id: Optional task ID for logging
+        prompt_key: Prompt that produced the markdown (schema for the local parse)
+
+    Returns:
+        JSON string with structured analysis data (original markdown on failure)
+    """
+    log_prefix = f"[{task_id}]" if task_id else ""
+
+    logger.info(f"{log_prefix} Parsing markdown to JSON")
+    logger.debug(f"{log_prefix} Input length: {len(markdown_text)} chars")
+
+    if PARSE_MODE == "local":
+        parsed = markdown_parser.parse_markdown(markdown_text, prompt_key, log_prefix)
+        if parsed is not None:
+            return parsed
+        logger.info(f"{log_prefix} Falling back to LLM parsing")
+
+    parsing_model = os.getenv("GROQ_PARSING_MODEL", "llama-3.1-8b-instant")
+    groq_api_key = os.getenv("GROQ_API_KEY")
+
+    if not groq_api_key:
+        logger.warning(f"{log_prefix} GROQ_API_KEY not set, skipping parsing - returning raw markdown")
+        return markdown_text
+
+    messages = _parse_messages(markdown_text)
+
+    cache_key = llm_cache.make_key(
+        "groq", parsing_model, messages[0]["content"], messages[1]["content"], response_format="json_object"
+    )
+    cached = await asyncio.to_thread(llm_cache.get, cache_key)
+    if cached is not None:
+        logger.info(f"{log_prefix} Parsing cache hit - skipping API call")
+        return cached
+
+    try:
+        logger.debug(f"{log_prefix} Calling parsing LLM - model={parsing_model}")
 
-        logger.debug(f"{log_prefix} Output length: {len(result)} chars")
+        async def request(timeout: float) -> Any:
+            client = _get_client("groq", groq_api_key, PARSE_TIMEOUT, use_async=True)
+            await _probe_capabilities_async(client, "groq", parsing_model, ["json_mode"], log_prefix)
+
+            # Try to use JSON mode (skipped once the model is known to reject it)
+            if _supports("groq", parsing_model, "json_mode") is not False:
+                try:
+                    response = await client.chat.completions.create(
+                        model=parsing_model,
+                        messages=messages,
+                        response_format={"type": "json_object"},  # Force JSON output
+                        timeout=timeout
+                    )
+                    _record_capabilities("groq", parsing_model, ["json_mode"], True)
+                    logger.debug(f"{log_prefix} Used JSON mode for parsing")
+                    return response
+                except (OpenAIBadRequestError, GroqBadRequestError) as e:
+                    # Fallback if JSON mode not supported
+                    if _rejects_feature(e, "response_format"):
+                        _record_capabilities("groq", parsing_model, ["json_mode"], False, log_prefix)
+                    logger.debug(f"{log_prefix} JSON mode not supported, using regular mode")
+            return await client.chat.completions.create(
+                model=parsing_model,
+                messages=messages,
+                timeout=timeout
+            )
+
+        rate = _rate_request("groq", parsing_model, *(m["content"] for m in messages))
+        response = await _call_with_retries_async(request, PARSE_TIMEOUT, log_prefix, rate)
+        _record_usage(response.usage, "groq", parsing_model, task_id, log_prefix)
+
+        result = _validate_parsed_json(response.choices[0].message.content, markdown_text, log_prefix)
+        if result is not markdown_text:
+            await asyncio.to_thread(llm_cache.put, cache_key, result)  # Only cache valid JSON
         return result
 
     except Exception as e:
@@ -247,6 +836,1169 @@ EXAMPLE OUTPUT FORMAT (adapt structure to match input):
         return markdown_text
 
 
+def _classify_error(error: Exception) -> Optional[str]:
+    """
+    Classify an LLM API error for retrying.
+
+    Args:
+        error: Exception raised by the OpenAI/Groq SDK
+
+    Returns:
+        Retry reason ("rate_limit", "server_error", "timeout", "connection"),
+        or None if retrying cannot help (bad request, auth, exhausted quota)
+    """
+    # Raw httpx errors / TimeoutError come from reading a stream (see _read_stream)
+    if isinstance(error, (openai.APITimeoutError, groq.APITimeoutError, httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    if isinstance(error, (openai.APIConnectionError, groq.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    if isinstance(error, (openai.APIStatusError, groq.APIStatusError)):
+        if error.status_code == 429:
+            # OpenAI also answers 429 when the account is out of credit
+            return None if getattr(error, "code", None) == "insufficient_quota" else "rate_limit"
+        if error.status_code in _RETRYABLE_STATUSES or error.status_code >= 500:
+            return "server_error"
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Read the server's requested wait from Retry-After / retry-after-ms headers.
+
+    Args:
+        error: Exception raised by the OpenAI/Groq SDK
+
+    Returns:
+        Seconds to wait, or None if the response had no usable header
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _next_retry_delay(error: Exception, reason: str, attempt: int, remaining: float, log_prefix: str) -> Optional[float]:
+    """
+    Decide whether and how long to wait before retrying a failed call.
+
+    Args:
+        error: Exception from the failed attempt
+        reason: Retry reason from _classify_error
+        attempt: Number of the failed attempt (1-based)
+        remaining: Seconds left in the call's deadline budget
+        log_prefix: Task log prefix
+
+    Returns:
+        Seconds to sleep, or None to give up (retries or deadline exhausted)
+    """
+    if attempt > LLM_MAX_RETRIES:
+        return None
+
+    # Full jitter: uniform over [0, capped exponential backoff], so concurrent
+    # batches that hit a 429 together don't retry in lockstep
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = retry_after
+
+    if delay + _MIN_ATTEMPT_SECONDS > remaining:
+        logger.warning(f"{log_prefix} [RETRY] ⚠ Deadline budget exhausted - not retrying ({reason})")
+        return None
+
+    with _retry_lock:
+        _retry_stats["retries"] += 1
+        _retry_stats["retries_by_reason"][reason] = _retry_stats["retries_by_reason"].get(reason, 0) + 1
+        _retry_stats["retry_wait_seconds"] += delay
+
+    logger.warning(
+        f"{log_prefix} [RETRY] ⚠ Attempt {attempt} failed ({reason}: {str(error)[:200]}) - "
+        f"retrying in {delay:.1f}s{' (Retry-After)' if retry_after is not None else ''}"
+    )
+    return delay
+
+
+def _record_call(attempts: int, succeeded: bool) -> None:
+    """Count a finished call (after all its attempts) in the retry stats."""
+    with _retry_lock:
+        _retry_stats["calls"] += 1
+        if not succeeded:
+            _retry_stats["failed_calls"] += 1
+        elif attempts > 1:
+            _retry_stats["recovered_calls"] += 1
+
+
+def _call_with_retries(
+    request: Callable[[float], Any],
+    timeout: float,
+    log_prefix: str = "",
+    rate: Optional[Tuple[str, str, int]] = None
+) -> Any:
+    """
+    Run an LLM request with classified retries inside a deadline budget.
+    Every attempt first takes its turn in the provider's rate limiter.
+
+    Args:
+        request: Makes one attempt given its timeout in seconds
+        timeout: Timeout per attempt (shortened to what is left of LLM_RETRY_DEADLINE)
+        log_prefix: Task log prefix
+        rate: Rate limiter request from _rate_request (None = unlimited)
+
+    Returns:
+        The request's return value
+
+    Raises:
+        Exception: The last error once it is not retryable or retries/deadline are exhausted
+    """
+    deadline = None
+    attempt = 0
+    while True:
+        attempt += 1
+        if rate:
+            time.sleep(_reserve_rate(rate, log_prefix))
+        if deadline is None:
+            # The deadline budget starts once the first attempt is admitted
+            deadline = time.monotonic() + max(timeout, LLM_RETRY_DEADLINE)
+        try:
+            result = request(max(_MIN_ATTEMPT_SECONDS, min(timeout, deadline - time.monotonic())))
+            _record_call(attempt, True)
+            return result
+        except Exception as e:
+            reason = _classify_error(e)
+            delay = _next_retry_delay(e, reason, attempt, deadline - time.monotonic(), log_prefix) if reason else None
+            if rate and reason == "rate_limit" and _retry_after(e):
+                _pause_rate(rate, _retry_after(e))
+            if delay is None:
+                _record_call(attempt, False)
+                raise
+            time.sleep(delay)
+
+
+async def _call_with_retries_async(
+    request: Callable[[float], Awaitable[Any]],
+    timeout: float,
+    log_prefix: str = "",
+    rate: Optional[Tuple[str, str, int]] = None
+) -> Any:
+    """Async variant of _call_with_retries (rate limit and backoff waits await asyncio.sleep)."""
+    deadline = None
+    attempt = 0
+    while True:
+        attempt += 1
+        if rate:
+            await asyncio.sleep(_reserve_rate(rate, log_prefix))
+        if deadline is None:
+            deadline = time.monotonic() + max(timeout, LLM_RETRY_DEADLINE)
+        try:
+            result = await request(max(_MIN_ATTEMPT_SECONDS, min(timeout, deadline - time.monotonic())))
+            _record_call(attempt, True)
+            return result
+        except Exception as e:
+            reason = _classify_error(e)
+            delay = _next_retry_delay(e, reason, attempt, deadline - time.monotonic(), log_prefix) if reason else None
+            if rate and reason == "rate_limit" and _retry_after(e):
+                _pause_rate(rate, _retry_after(e))
+            if delay is None:
+                _record_call(attempt, False)
+                raise
+            await asyncio.sleep(delay)
+
+
+def get_retry_stats() -> Dict[str, Any]:
+    """
+    Get LLM call/retry counters since startup.
+
+    Returns:
+        Dictionary with calls, retries (total and per reason), recovered and failed calls
+    """
+    with _retry_lock:
+        stats = dict(_retry_stats)
+        stats["retries_by_reason"] = dict(_retry_stats["retries_by_reason"])
+    stats["retry_wait_seconds"] = round(stats["retry_wait_seconds"], 1)
+    return stats
+
+
+def _rate_limits(provider: str, model: str) -> Tuple[int, int]:
+    """
+    Resolve the requests/min and tokens/min limits for a provider and model.
+
+    Args:
+        provider: "openai" or "groq"
+        model: Model name
+
+    Returns:
+        Tuple (rpm, tpm); 0 means unlimited
+    """
+    global _rate_overrides
+
+    if _rate_overrides is None:
+        try:
+            _rate_overrides = json.loads(LLM_RATE_LIMITS) if LLM_RATE_LIMITS.strip() else {}
+        except json.JSONDecodeError as e:
+            logger.warning(f"[RATE] ⚠ Ignoring invalid LLM_RATE_LIMITS: {str(e)}")
+            _rate_overrides = {}
+
+    defaults = {"openai": (OPENAI_RPM, OPENAI_TPM), "groq": (GROQ_RPM, GROQ_TPM)}
+    rpm, tpm = defaults.get(provider, (0, 0))
+    for key in (provider, f"{provider}:{model}"):
+        override = _rate_overrides.get(key) or {}
+        rpm = int(override.get("rpm", rpm))
+        tpm = int(override.get("tpm", tpm))
+    return rpm, tpm
+
+
+def _rate_request(provider: str, model: str, *texts: str) -> Optional[Tuple[str, str, int]]:
+    """
+    Describe one LLM request for the rate limiter.
+
+    Args:
+        provider: "openai" or "groq"
+        model: Model name
+        *texts: Prompt texts sent with the request (counted against tokens/min)
+
+    Returns:
+        Tuple (provider, model, estimated tokens), or None if the model is unlimited
+    """
+    rpm, tpm = _rate_limits(provider, model)
+    if not rpm and not tpm:
+        return None
+    tokens = sum(estimate_tokens(text) for text in texts) + _RATE_OUTPUT_TOKENS if tpm else 0
+    return provider, model, tokens
+
+
+def _reserve_rate(rate: Tuple[str, str, int], log_prefix: str = "") -> float:
+    """
+    Reserve one request (and its tokens) from the provider/model token bucket.
+
+    Buckets hold up to a minute of capacity and refill continuously. The
+    reservation is taken immediately, in arrival order; the caller then waits
+    until the bucket has refilled past it.
+
+    Args:
+        rate: Tuple (provider, model, estimated tokens) from _rate_request
+        log_prefix: Task log prefix
+
+    Returns:
+        Seconds the caller must wait before sending the request
+    """
+    provider, model, tokens = rate
+    rpm, tpm = _rate_limits(provider, model)
+    now = time.monotonic()
+
+    with _rate_lock:
+        bucket = _rate_buckets.get((provider, model))
+        if bucket is None or bucket["rpm"] != rpm or bucket["tpm"] != tpm:
+            bucket = {"rpm": rpm, "tpm": tpm, "requests": rpm, "tokens": tpm, "updated": now, "paused_until": 0.0}
+            _rate_buckets[(provider, model)] = bucket
+
+        elapsed = now - bucket["updated"]
+        bucket["updated"] = now
+        wait = max(0.0, bucket["paused_until"] - now)
+        if rpm:
+            bucket["requests"] = min(rpm, bucket["requests"] + elapsed * rpm / 60) - 1
+            wait = max(wait, -bucket["requests"] * 60 / rpm)
+        if tpm:
+            # A request larger than the whole budget only has to wait for a full bucket
+            bucket["tokens"] = min(tpm, bucket["tokens"] + elapsed * tpm / 60) - min(tokens, tpm)
+            wait = max(wait, -bucket["tokens"] * 60 / tpm)
+
+        stats = _rate_stats.setdefault(f"{provider}:{model}", {
+            "requests": 0, "tokens": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "pauses": 0,
+        })
+        stats["requests"] += 1
+        stats["tokens"] += tokens
+        if wait > 0:
+            stats["queued"] += 1
+            stats["wait_seconds"] += wait
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+
+    if wait >= 1:
+        logger.info(f"{log_prefix} [RATE] Queued {wait:.1f}s for {provider}:{model} (rpm={rpm}, tpm={tpm})")
+    return wait
+
+
+def _pause_rate(rate: Tuple[str, str, int], seconds: float) -> None:
+    """
+    Hold back new reservations for a provider/model after it answered 429,
+    so other tasks queue behind the Retry-After instead of piling on.
+
+    Args:
+        rate: Tuple (provider, model, estimated tokens) from _rate_request
+        seconds: How long the provider asked callers to wait
+    """
+    provider, model, _ = rate
+    with _rate_lock:
+        bucket = _rate_buckets.get((provider, model))
+        if bucket is None:
+            return
+        bucket["paused_until"] = max(bucket["paused_until"], time.monotonic() + seconds)
+        _rate_stats[f"{provider}:{model}"]["pauses"] += 1
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """
+    Get rate limiter counters per provider:model since startup.
+
+    Returns:
+        Dictionary {provider:model: {rpm, tpm, requests, tokens, queued, wait/max wait seconds, pauses}}
+    """
+    with _rate_lock:
+        stats = {key: dict(values) for key, values in _rate_stats.items()}
+        for (provider, model), bucket in _rate_buckets.items():
+            stats[f"{provider}:{model}"].update(rpm=bucket["rpm"], tpm=bucket["tpm"])
+    for values in stats.values():
+        values["wait_seconds"] = round(values["wait_seconds"], 1)
+        values["max_wait_seconds"] = round(values["max_wait_seconds"], 1)
+    return stats
+
+
+def _describe_chain(chain: List[Dict[str, str]]) -> str:
+    """Format the provider chain for logs (primary provider/model, then fallbacks)."""
+    text = f"provider={chain[0]['provider']}, model={chain[0]['model']}"
+    if len(chain) > 1:
+        text += ", fallbacks=" + ",".join(f"{c['provider']}:{c['model']}" for c in chain[1:])
+    return text
+
+
+def _get_health(provider: str) -> Dict[str, Any]:
+    """Get (or create) a provider's health record. Caller must hold _health_lock."""
+    health = _provider_health.get(provider)
+    if health is None:
+        health = {
+            "state": "closed",
+            "consecutive_failures": 0,
+            "opened_at": 0.0,
+            "trial_running": False,
+            "calls": 0,
+            "failures": 0,
+            "hedged_calls": 0,
+            "hedge_wins": 0,
+            "latencies": collections.deque(maxlen=_LATENCY_SAMPLES),
+        }
+        _provider_health[provider] = health
+    return health
+
+
+def _acquire_provider(provider: str, log_prefix: str = "") -> bool:
+    """
+    Ask a provider's circuit breaker whether a call may start.
+
+    Closed: always. Open: not until LLM_BREAKER_COOLDOWN has passed, then the
+    breaker goes half-open and admits a single trial call.
+
+    Args:
+        provider: "openai" or "groq"
+        log_prefix: Task log prefix
+
+    Returns:
+        True if the call may start
+    """
+    with _health_lock:
+        health = _get_health(provider)
+        if health["state"] == "open":
+            if time.monotonic() - health["opened_at"] < LLM_BREAKER_COOLDOWN:
+                return False
+            health["state"] = "half_open"
+            logger.info(f"{log_prefix} [PROVIDER] {provider} circuit half-open - sending a trial call")
+        if health["state"] == "half_open":
+            if health["trial_running"]:
+                return False
+            health["trial_running"] = True
+        return True
+
+
+def _record_provider(provider: str, succeeded: Optional[bool], latency: float = 0.0) -> None:
+    """
+    Record a finished call in the provider's health and latency samples.
+
+    Args:
+        provider: "openai" or "groq"
+        succeeded: True/False, or None when the outcome says nothing about the
+            provider's health (cancelled hedge, rejected request)
+        latency: Call duration in seconds (successful calls)
+    """
+    with _health_lock:
+        health = _get_health(provider)
+        health["trial_running"] = False
+        if succeeded is None:
+            return
+
+        health["calls"] += 1
+        if succeeded:
+            health["latencies"].append(latency)
+            health["consecutive_failures"] = 0
+            if health["state"] != "closed":
+                health["state"] = "closed"
+                logger.info(f"[PROVIDER] ✓ {provider} circuit closed")
+            return
+
+        health["failures"] += 1
+        health["consecutive_failures"] += 1
+        tripped = LLM_BREAKER_FAILURES > 0 and health["consecutive_failures"] >= LLM_BREAKER_FAILURES
+        if health["state"] == "half_open" or (health["state"] == "closed" and tripped):
+            health["state"] = "open"
+            health["opened_at"] = time.monotonic()
+            logger.warning(
+                f"[PROVIDER] ✗ {provider} circuit open after {health['consecutive_failures']} failures - "
+                f"skipping it for {LLM_BREAKER_COOLDOWN:.0f}s"
+            )
+
+
+def _hedge_delay(provider: str) -> float:
+    """
+    Seconds to wait on a provider before hedging with the next one.
+
+    Args:
+        provider: "openai" or "groq"
+
+    Returns:
+        The provider's LLM_HEDGE_PERCENTILE latency, or LLM_HEDGE_DELAY until
+        enough samples are recorded
+    """
+    with _health_lock:
+        samples = sorted(_get_health(provider)["latencies"])
+    if len(samples) < max(1, LLM_HEDGE_MIN_SAMPLES):
+        return LLM_HEDGE_DELAY
+    return samples[min(len(samples) - 1, int(len(samples) * LLM_HEDGE_PERCENTILE / 100))]
+
+
+def _next_provider(pending: List[Dict[str, str]], started: int, log_prefix: str) -> Optional[Dict[str, str]]:
+    """
+    Pop the next provider from the chain whose circuit breaker admits a call.
+    If every provider was skipped, the last one is tried anyway rather than
+    failing the call without a request.
+
+    Args:
+        pending: Providers not tried yet (consumed in place)
+        started: Number of providers already started for this call
+        log_prefix: Task log prefix
+
+    Returns:
+        Provider config, or None when the chain is exhausted
+    """
+    while pending:
+        config = pending.pop(0)
+        if _acquire_provider(config["provider"], log_prefix):
+            return config
+        if not pending and not started:
+            logger.warning(f"{log_prefix} [PROVIDER] ⚠ All circuits open - trying {config['provider']} anyway")
+            return config
+        logger.warning(f"{log_prefix} [PROVIDER] ⚠ {config['provider']} circuit open - skipping")
+    return None
+
+
+def _tracked_call(config: Dict[str, str], call: Callable[[Dict[str, str]], str]) -> str:
+    """Run call(config), recording the outcome in the provider's health."""
+    start = time.monotonic()
+    try:
+        result = call(config)
+    except (OpenAIBadRequestError, GroqBadRequestError):
+        _record_provider(config["provider"], None)
+        raise
+    except Exception:
+        _record_provider(config["provider"], False)
+        raise
+    _record_provider(config["provider"], True, time.monotonic() - start)
+    return result
+
+
+async def _tracked_call_async(config: Dict[str, str], call: Callable[[Dict[str, str]], Awaitable[str]]) -> str:
+    """Async variant of _tracked_call (a cancelled hedge doesn't count against the provider)."""
+    start = time.monotonic()
+    try:
+        result = await call(config)
+    except asyncio.CancelledError:
+        _record_provider(config["provider"], None)
+        raise
+    except (OpenAIBadRequestError, GroqBadRequestError):
+        _record_provider(config["provider"], None)
+        raise
+    except Exception:
+        _record_provider(config["provider"], False)
+        raise
+    _record_provider(config["provider"], True, time.monotonic() - start)
+    return result
+
+
+def _record_hedge(config: Dict[str, str], won: bool = False) -> None:
+    """Count a hedged request (or its win) for the provider it was sent to."""
+    with _health_lock:
+        _get_health(config["provider"])["hedge_wins" if won else "hedged_calls"] += 1
+
+
+def _call_chain(chain: List[Dict[str, str]], call: Callable[[Dict[str, str]], str], log_prefix: str = "") -> str:
+    """
+    Run an LLM call against the provider chain.
+
+    Providers are tried in order; one that fails (after its retries) falls
+    over to the next. With LLM_HEDGE, a call still running after the
+    provider's hedge delay is also sent to the next provider, and whichever
+    answers first wins (the slower request finishes in the background).
+
+    Args:
+        chain: Provider configs from _get_provider_chain
+        call: Makes the call against one provider config, returning the response text
+        log_prefix: Task log prefix
+
+    Returns:
+        Response text from the first provider that answered
+
+    Raises:
+        Exception: The last provider's error if every provider failed
+    """
+    pending = list(chain)
+    started = 0
+    last_error: Optional[Exception] = None
+
+    if not LLM_HEDGE or len(chain) < 2:
+        while True:
+            config = _next_provider(pending, started, log_prefix)
+            if config is None:
+                raise last_error
+            started += 1
+            try:
+                return _tracked_call(config, call)
+            except Exception as e:
+                last_error = e
+                if pending:
+                    logger.warning(f"{log_prefix} [PROVIDER] ⚠ {config['provider']} failed ({str(e)[:200]}) - failing over")
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(chain))
+    running: Dict[concurrent.futures.Future, Tuple[Dict[str, str], float]] = {}
+    hedged = False
+
+    def start(config: Dict[str, str]) -> None:
+        nonlocal started
+        started += 1
+        running[executor.submit(_tracked_call, config, call)] = (config, time.monotonic())
+
+    try:
+        start(_next_provider(pending, started, log_prefix))
+        first = next(iter(running.values()))[0]
+        while running:
+            timeout = None
+            if not hedged and pending and len(running) == 1:
+                config, started_at = next(iter(running.values()))
+                timeout = max(0.0, _hedge_delay(config["provider"]) - (time.monotonic() - started_at))
+
+            done, _ = concurrent.futures.wait(running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                config = _next_provider(pending, started, log_prefix)
+                if config:
+                    logger.info(f"{log_prefix} [PROVIDER] Slow response after {timeout:.1f}s - hedging with {config['provider']}")
+                    _record_hedge(config)
+                    start(config)
+                continue
+
+            for future in done:
+                config, _ = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"{log_prefix} [PROVIDER] ⚠ {config['provider']} failed ({str(e)[:200]})")
+                    continue
+                if config is not first:
+                    _record_hedge(config, won=True)
+                return result
+
+            if not running:
+                config = _next_provider(pending, started, log_prefix)
+                if config:
+                    logger.warning(f"{log_prefix} [PROVIDER] ⚠ Failing over to {config['provider']}")
+                    start(config)
+
+        raise last_error
+    finally:
+        executor.shutdown(wait=False)
+
+
+async def _call_chain_async(
+    chain: List[Dict[str, str]],
+    call: Callable[[Dict[str, str]], Awaitable[str]],
+    log_prefix: str = ""
+) -> str:
+    """Async variant of _call_chain (the losing hedged request is cancelled)."""
+    pending = list(chain)
+    started = 0
+    last_error: Optional[Exception] = None
+
+    if not LLM_HEDGE or len(chain) < 2:
+        while True:
+            config = _next_provider(pending, started, log_prefix)
+            if config is None:
+                raise last_error
+            started += 1
+            try:
+                return await _tracked_call_async(config, call)
+            except Exception as e:
+                last_error = e
+                if pending:
+                    logger.warning(f"{log_prefix} [PROVIDER] ⚠ {config['provider']} failed ({str(e)[:200]}) - failing over")
+
+    running: Dict[asyncio.Task, Tuple[Dict[str, str], float]] = {}
+    hedged = False
+
+    def start(config: Dict[str, str]) -> None:
+        nonlocal started
+        started += 1
+        running[asyncio.create_task(_tracked_call_async(config, call))] = (config, time.monotonic())
+
+    try:
+        start(_next_provider(pending, started, log_prefix))
+        first = next(iter(running.values()))[0]
+        while running:
+            timeout = None
+            if not hedged and pending and len(running) == 1:
+                config, started_at = next(iter(running.values()))
+                timeout = max(0.0, _hedge_delay(config["provider"]) - (time.monotonic() - started_at))
+
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                config = _next_provider(pending, started, log_prefix)
+                if config:
+                    logger.info(f"{log_prefix} [PROVIDER] Slow response after {timeout:.1f}s - hedging with {config['provider']}")
+                    _record_hedge(config)
+                    start(config)
+                continue
+
+            for task in done:
+                config, _ = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"{log_prefix} [PROVIDER] ⚠ {config['provider']} failed ({str(e)[:200]})")
+                    continue
+                if config is not first:
+                    _record_hedge(config, won=True)
+                return result
+
+            if not running:
+                config = _next_provider(pending, started, log_prefix)
+                if config:
+                    logger.warning(f"{log_prefix} [PROVIDER] ⚠ Failing over to {config['provider']}")
+                    start(config)
+
+        raise last_error
+    finally:
+        for task in running:
+            if task.done() and not task.cancelled():
+                task.exception()  # Mark retrieved (a late failure doesn't matter any more)
+            task.cancel()
+
+
+def get_provider_stats() -> Dict[str, Any]:
+    """
+    Get provider health since startup.
+
+    Returns:
+        Dictionary {provider: {state, consecutive/total failures, calls, hedges, p50/p90 latency}}
+    """
+    stats = {}
+    with _health_lock:
+        for provider, health in _provider_health.items():
+            samples = sorted(health["latencies"])
+            stats[provider] = {
+                key: value for key, value in health.items()
+                if key not in ("latencies", "opened_at", "trial_running")
+            }
+            for percentile in (50, 90):
+                stats[provider][f"p{percentile}_seconds"] = (
+                    round(samples[min(len(samples) - 1, int(len(samples) * percentile / 100))], 2) if samples else None
+                )
+    return stats
+
+
+def _read_stream(
+    chunks: Any,
+    started: float,
+    timeout: float,
+    on_partial: Callable[[str], None],
+    log_prefix: str = ""
+) -> Tuple[str, Any]:
+    """
+    Collect a streamed chat completion, reporting the text as it grows.
+
+    Args:
+        chunks: Stream returned by chat.completions.create(stream=True)
+        started: time.monotonic() when the request was sent
+        timeout: Total seconds allowed for the whole response
+        on_partial: Called with the text so far (at most every _STREAM_PARTIAL_INTERVAL)
+        log_prefix: Task log prefix
+
+    Returns:
+        Tuple (complete response text, usage from the final chunk or None)
+
+    Raises:
+        TimeoutError: If the stream stalls (LLM_STREAM_TTFT_TIMEOUT) or exceeds timeout
+    """
+    parts: List[str] = []
+    usage = None
+    reported = 0.0
+    try:
+        for chunk in chunks:
+            # Usage arrives on the last chunk (OpenAI include_usage / Groq x_groq)
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            now = time.monotonic()
+            if not parts:
+                logger.debug(f"{log_prefix} [STREAM] First token after {now - started:.1f}s")
+            parts.append(delta)
+            if now - started > timeout:
+                raise TimeoutError(f"Stream exceeded {timeout:.0f}s")
+            if now - reported >= _STREAM_PARTIAL_INTERVAL:
+                on_partial("".join(parts))
+                reported = now
+    except httpx.TimeoutException as e:
+        stage = "before the first token" if not parts else f"after {len(parts)} chunks"
+        logger.warning(f"{log_prefix} [STREAM] ✗ Stalled {stage} - aborting after {LLM_STREAM_TTFT_TIMEOUT:.0f}s")
+        raise TimeoutError(f"Stream stalled {stage}") from e
+    finally:
+        chunks.close()
+
+    return "".join(parts), usage
+
+
+async def _read_stream_async(
+    chunks: Any,
+    started: float,
+    timeout: float,
+    on_partial: Callable[[str], None],
+    log_prefix: str = ""
+) -> Tuple[str, Any]:
+    """Async variant of _read_stream."""
+    parts: List[str] = []
+    usage = None
+    reported = 0.0
+    try:
+        async for chunk in chunks:
+            # Usage arrives on the last chunk (OpenAI include_usage / Groq x_groq)
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            now = time.monotonic()
+            if not parts:
+                logger.debug(f"{log_prefix} [STREAM] First token after {now - started:.1f}s")
+            parts.append(delta)
+            if now - started > timeout:
+                raise TimeoutError(f"Stream exceeded {timeout:.0f}s")
+            if now - reported >= _STREAM_PARTIAL_INTERVAL:
+                on_partial("".join(parts))
+                reported = now
+    except httpx.TimeoutException as e:
+        stage = "before the first token" if not parts else f"after {len(parts)} chunks"
+        logger.warning(f"{log_prefix} [STREAM] ✗ Stalled {stage} - aborting after {LLM_STREAM_TTFT_TIMEOUT:.0f}s")
+        raise TimeoutError(f"Stream stalled {stage}") from e
+    finally:
+        await chunks.close()
+
+    return "".join(parts), usage
+
+
+def _cache_params(provider: str, system_prompt: str) -> Dict[str, Any]:
+    """
+    Extra request kwargs that help provider-side prompt caching.
+
+    OpenAI caches prompt prefixes automatically; prompt_cache_key routes calls
+    that share a system prompt to the same cache. Groq caches without a hint.
+
+    Args:
+        provider: "openai" or "groq"
+        system_prompt: Static system prompt the call starts with
+
+    Returns:
+        Request kwargs (empty for providers without a cache hint)
+    """
+    if provider != "openai":
+        return {}
+    return {"prompt_cache_key": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:32]}
+
+
+def _stream_params(provider: str) -> Dict[str, Any]:
+    """Extra kwargs for streamed calls (OpenAI only reports usage when asked to)."""
+    return {"stream_options": {"include_usage": True}} if provider == "openai" else {}
+
+
+def _usage_value(usage: Any, name: str) -> int:
+    """Read a token count from an SDK usage object or dict (0 if missing)."""
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value or 0)
+
+
+def _record_usage(usage: Any, provider: str, model: str, task_id: Optional[str] = None, log_prefix: str = "") -> None:
+    """
+    Record one call's token usage, including prompt tokens served from the provider's prompt cache.
+
+    Args:
+        usage: Usage object from the response (None if the provider sent none)
+        provider: "openai" or "groq"
+        model: Model name
+        task_id: Task the call belongs to (totals per task, see pop_task_usage)
+        log_prefix: Task log prefix
+    """
+    if usage is None:
+        return
+
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    counts = {
+        "calls": 1,
+        "prompt_tokens": _usage_value(usage, "prompt_tokens"),
+        "cached_tokens": _usage_value(details, "cached_tokens") if details else 0,
+        "completion_tokens": _usage_value(usage, "completion_tokens"),
+    }
+
+    with _usage_lock:
+        targets = [_usage_totals] + ([_task_usage.setdefault(task_id, dict.fromkeys(_usage_totals, 0))] if task_id else [])
+        for target in targets:
+            for key, value in counts.items():
+                target[key] += value
+
+    cached_share = counts["cached_tokens"] / counts["prompt_tokens"] if counts["prompt_tokens"] else 0.0
+    logger.info(
+        f"{log_prefix} [USAGE] {provider}:{model} prompt={counts['prompt_tokens']} "
+        f"cached={counts['cached_tokens']} ({cached_share:.0%}) completion={counts['completion_tokens']}"
+    )
+
+
+def get_usage_stats() -> Dict[str, Any]:
+    """
+    Get token usage totals since startup.
+
+    Returns:
+        Dictionary with calls, prompt/cached/completion tokens and the cached share of prompt tokens
+    """
+    with _usage_lock:
+        stats: Dict[str, Any] = dict(_usage_totals)
+    stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+def pop_task_usage(task_id: str) -> Dict[str, Any]:
+    """
+    Take (and forget) a task's token usage totals once the task has finished.
+
+    Args:
+        task_id: Task identifier
+
+    Returns:
+        Dictionary with calls, prompt/cached/completion tokens and cached_ratio (zeros if no calls)
+    """
+    with _usage_lock:
+        stats: Dict[str, Any] = _task_usage.pop(task_id, None) or dict.fromkeys(_usage_totals, 0)
+    stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+def _response_formats(provider: str, model: str, json_schema: Optional[Dict[str, Any]]) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Build the response_format kwargs to try, in order, for an analysis call.
+
+    Args:
+        provider: "openai" or "groq"
+        model: Model name (formats it is known to reject are left out)
+        json_schema: Structured output schema (None for a plain text call)
+
+    Returns:
+        List of (capability, kwargs) pairs: json_schema then JSON mode, or
+        [(None, {})] for plain text / when the model supports neither
+    """
+    if not json_schema:
+        return [(None, {})]
+    formats = [
+        ("json_schema", {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "analysis", "schema": json_schema, "strict": False}
+        }}),
+        ("json_mode", {"response_format": {"type": "json_object"}}),
+    ]
+    return [f for f in formats if _supports(provider, model, f[0]) is not False] or [(None, {})]
+
+
+def _get_capabilities_path() -> Path:
+    """
+    Resolve the capability table path from LLM_CAPABILITIES_PATH.
+
+    Returns:
+        Absolute path to the JSON file
+    """
+    path = Path(LLM_CAPABILITIES_PATH)
+    if not path.is_absolute():
+        path = Path(__file__).parent / path
+    return path
+
+
+def _load_capabilities() -> Dict[str, Dict[str, bool]]:
+    """Load the persisted capability table once. Caller must hold _capabilities_lock."""
+    global _capabilities
+
+    if _capabilities is None:
+        path = _get_capabilities_path()
+        try:
+            _capabilities = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+            logger.debug(f"Loaded LLM capabilities for {len(_capabilities)} models from {path}")
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"[CAPABILITY] ⚠ Could not read {path} ({str(e)}) - starting empty")
+            _capabilities = {}
+    return _capabilities
+
+
+def _supports(provider: str, model: str, feature: str) -> Optional[bool]:
+    """
+    Look up a feature in the capability table.
+
+    Args:
+        provider: "openai" or "groq"
+        model: Model name
+        feature: "json_mode", "json_schema" or "streaming"
+
+    Returns:
+        True/False once known, None if the feature hasn't been used with this model yet
+    """
+    with _capabilities_lock:
+        return _load_capabilities().get(f"{provider}:{model}", {}).get(feature)
+
+
+def _record_capabilities(
+    provider: str,
+    model: str,
+    features: List[Optional[str]],
+    supported: bool,
+    log_prefix: str = ""
+) -> None:
+    """
+    Record whether a model accepted features, persisting the table when it changes.
+
+    Args:
+        provider: "openai" or "groq"
+        model: Model name
+        features: Features the request used (None entries are ignored)
+        supported: True if the request succeeded, False if the model rejected the feature
+        log_prefix: Task log prefix
+    """
+    key = f"{provider}:{model}"
+    with _capabilities_lock:
+        table = _load_capabilities()
+        entry = table.setdefault(key, {})
+        changed = [f for f in features if f and entry.get(f) != supported]
+        if not changed:
+            return
+        for feature in changed:
+            entry[feature] = supported
+
+        path = _get_capabilities_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(table, indent=2, sort_keys=True), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning(f"[CAPABILITY] ⚠ Could not save {path}: {str(e)}")
+
+    if supported:
+        logger.debug(f"{log_prefix} [CAPABILITY] {key} supports {', '.join(changed)}")
+    else:
+        logger.info(f"{log_prefix} [CAPABILITY] {key} rejects {', '.join(changed)} - not requesting it again")
+
+
+def _rejects_feature(error: Exception, *params: str) -> bool:
+    """
+    Tell whether a 400 error rejects a request parameter, from the structured
+    "param" field of the error body (an oversized prompt, for example, names
+    "messages" and must not be remembered as a missing feature).
+
+    Args:
+        error: BadRequestError from the OpenAI/Groq SDK
+        *params: Request parameters naming the feature (e.g. "response_format")
+
+    Returns:
+        True if the error names one of the parameters
+    """
+    param = getattr(error, "param", None)
+    body = getattr(error, "body", None)
+    if param is None and isinstance(body, dict):
+        detail = body.get("error", body)
+        param = detail.get("param") if isinstance(detail, dict) else None
+    return param in params
+
+
+def _claim_probes(provider: str, model: str, features: List[str]) -> List[str]:
+    """
+    Pick the features a call should probe: unknown in the capability table and
+    not probed by this process yet.
+
+    Args:
+        provider: "openai" or "groq"
+        model: Model name
+        features: Features the call is about to use, in order of preference
+
+    Returns:
+        Features claimed for probing by this caller
+    """
+    key = f"{provider}:{model}"
+    with _capabilities_lock:
+        entry = _load_capabilities().get(key, {})
+        claimed = [feature for feature in features if entry.get(feature) is None and (key, feature) not in _probed]
+        _probed.update((key, feature) for feature in claimed)
+    return claimed
+
+
+def _probe_params(feature: str) -> Dict[str, Any]:
+    """Request kwargs that exercise one feature in a probe request."""
+    if feature == "streaming":
+        return {"stream": True}
+    if feature == "json_mode":
+        return {"response_format": {"type": "json_object"}}
+    return {"response_format": {
+        "type": "json_schema",
+        "json_schema": {"name": "probe", "schema": _PROBE_SCHEMA, "strict": False}
+    }}
+
+
+def _record_probe(provider: str, model: str, feature: str, error: Optional[Exception], log_prefix: str) -> None:
+    """
+    Record a probe outcome. A 400 on the minimal probe request can only come
+    from the feature itself; other errors (network, rate limit) are
+    inconclusive and leave the feature to be probed again.
+    """
+    if error is None:
+        _record_capabilities(provider, model, [feature], True, log_prefix)
+    elif isinstance(error, (OpenAIBadRequestError, GroqBadRequestError)):
+        _record_capabilities(provider, model, [feature], False, log_prefix)
+    else:
+        logger.debug(f"{log_prefix} [CAPABILITY] Probe of {feature} on {provider}:{model} inconclusive: {str(error)}")
+        with _capabilities_lock:
+            _probed.discard((f"{provider}:{model}", feature))
+
+
+def _probe_capabilities(client: Any, provider: str, model: str, features: List[str], log_prefix: str = "") -> None:
+    """
+    Probe features a model hasn't been used with yet, once per process, with a
+    tiny request each - so the first real batch on a new model doesn't pay for
+    a rejected request.
+
+    Args:
+        client: SDK client for the provider
+        provider: "openai" or "groq"
+        model: Model name
+        features: Features the call is about to use, in order of preference
+        log_prefix: Task log prefix
+    """
+    for feature in _claim_probes(provider, model, features):
+        if feature == "json_mode" and _supports(provider, model, "json_schema"):
+            continue  # Only needed as the fallback for json_schema
+        logger.info(f"{log_prefix} [CAPABILITY] Probing {feature} on {provider}:{model}")
+        error = None
+        try:
+            response = client.chat.completions.create(
+                model=model, messages=_PROBE_MESSAGES, timeout=_PROBE_TIMEOUT, **_probe_params(feature)
+            )
+            if feature == "streaming":
+                for _ in response:
+                    pass
+        except Exception as e:
+            error = e
+        _record_probe(provider, model, feature, error, log_prefix)
+
+
+async def _probe_capabilities_async(
+    client: Any,
+    provider: str,
+    model: str,
+    features: List[str],
+    log_prefix: str = ""
+) -> None:
+    """Async variant of _probe_capabilities (AsyncOpenAI / AsyncGroq client)."""
+    for feature in _claim_probes(provider, model, features):
+        if feature == "json_mode" and _supports(provider, model, "json_schema"):
+            continue  # Only needed as the fallback for json_schema
+        logger.info(f"{log_prefix} [CAPABILITY] Probing {feature} on {provider}:{model}")
+        error = None
+        try:
+            response = await client.chat.completions.create(
+                model=model, messages=_PROBE_MESSAGES, timeout=_PROBE_TIMEOUT, **_probe_params(feature)
+            )
+            if feature == "streaming":
+                async for _ in response:
+                    pass
+        except Exception as e:
+            error = e
+        _record_probe(provider, model, feature, error, log_prefix)
+
+
+def get_capabilities() -> Dict[str, Dict[str, bool]]:
+    """
+    Get the capability table (features known to work or fail per provider:model).
+
+    Returns:
+        Dictionary {provider:model: {feature: supported}}
+    """
+    with _capabilities_lock:
+        return {key: dict(entry) for key, entry in _load_capabilities().items()}
+
+
+def _parse_messages(markdown_text: str) -> List[Dict[str, str]]:
+    """Build the chat messages for the markdown → JSON parsing call."""
+    user_prompt = f"Convert this markdown to structured JSON (output ONLY the JSON, no markdown formatting):\n\n{markdown_text}"
+    return [
+        {"role": "system", "content": _PARSE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _validate_parsed_json(result: str, markdown_text: str, log_prefix: str) -> str:
+    """
+    Extract and validate the parsing LLM's JSON output.
+
+    Args:
+        result: Raw parsing LLM output
+        markdown_text: Original markdown (returned if the output is not valid JSON)
+        log_prefix: Task log prefix
+
+    Returns:
+        JSON string, or the original markdown if no valid JSON was produced
+    """
+    # Log raw parsing LLM output before post-processing
+    logger.debug(f"{log_prefix} Raw parsing LLM output (before extraction): {result[:500]}...")
+
+    # Post-process: Extract JSON from markdown code blocks if present
+    result = _extract_json_from_text(result)
+
+    # Log after extraction
+    logger.debug(f"{log_prefix} After extraction: {result[:500]}...")
+
+    # Validate that it's valid JSON
+    try:
+        json.loads(result)  # Validate JSON
+        logger.info(f"{log_prefix} Parsing completed successfully - valid JSON")
+    except json.JSONDecodeError as e:
+        logger.warning(f"{log_prefix} Parsed output is not valid JSON: {e}")
+        logger.debug(f"{log_prefix} Invalid JSON output: {result[:200]}...")
+        # Return original markdown if JSON is invalid
+        return markdown_text
+
+    logger.debug(f"{log_prefix} Output length: {len(result)} chars")
+    return result
+
+
 def _extract_json_from_text(text: str) -> str:
     """
     Extract JSON from text that might contain markdown code blocks or extra text.
@@ -257,8 +2009,6 @@ def _extract_json_from_text(text: str) -> str:
     Returns:
         Extracted JSON string
     """
-    import re
-
     # Remove markdown code blocks (```json ... ``` or ``` ... ```)
     json_block_pattern = r'```(?:json)?\s*\n?(.*?)\n?```'
     match = re.search(json_block_pattern, text, re.DOTALL)
@@ -277,6 +2027,32 @@ def _extract_json_from_text(text: str) -> str:
     return text.strip()
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Token count (exact with tiktoken, else a chars-per-token estimate)
+    """
+    global _token_encoder
+
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding(LLM_TOKEN_ENCODING)
+            logger.debug(f"Token estimates use tiktoken {LLM_TOKEN_ENCODING}")
+        except Exception as e:
+            _token_encoder = False
+            logger.debug(f"tiktoken unavailable ({str(e)}) - estimating {LLM_CHARS_PER_TOKEN} chars per token")
+
+    if _token_encoder:
+        return len(_token_encoder.encode(text, disallowed_special=()))
+    return int(len(text) / LLM_CHARS_PER_TOKEN) + 1
+
+
 def test_llm_connection() -> Dict[str, str]:
     """
     Test LLM connection with a simple prompt.
@@ -289,13 +2065,14 @@ def test_llm_connection() -> Dict[str, str]:
         Exception: If connection test fails
     """
     try:
-        config = _get_provider_config()
+        config = _get_provider_chain()[0]
         logger.info(f"Testing LLM connection - provider={config['provider']}, model={config['model']}")
 
         response = analyze_with_llm(
             system_prompt="You are a helpful assistant.",
             user_prompt="Respond with 'OK' if you can read this.",
-            task_id="connection-test"
+            task_id="connection-test",
+            use_cache=False  # A cached "OK" would hide a revoked key or an outage
         )
 
         return {
@@ -33,6 +33,8 @@ if not API_KEY:
 # Internal service imports
 import workflow
 import task_manager
+import llm_cache
+import llm_service
 
 # Configure logging without timestamps (cleaner output)
 # Read log level from environment (DEBUG, INFO, WARNING, ERROR)
@@ -51,6 +53,7 @@ class AnalysisRequest(BaseModel):
     sender_id: str
     email_limit: int = 50
     batch_size: int = 5
+    batch_concurrency: Optional[int] = None  # Batches in flight at once (default: WORKFLOW_BATCH_CONCURRENCY)
 
 
 class AnalysisResponse(BaseModel):
@@ -66,6 +69,8 @@ class TaskStatusResponse(BaseModel):
     status: str
     progress: str
     results: List[Dict]
+    partial_results: List[Dict] = []  # Streamed markdown of batches still being analyzed
+    llm_usage: Optional[Dict] = None  # Token usage incl. prompt-cached tokens (set when the task finishes)
     error: Optional[str] = None
 
 
@@ -77,6 +82,7 @@ class Sender(BaseModel):
     description: str
     expected_volume: str
     prompt_key: str
+    metadata_stripper: str = "llm"  # "llm" or "rules" (LLM Call #1 replaced by local rules)
 
 
 class SendersResponse(BaseModel):
@@ -193,15 +199,22 @@ async def start_analysis(request: AnalysisRequest, background_tasks: BackgroundT
             batch_size=request.batch_size
         )
 
-        # Add background task (truly non-blocking)
+        # Add background task (truly non-blocking) - the async workflow runs on the
+        # event loop, the sync one in the threadpool
+        run_workflow = (
+            workflow.run_analysis_workflow_async if workflow.WORKFLOW_ASYNC
+            else workflow.run_analysis_workflow
+        )
         background_tasks.add_task(
-            workflow.run_analysis_workflow,
+            run_workflow,
             task_id=task_id,
             sender_id=sender["id"],
             sender_email=sender["email"],
             prompt_key=sender["prompt_key"],
             email_limit=request.email_limit,
-            batch_size=request.batch_size
+            batch_size=request.batch_size,
+            batch_concurrency=request.batch_concurrency,
+            metadata_stripper=sender.get("metadata_stripper", "llm")
         )
 
         logger.info(f"Analysis started: task_id={task_id}")
@@ -249,6 +262,11 @@ async def get_task_status(task_id: str) -> TaskStatusResponse:
         status=task["status"],
         progress=task["progress"],
         results=task["results"],
+        partial_results=[
+            {"batch_number": batch_number, "raw_markdown": markdown}
+            for batch_number, markdown in sorted(task.get("partial_results", {}).items())
+        ],
+        llm_usage=task.get("llm_usage"),
         error=task.get("error")
     )
 
@@ -302,6 +320,7 @@ async def get_all_tasks():
                 "email_limit": task["email_limit"],
                 "batch_size": task["batch_size"],
                 "result_count": len(task["results"]),
+                "llm_usage": task.get("llm_usage"),
             }
             for task in tasks
         ]
@@ -314,6 +333,39 @@ async def get_all_tasks():
         raise HTTPException(status_code=500, detail=f"Failed to get tasks: {str(e)}")
 
 
+@app.get("/api/llm-cache")
+async def get_llm_cache_stats() -> Dict:
+    """
+    Get LLM response cache counters (hits per tier, misses, evictions).
+
+    Returns:
+        Cache statistics since startup
+    """
+    logger.info("GET /api/llm-cache")
+    return llm_cache.get_stats()
+
+
+@app.get("/api/llm-metrics")
+async def get_llm_metrics() -> Dict:
+    """
+    Get LLM call reliability counters (calls, retries per reason, recovered/failed calls),
+    rate limiter queueing per provider:model, provider health (circuit state, hedges, latency)
+    the learned capability table (JSON mode / structured output / streaming per model)
+    and token usage with the share of prompt tokens served from provider prompt caches.
+
+    Returns:
+        Metrics since startup
+    """
+    logger.info("GET /api/llm-metrics")
+    return {
+        "retries": llm_service.get_retry_stats(),
+        "rate_limits": llm_service.get_rate_limit_stats(),
+        "providers": llm_service.get_provider_stats(),
+        "capabilities": llm_service.get_capabilities(),
+        "usage": llm_service.get_usage_stats(),
+    }
+
+
 @app.get("/health")
 async def health_check() -> Dict[str, str]:
     """
@@ -0,0 +1,395 @@
+"""
+Local markdown-to-JSON parser for analysis output (replaces LLM Call #3).
+Turns the "# SECTION / ## Opportunity N / - Field: value" markdown that the
+prompts in config/prompts.yaml ask for into {"sections": [...]} without an
+API call. The prompt's "# Output Format" block is parsed the same way and
+used as the schema: output with unknown sections or too few of the expected
+fields is rejected so the caller can fall back to the LLM parse.
+
+The same schema drives structured-output analysis (prompts with
+structured_output: true): get_json_schema / structured_output_prompt ask the
+analysis model for JSON directly and parse_structured validates its answer.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import prompts
+
+# Configure logging for parsing
+logger = logging.getLogger(__name__)
+
+# Share of the schema's fields an item must contain to count as valid
+_MIN_FIELD_COVERAGE = 0.5
+
+_SECTION_RE = re.compile(r"^#\s+(.+?)\s*#*$")
+_ITEM_RE = re.compile(r"^#{2,6}\s+(.+?)\s*#*$")
+_FIELD_RE = re.compile(r"^[-*+]\s+(?:\*\*)?([A-Za-z][\w /&()'’-]{0,50}?)(?:\*\*)?\s*:(?:\*\*)?\s*(.*)$")
+_BULLET_RE = re.compile(r"^(?:[-*+]|\d+[.)])\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\d+)[.)]\s+(.+)$")
+_NUMBERED_LINK_RE = re.compile(r"^(.+?)\s+[-–—]\s+(\S+)$")
+_MARKDOWN_LINK_RE = re.compile(r"^\[([^\]]*)\]\((\S+?)\)$")
+_RULE_RE = re.compile(r"^(?:-{3,}|\*{3,}|_{3,}|```\w*)$")
+_PLACEHOLDER_RE = re.compile(r"^\[[^\]]*\]$")
+_SECTION_PREFIX_RE = re.compile(r"^SECTION\s+\d+\s*[:.\-–—]?\s*", re.IGNORECASE)
+
+# Output Format block in a system prompt, up to the first bold-only line after it
+_OUTPUT_FORMAT_RE = re.compile(r"^#\s+Output Format\s*$", re.MULTILINE)
+_OUTPUT_FORMAT_END_RE = re.compile(r"^\*\*[^*]+\*\*:?\s*$", re.MULTILINE)
+
+# {prompt_key: (system_prompt, schema)} - rebuilt if the prompt text changes
+_schema_cache: Dict[str, Tuple[str, Dict[str, Dict[str, Any]]]] = {}
+
+
+def parse_markdown(markdown_text: str, prompt_key: Optional[str] = None, log_prefix: str = "") -> Optional[str]:
+    """
+    Parse analysis markdown to the {"sections": [...]} JSON shape.
+
+    Args:
+        markdown_text: Markdown formatted analysis from main LLM
+        prompt_key: Prompt whose Output Format is used as the schema (None: structure checks only)
+        log_prefix: Task log prefix
+
+    Returns:
+        JSON string, or None if the markdown does not validate against the schema
+    """
+    sections, unparsed = _parse_sections(markdown_text)
+
+    try:
+        schema = _get_schema(prompt_key) if prompt_key else {}
+    except Exception as e:
+        logger.warning(f"{log_prefix} [PARSE] ⚠ Could not load schema for {prompt_key}: {str(e)}")
+        schema = {}
+
+    problem = _validate(sections, unparsed, schema)
+    if problem:
+        logger.info(f"{log_prefix} [PARSE] Local parse rejected: {problem}")
+        return None
+
+    sections = [section for section in sections if section["opportunities"]]
+    items = sum(len(section["opportunities"]) for section in sections)
+    logger.info(f"{log_prefix} [PARSE] ✓ Local parse: {len(sections)} sections, {items} items")
+    return json.dumps({"sections": sections}, ensure_ascii=False)
+
+
+def get_json_schema(prompt_key: str) -> Dict[str, Any]:
+    """
+    Build the JSON Schema for structured-output analysis from a prompt's Output Format.
+
+    Args:
+        prompt_key: Prompt key in config/prompts.yaml
+
+    Returns:
+        JSON Schema for {"sections": [{"title", "opportunities": [...]}]}
+    """
+    titles = [section["title"] for section in _get_schema(prompt_key).values()]
+    value_schema = {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]}
+    title_schema: Dict[str, Any] = {"type": "string"}
+    if titles:
+        title_schema["enum"] = titles
+
+    return {
+        "type": "object",
+        "properties": {
+            "sections": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "title": title_schema,
+                        "opportunities": {
+                            "type": "array",
+                            "items": {"type": "object", "additionalProperties": value_schema},
+                        },
+                    },
+                    "required": ["title", "opportunities"],
+                },
+            },
+        },
+        "required": ["sections"],
+    }
+
+
+def structured_output_prompt(prompt_key: str) -> str:
+    """
+    Build the system prompt addendum that asks for JSON instead of markdown.
+
+    Args:
+        prompt_key: Prompt key in config/prompts.yaml
+
+    Returns:
+        Instructions listing every section title and its field keys
+    """
+    lines = [
+        "# JSON Output",
+        "Ignore the markdown Output Format above. Return the same analysis as ONE JSON object "
+        '(no markdown, no code blocks): {"sections": [{"title": "...", "opportunities": [{...}]}]}.',
+        "Use exactly these section titles and item keys (keys marked [] are arrays of strings, "
+        "all others are strings). Omit sections with no items.",
+    ]
+    for section in _get_schema(prompt_key).values():
+        keys = ", ".join(f"{key}[]" if is_list else key for key, is_list in section["fields"].items())
+        lines.append(f'- "{section["title"]}": {keys}')
+    return "\n".join(lines)
+
+
+def parse_structured(text: str, prompt_key: Optional[str] = None, log_prefix: str = "") -> Optional[str]:
+    """
+    Validate structured-output analysis JSON against the prompt's schema.
+
+    Args:
+        text: Analysis model output (JSON, possibly inside a code block)
+        prompt_key: Prompt whose Output Format is used as the schema
+        log_prefix: Task log prefix
+
+    Returns:
+        Normalized JSON string, or None if the output does not validate
+    """
+    fence = re.search(r"```(?:json)?\s*\n?(.*?)\n?```", text, re.DOTALL)
+    try:
+        data = json.loads(fence.group(1) if fence else text)
+    except json.JSONDecodeError as e:
+        logger.info(f"{log_prefix} [PARSE] Structured output rejected: invalid JSON ({str(e)})")
+        return None
+
+    raw_sections = data.get("sections") if isinstance(data, dict) else None
+    if not isinstance(raw_sections, list):
+        logger.info(f"{log_prefix} [PARSE] Structured output rejected: no sections list")
+        return None
+
+    sections = []
+    for raw_section in raw_sections:
+        if not isinstance(raw_section, dict) or not isinstance(raw_section.get("opportunities", []), list):
+            logger.info(f"{log_prefix} [PARSE] Structured output rejected: malformed section")
+            return None
+        items = []
+        for raw_item in raw_section.get("opportunities", []):
+            if not isinstance(raw_item, dict):
+                logger.info(f"{log_prefix} [PARSE] Structured output rejected: malformed item")
+                return None
+            item = {}
+            for key, value in raw_item.items():
+                key = _field_key(str(key))
+                if isinstance(value, list):
+                    item[key] = [str(entry) for entry in value]
+                else:
+                    item[key] = _clean_value(key, "" if value is None else str(value))
+            items.append(item)
+        sections.append({"title": str(raw_section.get("title", "")).strip(), "opportunities": items})
+
+    if not any(section["opportunities"] for section in sections):
+        # Unlike markdown, an empty JSON answer is unambiguous - nothing relevant found
+        logger.info(f"{log_prefix} [PARSE] ✓ Structured output valid: no items")
+        return json.dumps({"sections": []})
+
+    try:
+        schema = _get_schema(prompt_key) if prompt_key else {}
+    except Exception as e:
+        logger.warning(f"{log_prefix} [PARSE] ⚠ Could not load schema for {prompt_key}: {str(e)}")
+        schema = {}
+
+    problem = _validate(sections, 0, schema)
+    if problem:
+        logger.info(f"{log_prefix} [PARSE] Structured output rejected: {problem}")
+        return None
+
+    sections = [section for section in sections if section["opportunities"]]
+    items = sum(len(section["opportunities"]) for section in sections)
+    logger.info(f"{log_prefix} [PARSE] ✓ Structured output valid: {len(sections)} sections, {items} items")
+    return json.dumps({"sections": sections}, ensure_ascii=False)
+
+
+def _parse_sections(markdown_text: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Split markdown into sections and items.
+
+    Args:
+        markdown_text: Markdown to parse
+
+    Returns:
+        Tuple of (sections, number of item lines outside any section)
+    """
+    sections: List[Dict[str, Any]] = []
+    section: Optional[Dict[str, Any]] = None
+    item: Optional[Dict[str, Any]] = None
+    last_key: Optional[str] = None
+    unparsed = 0
+
+    for raw_line in markdown_text.splitlines():
+        line = raw_line.strip()
+        indented = raw_line[:1].isspace()
+        if not line or _RULE_RE.match(line) or _PLACEHOLDER_RE.match(line):
+            continue
+
+        match = _SECTION_RE.match(line)
+        if match:
+            section = {"title": _clean_text(match.group(1)), "opportunities": []}
+            sections.append(section)
+            item, last_key = None, None
+            continue
+
+        match = _ITEM_RE.match(line)
+        if match:
+            if section is None:
+                unparsed += 1
+                continue
+            item, last_key = {}, None
+            section["opportunities"].append(item)
+            continue
+
+        if section is None:
+            continue  # Preamble before the first section
+
+        # Numbered list section (e.g. "1. Thread title - https://...")
+        match = _NUMBERED_RE.match(line)
+        if match and item is None:
+            section["opportunities"].append(_numbered_item(match.group(1), match.group(2)))
+            continue
+
+        if item is None:
+            continue  # Section notes ("No relevant posts found")
+
+        match = _FIELD_RE.match(line)
+        if match and not indented:
+            last_key = _field_key(match.group(1))
+            item[last_key] = _clean_value(last_key, match.group(2))
+            continue
+
+        match = _BULLET_RE.match(line)
+        text = _clean_text(match.group(1) if match else line)
+        if last_key is None:
+            last_key = "details"
+            item[last_key] = ""
+
+        value = item[last_key]
+        if match:
+            # Nested bullets under a field become a list
+            item[last_key] = (value if isinstance(value, list) else ([value] if value else [])) + [text]
+        elif isinstance(value, list):
+            value.append(text)
+        else:
+            item[last_key] = f"{value}\n{text}" if value else text
+
+    return sections, unparsed
+
+
+def _numbered_item(number: str, text: str) -> Dict[str, str]:
+    """Build an item from a numbered list line ("Title - link")."""
+    text = _clean_text(text)
+    match = _MARKDOWN_LINK_RE.match(text)
+    if match:
+        return {"number": number, "title": match.group(1), "link": match.group(2)}
+    match = _NUMBERED_LINK_RE.match(text)
+    if match:
+        return {"number": number, "title": _clean_text(match.group(1)), "link": _clean_value("link", match.group(2))}
+    return {"number": number, "title": text}
+
+
+def _field_key(name: str) -> str:
+    """Normalize a field name ("Comment Draft 1" → "comment_draft_1")."""
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def _clean_text(text: str) -> str:
+    """Strip markdown emphasis around a whole value."""
+    text = text.strip()
+    while len(text) > 4 and text.startswith("**") and text.endswith("**"):
+        text = text[2:-2].strip()
+    return text
+
+
+def _clean_value(key: str, value: str) -> str:
+    """Clean a field value; link fields are reduced to the bare URL."""
+    value = _clean_text(value)
+    if "link" in key:
+        match = _MARKDOWN_LINK_RE.match(value)
+        if match:
+            value = match.group(2)
+        value = value.strip("<>")
+    return value
+
+
+def _section_name(title: str) -> str:
+    """Comparable section name (drops "SECTION N:", emojis and punctuation)."""
+    title = _SECTION_PREFIX_RE.sub("", title)
+    return " ".join(re.findall(r"[A-Z0-9]+", title.upper()))
+
+
+def _get_schema(prompt_key: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Build the expected sections and fields from a prompt's Output Format.
+
+    Args:
+        prompt_key: Prompt key in config/prompts.yaml
+
+    Returns:
+        Dictionary {section name: {"title": header text, "fields": {field key: True if a list}}}
+        in Output Format order (empty if the prompt has no Output Format)
+    """
+    system_prompt = prompts.get_prompt(prompt_key)["system_prompt"]
+    cached = _schema_cache.get(prompt_key)
+    if cached and cached[0] == system_prompt:
+        return cached[1]
+
+    schema: Dict[str, Dict[str, Any]] = {}
+    match = _OUTPUT_FORMAT_RE.search(system_prompt)
+    if match:
+        template = system_prompt[match.end():]
+        end = _OUTPUT_FORMAT_END_RE.search(template)
+        if end:
+            template = template[:end.start()]
+        sections, _ = _parse_sections(template)
+        for section in sections:
+            fields: Dict[str, bool] = {}
+            for item in section["opportunities"]:
+                for key, value in item.items():
+                    if key != "details":
+                        fields[key] = fields.get(key, False) or isinstance(value, list)
+            schema[_section_name(section["title"])] = {"title": section["title"], "fields": fields}
+
+    _schema_cache[prompt_key] = (system_prompt, schema)
+    return schema
+
+
+def _validate(sections: List[Dict[str, Any]], unparsed: int, schema: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """
+    Check parsed sections against the schema.
+
+    Args:
+        sections: Parsed sections
+        unparsed: Item headers found outside any section
+        schema: Expected sections from _get_schema ({} = structure checks only)
+
+    Returns:
+        Reason the parse is rejected, or None if it is valid
+    """
+    if not sections:
+        return "no sections found"
+    if unparsed:
+        return f"{unparsed} item(s) outside any section"
+    if not any(section["opportunities"] for section in sections):
+        return "no items found"
+
+    for section in sections:
+        for item in section["opportunities"]:
+            if not item or set(item) == {"details"}:
+                return f"item without fields in '{section['title']}'"
+
+        if not schema:
+            continue
+
+        name = _section_name(section["title"])
+        if name not in schema:
+            return f"unexpected section '{section['title']}'"
+
+        expected = set(schema[name]["fields"])
+        if not expected:
+            continue
+        for item in section["opportunities"]:
+            coverage = len(expected & set(item)) / len(expected)
+            if coverage < _MIN_FIELD_COVERAGE:
+                return f"item in '{section['title']}' has {coverage:.0%} of the expected fields"
+
+    return None
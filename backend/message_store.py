@@ -0,0 +1,245 @@
+"""
+Persistent local store of already-fetched Gmail messages.
+SQLite-backed cache keyed by message_id, with each thread's historyId so
+repeated analyses only download new or changed threads, and per-message
+metadata-stripped text so reruns skip LLM Call #1 for messages seen before.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Configure logging for store operations
+logger = logging.getLogger(__name__)
+
+# SQLite file location (relative paths resolve against the backend directory)
+MESSAGE_STORE_PATH = os.getenv("MESSAGE_STORE_PATH", "data/message_store.db")
+
+# Serialize writes and one-time schema creation across worker threads
+_lock = threading.RLock()
+_initialized = False
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    sender_email TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (thread_id);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    sender_email TEXT NOT NULL,
+    history_id TEXT,
+    body_version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+-- Superseded by stripped_texts (its entries were keyed by strip prompt only)
+DROP TABLE IF EXISTS stripped_messages;
+CREATE TABLE IF NOT EXISTS stripped_texts (
+    message_id TEXT PRIMARY KEY,
+    strip_key TEXT NOT NULL,
+    cleaned TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+-- Per-sender history.list cursors are no longer used (per-thread historyIds decide reuse)
+DROP TABLE IF EXISTS sync_state;
+"""
+
+
+def _get_store_path() -> Path:
+    """
+    Resolve the SQLite file path from MESSAGE_STORE_PATH.
+
+    Returns:
+        Absolute path to the store file
+    """
+    path = Path(MESSAGE_STORE_PATH)
+    if not path.is_absolute():
+        path = Path(__file__).parent / path
+    return path
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """
+    Open a short-lived connection, creating the schema on first use.
+
+    Yields:
+        SQLite connection (committed on successful exit)
+    """
+    global _initialized
+
+    path = _get_store_path()
+    if not _initialized:
+        with _lock:
+            if not _initialized:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with sqlite3.connect(path) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                _initialized = True
+                logger.info(f"[STORE] Message store ready at {path}")
+
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_threads(thread_ids: List[str], body_version: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Load stored threads and their messages.
+    Threads stored with a different body_version are treated as missing.
+
+    Args:
+        thread_ids: Thread IDs to look up
+        body_version: Current message body extraction version
+
+    Returns:
+        Dictionary {thread_id: {"history_id": str, "messages": [message dicts]}}
+    """
+    if not thread_ids:
+        return {}
+
+    found: Dict[str, Dict[str, Any]] = {}
+    with _connect() as conn:
+        # Chunk to stay under SQLite's bound-parameter limit
+        for start in range(0, len(thread_ids), 500):
+            chunk = thread_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for thread_id, history_id in conn.execute(
+                f"SELECT thread_id, history_id FROM threads "
+                f"WHERE body_version = ? AND thread_id IN ({placeholders})",
+                [body_version, *chunk]
+            ):
+                found[thread_id] = {"history_id": history_id, "messages": []}
+
+            for thread_id, data in conn.execute(
+                f"SELECT thread_id, data FROM messages WHERE thread_id IN ({placeholders})",
+                chunk
+            ):
+                if thread_id in found:
+                    found[thread_id]["messages"].append(json.loads(data))
+
+    for thread in found.values():
+        thread["messages"].sort(key=lambda m: m.get("message_number", 1))
+
+    return found
+
+
+def save_thread(
+    sender_email: str,
+    thread_id: str,
+    history_id: Optional[str],
+    messages: List[Dict[str, Any]],
+    body_version: int
+) -> None:
+    """
+    Store (or replace) a thread and all of its messages.
+
+    Args:
+        sender_email: Sender the thread was fetched for
+        thread_id: Gmail thread ID
+        history_id: Thread historyId at fetch time
+        messages: Individual message dictionaries from the thread
+        body_version: Message body extraction version used
+    """
+    now = datetime.now().isoformat()
+    with _lock, _connect() as conn:
+        conn.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO messages (message_id, thread_id, sender_email, data, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (msg["message_id"], thread_id, sender_email, json.dumps(msg, ensure_ascii=False), now)
+                for msg in messages
+            ]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO threads (thread_id, sender_email, history_id, body_version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (thread_id, sender_email, history_id, body_version, now)
+        )
+
+
+def get_stripped(strip_keys: Dict[str, str]) -> Dict[str, str]:
+    """
+    Load metadata-stripped text for messages cleaned before.
+    Text stored under a different strip key (other prompt, body, body format
+    or model) is treated as missing.
+
+    Args:
+        strip_keys: Dictionary {message_id: strip key of the current body}
+
+    Returns:
+        Dictionary {message_id: cleaned text} for the messages found
+    """
+    if not strip_keys:
+        return {}
+
+    message_ids = list(strip_keys)
+    found: Dict[str, str] = {}
+    with _connect() as conn:
+        # Chunk to stay under SQLite's bound-parameter limit
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for message_id, strip_key, cleaned in conn.execute(
+                f"SELECT message_id, strip_key, cleaned FROM stripped_texts WHERE message_id IN ({placeholders})",
+                chunk
+            ):
+                if strip_key == strip_keys[message_id]:
+                    found[message_id] = cleaned
+    return found
+
+
+def save_stripped(cleaned: Dict[str, str], strip_keys: Dict[str, str]) -> None:
+    """
+    Store metadata-stripped text per message (replaces text stored under an older key).
+
+    Args:
+        cleaned: Dictionary {message_id: cleaned text}
+        strip_keys: Dictionary {message_id: strip key the text was produced for}
+    """
+    if not cleaned:
+        return
+
+    now = datetime.now().isoformat()
+    with _lock, _connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO stripped_texts (message_id, strip_key, cleaned, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            [(message_id, strip_keys[message_id], text, now) for message_id, text in cleaned.items()]
+        )
+
+
+def clear(sender_email: Optional[str] = None) -> None:
+    """
+    Delete stored messages (forces a full sync next time).
+
+    Args:
+        sender_email: Only clear this sender (clears everything if omitted)
+    """
+    with _lock, _connect() as conn:
+        if sender_email:
+            conn.execute(
+                "DELETE FROM stripped_texts WHERE message_id IN "
+                "(SELECT message_id FROM messages WHERE sender_email = ?)",
+                (sender_email,)
+            )
+            for table in ("messages", "threads"):
+                conn.execute(f"DELETE FROM {table} WHERE sender_email = ?", (sender_email,))
+        else:
+            for table in ("messages", "threads", "stripped_texts"):
+                conn.execute(f"DELETE FROM {table}")
+    logger.info(f"[STORE] Cleared message store{f' for {sender_email}' if sender_email else ''}")
@@ -61,7 +61,8 @@ def get_prompt(prompt_key: str) -> Dict[str, str]:
         prompt_key: Prompt identifier (e.g., "f5bot_reddit", "haro_opportunities")
 
     Returns:
-        Dictionary with "system_prompt" and "user_prompt" keys
+        Dictionary with "system_prompt", "user_prompt", "structured_output" and
+        "batch_token_budget" (0 if unset) keys
 
     Raises:
         KeyError: If prompt_key not found in configuration
@@ -80,6 +81,8 @@ def get_prompt(prompt_key: str) -> Dict[str, str]:
     return {
         "system_prompt": prompt_data.get("system_prompt", ""),
         "user_prompt": prompt_data.get("user_prompt", ""),
+        "structured_output": bool(prompt_data.get("structured_output", False)),
+        "batch_token_budget": int(prompt_data.get("batch_token_budget") or 0),
     }
 
 
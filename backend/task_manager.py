@@ -4,6 +4,8 @@ Manages analysis tasks and their results without database persistence.
 """
 
 import logging
+import threading
+from bisect import bisect_right
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import uuid
@@ -14,6 +16,9 @@ logger = logging.getLogger(__name__)
 # In-memory storage: {task_id: task_data}
 _tasks: Dict[str, Dict[str, Any]] = {}
 
+# Guards _tasks - batches of one task report results from several worker threads
+_lock = threading.RLock()
+
 
 def create_task(sender_id: str, email_limit: int, batch_size: int) -> str:
     """
@@ -29,7 +34,7 @@ def create_task(sender_id: str, email_limit: int, batch_size: int) -> str:
     """
     task_id = str(uuid.uuid4())
 
-    _tasks[task_id] = {
+    task = {
         "task_id": task_id,
         "sender_id": sender_id,
         "email_limit": email_limit,
@@ -37,10 +42,13 @@ def create_task(sender_id: str, email_limit: int, batch_size: int) -> str:
         "status": "processing",  # processing, completed, failed
         "progress": "0/0",
         "results": [],
+        "partial_results": {},  # {batch_number: markdown streamed so far} for batches in flight
         "error": None,
         "created_at": datetime.now(),
         "updated_at": datetime.now(),
     }
+    with _lock:
+        _tasks[task_id] = task
 
     logger.info(f"Task created: {task_id}")
     logger.debug(f"[{task_id}] Sender={sender_id}, limit={email_limit}, batch={batch_size}")
@@ -58,11 +66,16 @@ def get_task(task_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         Task data dictionary or None if not found
     """
-    task = _tasks.get(task_id)
+    with _lock:
+        task = _tasks.get(task_id)
 
-    if task:
-        # Return copy to prevent external modifications
-        return task.copy()
+        if task:
+            # Return copy to prevent external modifications (results list included,
+            # so callers never see it change mid-iteration)
+            task_copy = task.copy()
+            task_copy["results"] = list(task["results"])
+            task_copy["partial_results"] = dict(task["partial_results"])
+            return task_copy
 
     logger.warning(f"[{task_id}] Task not found")
     return None
@@ -79,16 +92,17 @@ def update_task(task_id: str, **updates) -> bool:
     Returns:
         True if updated, False if task not found
     """
-    if task_id not in _tasks:
-        logger.warning(f"[{task_id}] Cannot update - task not found")
-        return False
+    with _lock:
+        if task_id not in _tasks:
+            logger.warning(f"[{task_id}] Cannot update - task not found")
+            return False
 
-    # Update specified fields
-    for key, value in updates.items():
-        _tasks[task_id][key] = value
+        # Update specified fields
+        for key, value in updates.items():
+            _tasks[task_id][key] = value
 
-    # Always update timestamp
-    _tasks[task_id]["updated_at"] = datetime.now()
+        # Always update timestamp
+        _tasks[task_id]["updated_at"] = datetime.now()
 
     logger.debug(f"[{task_id}] Updated: {', '.join(updates.keys())}")
 
@@ -97,23 +111,81 @@ def update_task(task_id: str, **updates) -> bool:
 
 def add_result(task_id: str, result: Dict[str, Any]) -> bool:
     """
-    Append a result to task's results list.
+    Add a result to task's results list, keeping it sorted by batch_number.
+    Batches may finish out of order when processed in parallel.
 
     Args:
         task_id: Unique task identifier
-        result: Result dictionary to append
+        result: Result dictionary to add
 
     Returns:
         True if added, False if task not found
     """
-    if task_id not in _tasks:
-        logger.warning(f"[{task_id}] Cannot add result - task not found")
-        return False
+    with _lock:
+        if task_id not in _tasks:
+            logger.warning(f"[{task_id}] Cannot add result - task not found")
+            return False
+
+        results = _tasks[task_id]["results"]
+        position = bisect_right(
+            [r.get("batch_number", 0) for r in results],
+            result.get("batch_number", 0)
+        )
+        results.insert(position, result)
+        _tasks[task_id]["partial_results"].pop(result.get("batch_number", 0), None)  # Finalized
+        _tasks[task_id]["updated_at"] = datetime.now()
+        total = len(results)
+
+    logger.debug(f"[{task_id}] Added result at position {position} (total: {total})")
+
+    return True
+
+
+def set_partial_result(task_id: str, batch_number: int, markdown: str) -> bool:
+    """
+    Store the analysis markdown streamed so far for a batch in flight.
+    Replaced by the batch's result in add_result.
+
+    Args:
+        task_id: Unique task identifier
+        batch_number: Batch the partial output belongs to
+        markdown: Response text received so far
+
+    Returns:
+        True if stored, False if task not found
+    """
+    with _lock:
+        if task_id not in _tasks:
+            return False
+
+        _tasks[task_id]["partial_results"][batch_number] = markdown
+        _tasks[task_id]["updated_at"] = datetime.now()
+
+    return True
+
+
+def update_results(task_id: str, **updates) -> bool:
+    """
+    Update fields on every stored result of a task (e.g. total_batches once
+    a streamed task knows its final batch count).
+
+    Args:
+        task_id: Unique task identifier
+        **updates: Key-value pairs to set on each result
+
+    Returns:
+        True if updated, False if task not found
+    """
+    with _lock:
+        if task_id not in _tasks:
+            logger.warning(f"[{task_id}] Cannot update results - task not found")
+            return False
 
-    _tasks[task_id]["results"].append(result)
-    _tasks[task_id]["updated_at"] = datetime.now()
+        for result in _tasks[task_id]["results"]:
+            result.update(updates)
+        _tasks[task_id]["updated_at"] = datetime.now()
 
-    logger.debug(f"[{task_id}] Added result (total: {len(_tasks[task_id]['results'])})")
+    logger.debug(f"[{task_id}] Updated results: {', '.join(updates.keys())}")
 
     return True
 
@@ -131,15 +203,16 @@ def cleanup_old_tasks(hours: int = 24) -> int:
     cutoff_time = datetime.now() - timedelta(hours=hours)
     tasks_to_delete = []
 
-    # Find old tasks
-    for task_id, task_data in _tasks.items():
-        if task_data["created_at"] < cutoff_time:
-            tasks_to_delete.append(task_id)
+    with _lock:
+        # Find old tasks
+        for task_id, task_data in _tasks.items():
+            if task_data["created_at"] < cutoff_time:
+                tasks_to_delete.append(task_id)
 
-    # Delete old tasks
-    for task_id in tasks_to_delete:
-        del _tasks[task_id]
-        logger.debug(f"[{task_id}] Deleted - older than {hours} hours")
+        # Delete old tasks
+        for task_id in tasks_to_delete:
+            del _tasks[task_id]
+            logger.debug(f"[{task_id}] Deleted - older than {hours} hours")
 
     if tasks_to_delete:
         logger.info(f"Cleanup complete: {len(tasks_to_delete)} tasks deleted")
@@ -154,4 +227,5 @@ def get_all_tasks() -> List[Dict[str, Any]]:
     Returns:
         List of all task data dictionaries
     """
-    return [task.copy() for task in _tasks.values()]
+    with _lock:
+        return [task.copy() for task in _tasks.values()]
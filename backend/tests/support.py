@@ -0,0 +1,175 @@
+"""
+Shared setup for the backend unit tests.
+
+Importing this module points the backend at test configuration (fake API
+keys, no provider chain) and puts backend/ on sys.path. use_temp_stores()
+gives a test its own SQLite stores and capability file; FakeGmail is an
+in-process stand-in for the Gmail API service object.
+"""
+
+import base64
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+os.environ.update({
+    "LLM_PROVIDER": "openai",
+    "LLM_PROVIDERS": "",
+    "OPENAI_API_KEY": "test-key",
+})
+os.environ.pop("GROQ_API_KEY", None)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httplib2  # noqa: E402
+from googleapiclient.errors import HttpError  # noqa: E402
+
+import llm_cache  # noqa: E402
+import llm_service  # noqa: E402
+import message_store  # noqa: E402
+
+
+def use_temp_stores(test) -> Path:
+    """
+    Point the message store, LLM cache and capability table at a fresh
+    temporary directory for one test (restored on cleanup).
+
+    Args:
+        test: unittest.TestCase using the stores
+
+    Returns:
+        The temporary directory
+    """
+    tmp_dir = Path(tempfile.mkdtemp(prefix="opportunity_finder_test_"))
+    test.addCleanup(shutil.rmtree, tmp_dir, True)
+
+    patches = [
+        mock.patch.object(message_store, "MESSAGE_STORE_PATH", str(tmp_dir / "message_store.db")),
+        mock.patch.object(message_store, "_initialized", False),
+        mock.patch.object(llm_cache, "LLM_CACHE_PATH", str(tmp_dir / "llm_cache.db")),
+        mock.patch.object(llm_cache, "_initialized", False),
+        mock.patch.object(llm_cache, "_memory", llm_cache.OrderedDict()),
+        mock.patch.object(llm_cache, "_stats", dict.fromkeys(llm_cache._stats, 0)),
+        mock.patch.object(llm_service, "LLM_CAPABILITIES_PATH", str(tmp_dir / "llm_capabilities.json")),
+        mock.patch.object(llm_service, "_capabilities", None),
+        mock.patch.object(llm_service, "_probed", set()),
+    ]
+    for patcher in patches:
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return tmp_dir
+
+
+def http_error(status: int, content: bytes = b"error") -> HttpError:
+    """Build a googleapiclient HttpError with the given HTTP status."""
+    return HttpError(httplib2.Response({"status": status}), content)
+
+
+def text_part(mime_type: str, text: str, charset: str = "utf-8", filename: str = "") -> Dict[str, Any]:
+    """Build a Gmail leaf part with a base64url-encoded body."""
+    data = base64.urlsafe_b64encode(text.encode(charset)).decode("ascii")
+    return {
+        "mimeType": mime_type,
+        "filename": filename,
+        "headers": [{"name": "Content-Type", "value": f'{mime_type}; charset="{charset}"'}],
+        "body": {"data": data, "size": len(text)},
+    }
+
+
+def gmail_message(message_id: str, date: str, body: str = "", subject: str = "Subject", sender: str = "a@example.com") -> Dict[str, Any]:
+    """Build a Gmail message resource with a text/plain body."""
+    payload = text_part("text/plain", body)
+    payload["headers"] = [
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": sender},
+        {"name": "Date", "value": date},
+    ]
+    return {"id": message_id, "payload": payload}
+
+
+class _Request:
+    """Unexecuted Gmail API request."""
+
+    def __init__(self, gmail: "FakeGmail", kind: str, **params: Any):
+        self.gmail = gmail
+        self.kind = kind
+        self.params = params
+
+    def execute(self) -> Dict[str, Any]:
+        return self.gmail.handle(self)
+
+
+class _Batch:
+    """BatchHttpRequest stand-in: runs its sub-requests and reports each to the callback."""
+
+    def __init__(self, gmail: "FakeGmail", callback):
+        self.gmail = gmail
+        self.callback = callback
+        self.requests: List[tuple] = []
+
+    def add(self, request: _Request, request_id: str) -> None:
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+        self.gmail.batches.append([request.params["id"] for _, request in self.requests])
+        if self.gmail.batch_errors:
+            raise self.gmail.batch_errors.pop(0)
+        for request_id, request in self.requests:
+            try:
+                response, error = request.execute(), None
+            except Exception as e:
+                response, error = None, e
+            self.callback(request_id, response, error)
+
+
+class FakeGmail:
+    """
+    Gmail service stand-in for users().threads() list/get and HTTP batches.
+
+    data: {thread_id: {"historyId": str, "messages": [message resources]}}
+    in listing order. errors: {thread_id: [exceptions raised by successive
+    threads().get() calls]}. batch_errors: exceptions raised by whole
+    batch executions, in order.
+    """
+
+    def __init__(self, data: Dict[str, Dict[str, Any]], errors: Optional[Dict[str, List[Exception]]] = None):
+        self.data = data
+        self.errors = errors or {}
+        self.batch_errors: List[Exception] = []
+        self.gets: List[tuple] = []
+        self.batches: List[List[str]] = []
+
+    def users(self) -> "FakeGmail":
+        return self
+
+    def threads(self) -> "FakeGmail":
+        return self
+
+    def list(self, userId: str, q: str = "", maxResults: int = 100, pageToken: Optional[str] = None) -> _Request:
+        return _Request(self, "list", maxResults=maxResults, pageToken=pageToken)
+
+    def get(self, userId: str, id: str, format: str = "full", metadataHeaders: Optional[List[str]] = None) -> _Request:
+        return _Request(self, "get", id=id, format=format)
+
+    def new_batch_http_request(self, callback) -> _Batch:
+        return _Batch(self, callback)
+
+    def handle(self, request: _Request) -> Dict[str, Any]:
+        if request.kind == "list":
+            ids = list(self.data)
+            start = int(request.params["pageToken"] or 0)
+            end = start + request.params["maxResults"]
+            page = {"threads": [{"id": tid, "historyId": self.data[tid]["historyId"]} for tid in ids[start:end]]}
+            if end < len(ids):
+                page["nextPageToken"] = str(end)
+            return page
+
+        thread_id = request.params["id"]
+        self.gets.append((thread_id, request.params["format"]))
+        if self.errors.get(thread_id):
+            raise self.errors[thread_id].pop(0)
+        return {"id": thread_id, "messages": self.data[thread_id]["messages"]}
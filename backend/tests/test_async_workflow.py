@@ -0,0 +1,120 @@
+"""
+End-to-end test of the async analysis workflow (run_analysis_workflow_async).
+
+Gmail and the LLM providers are replaced with in-process fakes; everything in
+between (batching, strip → analyze → parse, caches, task results) runs for real.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Stores and keys must be set before the backend modules read their config
+_TMP_DIR = tempfile.mkdtemp(prefix="opportunity_finder_test_")
+os.environ.update({
+    "LLM_PROVIDER": "openai",
+    "LLM_PROVIDERS": "",
+    "OPENAI_API_KEY": "test-key",
+    "LLM_CACHE_PATH": os.path.join(_TMP_DIR, "llm_cache.db"),
+    "MESSAGE_STORE_PATH": os.path.join(_TMP_DIR, "message_store.db"),
+    "LLM_CAPABILITIES_PATH": os.path.join(_TMP_DIR, "llm_capabilities.json"),
+})
+os.environ.pop("GROQ_API_KEY", None)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import llm_service  # noqa: E402
+import task_manager  # noqa: E402
+import workflow  # noqa: E402
+
+
+ANALYSIS_MARKDOWN = """## Opportunity 1
+**Title:** Founder asking for a reporting tool
+**Description:** Wants weekly metrics without spreadsheets
+"""
+
+
+def _fake_messages(sender_email, max_results, task_id=None):
+    """Stand-in for email_service.iter_emails: 2 threads with 2 messages each."""
+    for thread in range(1, 3):
+        for number in range(1, 3):
+            yield {
+                "message_id": f"m{thread}{number}",
+                "thread_id": f"t{thread}",
+                "message_number": number,
+                "total_in_thread": 2,
+                "subject": f"Thread {thread}",
+                "from": sender_email,
+                "date": f"Mon, {thread} Jan 2024 10:0{number}:00 +0000",
+                "body": f"Message {number} of thread {thread}: looking for a reporting tool",
+            }
+
+
+class _FakeCompletions:
+    """AsyncOpenAI chat.completions stand-in that records every request."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        usage = SimpleNamespace(
+            prompt_tokens=100,
+            completion_tokens=20,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+        )
+        is_strip = kwargs["messages"][1]["content"].startswith("Clean ")
+        content = "cleaned" if is_strip else ANALYSIS_MARKDOWN
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class AsyncWorkflowTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.debug_dir = Path(_TMP_DIR) / "debug_outputs"
+        self.completions = _FakeCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        patches = [
+            mock.patch.object(workflow, "DEBUG_DIR", self.debug_dir),
+            mock.patch.object(workflow.email_service, "iter_emails", _fake_messages),
+            mock.patch.object(llm_service, "_get_client", lambda *args, **kwargs: client),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+    async def test_async_workflow_completes(self):
+        task_id = task_manager.create_task("bookface_digest", email_limit=2, batch_size=10)
+
+        await workflow.run_analysis_workflow_async(
+            task_id=task_id,
+            sender_id="bookface_digest",
+            sender_email="digest@example.com",
+            prompt_key="bookface_digest",
+            email_limit=2,
+            batch_size=10,
+        )
+
+        task = task_manager.get_task(task_id)
+        self.assertEqual(task["status"], "completed", task["error"])
+        self.assertIsNone(task["error"])
+        self.assertTrue(task["results"])
+        for result in task["results"]:
+            self.assertNotIn("error", result)
+        self.assertGreaterEqual(len(self.completions.calls), 2)  # strip + analyze
+        self.assertEqual(task["llm_usage"]["calls"], len(self.completions.calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
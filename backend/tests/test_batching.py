@@ -0,0 +1,77 @@
+"""
+Unit tests for message batching in workflow: count batches and
+token-budgeted packing that keeps threads together.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (test config + sys.path)
+
+import workflow
+
+
+def _messages(*threads):
+    """Build messages from (thread_id, [tokens per message]) pairs, in fetch order."""
+    return [
+        {"message_id": f"{thread_id}m{number}", "thread_id": thread_id, "tokens": tokens}
+        for thread_id, sizes in threads
+        for number, tokens in enumerate(sizes, 1)
+    ]
+
+
+def _ids(batches):
+    return [[message["message_id"] for message in batch] for batch in batches]
+
+
+class BatchingTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(workflow, "_message_tokens", lambda message: message["tokens"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_count_batches_fill_to_max_messages(self):
+        items = _messages(("a", [1, 1, 1]), ("b", [1, 1]))
+        self.assertEqual(_ids(workflow._create_batches(items, 2)), [["am1", "am2"], ["am3", "bm1"], ["bm2"]])
+
+    def test_threads_that_do_not_fit_start_a_new_batch(self):
+        items = _messages(("a", [40, 30]), ("b", [20, 20]), ("c", [10]))
+        batches = workflow._create_batches(items, max_messages=10, token_budget=100)
+        self.assertEqual(_ids(batches), [["am1", "am2"], ["bm1", "bm2", "cm1"]])
+
+    def test_threads_larger_than_a_batch_are_split(self):
+        items = _messages(("a", [10]), ("b", [60, 60, 60]))
+        batches = workflow._create_batches(items, max_messages=10, token_budget=100)
+        self.assertEqual(_ids(batches), [["am1"], ["bm1"], ["bm2"], ["bm3"]])
+
+    def test_message_cap_applies_with_a_budget(self):
+        items = _messages(("a", [1, 1]), ("b", [1, 1]), ("c", [1]))
+        batches = workflow._create_batches(items, max_messages=3, token_budget=1000)
+        self.assertEqual(_ids(batches), [["am1", "am2"], ["bm1", "bm2", "cm1"]])
+
+    def test_incremental_packing_matches_create_batches(self):
+        items = _messages(("a", [40, 30]), ("b", [20, 20]), ("c", [90]), ("d", [5]))
+        packer = workflow._new_packer(max_messages=10, token_budget=100)
+        batches = []
+        for item in items:
+            batches.extend(workflow._pack_message(packer, item))
+        batches.extend(workflow._flush_packer(packer))
+
+        self.assertEqual(batches, workflow._create_batches(items, max_messages=10, token_budget=100))
+
+    def test_batch_size_stays_a_hard_cap(self):
+        with mock.patch.object(workflow.prompts, "get_prompt", return_value={"batch_token_budget": 8000}), \
+                mock.patch.object(workflow, "WORKFLOW_BATCH_MAX_MESSAGES", 30):
+            self.assertEqual(workflow._batch_limits("task", "prompt", 5), (8000, 5))
+            self.assertEqual(workflow._batch_limits("task", "prompt", 50), (8000, 30))
+
+        with mock.patch.object(workflow.prompts, "get_prompt", return_value={"batch_token_budget": 0}), \
+                mock.patch.object(workflow, "WORKFLOW_BATCH_TOKEN_BUDGET", 0):
+            self.assertEqual(workflow._batch_limits("task", "prompt", 5), (0, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Unit tests for the Gmail thread download paths in email_service.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import unittest
+from unittest import mock
+
+from support import FakeGmail, gmail_message, http_error
+
+import email_service
+
+
+def _fake_gmail(count: int, errors=None) -> FakeGmail:
+    data = {
+        f"t{i}": {
+            "historyId": str(100 + i),
+            "messages": [
+                gmail_message(f"t{i}m1", "Mon, 1 Jan 2024 10:00:00 +0000", f"body {i}", subject=f"Thread {i}"),
+                gmail_message(f"t{i}m2", "Tue, 2 Jan 2024 10:00:00 +0000", f"reply {i}"),
+            ],
+        }
+        for i in range(count)
+    }
+    return FakeGmail(data, errors)
+
+
+class FetchThreadDetailsTest(unittest.TestCase):
+    """Sequential and concurrent threads().get() downloads."""
+
+    def test_results_align_with_thread_ids(self):
+        thread_ids = [f"t{i}" for i in range(12)]
+        sequential = email_service._fetch_thread_details(_fake_gmail(12), thread_ids, "a@example.com", workers=1)
+        concurrent = email_service._fetch_thread_details(_fake_gmail(12), thread_ids, "a@example.com", workers=4)
+
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual([messages[0]["thread_id"] for messages in concurrent], thread_ids)
+        self.assertEqual(concurrent[3][0]["subject"], "Thread 3")
+        self.assertEqual(concurrent[3][1]["body"], "reply 3")
+        self.assertEqual([m["message_number"] for m in concurrent[3]], [1, 2])
+
+    def test_failed_threads_are_none(self):
+        service = _fake_gmail(4, errors={"t1": [http_error(404)], "t2": [ValueError("bad payload")]})
+        results = email_service._fetch_thread_details(service, ["t0", "t1", "t2", "t3"], "a@example.com", workers=4)
+
+        self.assertIsNone(results[1])
+        self.assertIsNone(results[2])
+        self.assertEqual(len(results[0]), 2)
+        self.assertEqual(len(results[3]), 2)
+
+    def test_metadata_format_is_requested(self):
+        service = _fake_gmail(2)
+        email_service._fetch_thread_details(service, ["t0", "t1"], "a@example.com", workers=1, format="metadata")
+
+        self.assertEqual(service.gets, [("t0", "metadata"), ("t1", "metadata")])
+
+
+class FetchThreadDetailsBatchedTest(unittest.TestCase):
+    """HTTP batch downloads with per-sub-request retries."""
+
+    def setUp(self):
+        patcher = mock.patch.object(email_service.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_matches_concurrent_mode_and_chunks_by_batch_size(self):
+        thread_ids = [f"t{i}" for i in range(5)]
+        service = _fake_gmail(5)
+        batched = email_service._fetch_thread_details_batched(service, thread_ids, "a@example.com", batch_size=2)
+        concurrent = email_service._fetch_thread_details(_fake_gmail(5), thread_ids, "a@example.com", workers=4)
+
+        self.assertEqual(batched, concurrent)
+        self.assertEqual(service.batches, [["t0", "t1"], ["t2", "t3"], ["t4"]])
+        self.sleep.assert_not_called()
+
+    def test_retries_only_retryable_sub_requests(self):
+        service = _fake_gmail(3, errors={"t0": [http_error(429)], "t1": [http_error(404)]})
+        results = email_service._fetch_thread_details_batched(service, ["t0", "t1", "t2"], "a@example.com", batch_size=10)
+
+        self.assertEqual(service.batches, [["t0", "t1", "t2"], ["t0"]])
+        self.assertEqual(len(results[0]), 2)
+        self.assertIsNone(results[1])
+        self.assertEqual(len(results[2]), 2)
+        self.sleep.assert_called_once_with(2)
+
+    def test_gives_up_after_max_retries(self):
+        errors = {"t0": [http_error(503) for _ in range(10)]}
+        service = _fake_gmail(1, errors=errors)
+        with mock.patch.object(email_service, "GMAIL_BATCH_RETRIES", 2):
+            results = email_service._fetch_thread_details_batched(service, ["t0"], "a@example.com", batch_size=10)
+
+        self.assertEqual(results, [None])
+        self.assertEqual(len(service.batches), 3)
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [2, 4])
+
+    def test_whole_batch_failure_resends_pending_requests(self):
+        service = _fake_gmail(2)
+        service.batch_errors = [ConnectionResetError("reset")]
+        results = email_service._fetch_thread_details_batched(service, ["t0", "t1"], "a@example.com", batch_size=10)
+
+        self.assertEqual(service.batches, [["t0", "t1"], ["t0", "t1"]])
+        self.assertTrue(all(results))
+
+    def test_is_retryable_error(self):
+        rate_limited = b'{"error": {"code": 403, "message": "User Rate Limit Exceeded", "errors": [{"reason": "rateLimitExceeded"}]}}'
+
+        self.assertTrue(email_service._is_retryable_error(http_error(429)))
+        self.assertTrue(email_service._is_retryable_error(http_error(500)))
+        self.assertTrue(email_service._is_retryable_error(http_error(403, rate_limited)))
+        self.assertFalse(email_service._is_retryable_error(http_error(403, b"forbidden")))
+        self.assertFalse(email_service._is_retryable_error(http_error(404)))
+        self.assertFalse(email_service._is_retryable_error(ValueError("bad payload")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Unit tests for message body extraction in email_service: MIME part
+selection and decoding, HTML to text with links preserved.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import unittest
+
+from support import text_part
+
+import email_service
+
+
+class HtmlToTextTest(unittest.TestCase):
+
+    def convert(self, html: str) -> str:
+        return email_service._html_to_text_with_links(html)
+
+    def test_links_render_as_text_and_url(self):
+        self.assertEqual(
+            self.convert('See <a href="https://x.com/a?b=1&amp;c=2">the post</a> now'),
+            "See the post (https://x.com/a?b=1&c=2) now",
+        )
+        self.assertEqual(self.convert("<A HREF='https://q.com'>Q</A>"), "Q (https://q.com)")
+
+    def test_link_text_equal_to_url_is_not_repeated(self):
+        self.assertEqual(self.convert("<a href=https://x.com>https://x.com</a>"), "https://x.com")
+
+    def test_unclosed_anchor_keeps_its_url(self):
+        self.assertEqual(self.convert('Open <a href="https://u.com">unclosed link'), "Open unclosed link (https://u.com)")
+
+    def test_block_tags_become_line_breaks(self):
+        self.assertEqual(self.convert("<p>Hello <b>world</b></p><p>Second &amp; third</p>"), "Hello world\n\nSecond & third")
+        self.assertEqual(self.convert("line1<br>line2<br><br>para"), "line1\nline2\n\npara")
+        self.assertEqual(self.convert("<ul><li>one</li><li>two</li></ul>"), "one\ntwo")
+
+    def test_head_script_style_and_comments_are_dropped(self):
+        html = (
+            "<html><head><title>T</title><style>p{color:red}</style></head>"
+            '<body><script>var a = "<p>";</script><div>Body</div><!-- note --></body></html>'
+        )
+        self.assertEqual(self.convert(html), "Body")
+
+
+class MimeExtractTest(unittest.TestCase):
+
+    def test_html_part_is_preferred_in_nested_multipart(self):
+        payload = {
+            "mimeType": "multipart/mixed",
+            "parts": [
+                {
+                    "mimeType": "multipart/alternative",
+                    "parts": [
+                        text_part("text/plain", "plain body"),
+                        text_part("text/html", '<p>html <a href="https://x.com">body</a></p>'),
+                    ],
+                },
+                text_part("text/html", "<p>attached page</p>", filename="page.html"),
+            ],
+        }
+        self.assertEqual(email_service._extract_body_with_links(payload), "html body (https://x.com)")
+
+    def test_plain_part_is_used_without_html(self):
+        payload = {
+            "mimeType": "multipart/mixed",
+            "parts": [
+                text_part("text/plain", "first"),
+                text_part("text/plain", "second"),
+                text_part("text/html", "<p>report</p>", filename="report.html"),
+            ],
+        }
+        self.assertEqual(email_service._extract_body_with_links(payload), "first")
+
+    def test_attachments_and_empty_parts_are_skipped(self):
+        attachment = {"mimeType": "text/html", "filename": "", "body": {"attachmentId": "a1", "size": 10}}
+        payload = {"mimeType": "multipart/mixed", "parts": [attachment, text_part("application/pdf", "%PDF", filename="a.pdf")]}
+
+        self.assertIsNone(email_service._select_body_part(payload))
+        self.assertEqual(email_service._extract_body_with_links(payload), "")
+
+    def test_part_charset_is_honoured(self):
+        self.assertEqual(email_service._decode_part(text_part("text/plain", "café", charset="iso-8859-1")), "café")
+        self.assertEqual(email_service._decode_part(text_part("text/plain", "naïve")), "naïve")
+
+    def test_bad_bytes_and_unknown_charsets_do_not_raise(self):
+        unknown = text_part("text/plain", "hello")
+        unknown["headers"] = [{"name": "Content-Type", "value": "text/plain; charset=x-unknown"}]
+        self.assertEqual(email_service._decode_part(unknown), "hello")
+
+        broken = {"body": {"data": "_w"}, "headers": []}  # 0xFF, unpadded base64url
+        self.assertEqual(email_service._decode_part(broken), "\ufffd")
+
+
+if __name__ == "__main__":
+    unittest.main()
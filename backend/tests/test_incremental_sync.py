@@ -0,0 +1,97 @@
+"""
+Unit tests for incremental sync: stored threads are reused while their
+historyId and body format match, and only new or changed threads are
+downloaded again.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import unittest
+from unittest import mock
+
+from support import FakeGmail, gmail_message, use_temp_stores
+
+import email_service
+import message_store
+
+SENDER = "admin@example.com"
+
+
+def _thread(index: int, history_id: str = "") -> dict:
+    return {
+        "historyId": history_id or str(100 + index),
+        "messages": [
+            gmail_message(f"t{index}m1", f"Mon, {index + 1} Jan 2024 10:00:00 +0000", f"body {index}", sender=SENDER),
+        ],
+    }
+
+
+class IncrementalSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        use_temp_stores(self)
+        self.service = FakeGmail({f"t{i}": _thread(i) for i in range(4)})
+        for name, value in {
+            "_get_gmail_service": lambda: self.service,
+            "GMAIL_INCREMENTAL_SYNC": True,
+            "GMAIL_FETCH_MODE": "sequential",
+        }.items():
+            patcher = mock.patch.object(email_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _full_gets(self) -> list:
+        return sorted(tid for tid, format in self.service.gets if format == "full")
+
+    def _fetch(self) -> list:
+        self.service.gets.clear()
+        return email_service.fetch_emails(SENDER, max_results=10)
+
+    def test_second_run_is_served_from_the_store(self):
+        first = self._fetch()
+        self.assertEqual(self._full_gets(), ["t0", "t1", "t2", "t3"])
+
+        second = self._fetch()
+        self.assertEqual(self._full_gets(), [])
+        self.assertEqual(second, first)
+
+    def test_changed_history_id_is_downloaded_again(self):
+        self._fetch()
+        self.service.data["t2"] = _thread(2, history_id="999")
+        self.service.data["t2"]["messages"].append(
+            gmail_message("t2m2", "Fri, 5 Jan 2024 10:00:00 +0000", "new reply", sender=SENDER)
+        )
+
+        messages = self._fetch()
+        self.assertEqual(self._full_gets(), ["t2"])
+        self.assertEqual([m["body"] for m in messages if m["thread_id"] == "t2"], ["body 2", "new reply"])
+        self.assertEqual(message_store.get_threads(["t2"], email_service.BODY_FORMAT_VERSION)["t2"]["history_id"], "999")
+
+    def test_body_format_change_invalidates_stored_threads(self):
+        self._fetch()
+        with mock.patch.object(email_service, "BODY_FORMAT_VERSION", email_service.BODY_FORMAT_VERSION + 1):
+            self._fetch()
+        self.assertEqual(self._full_gets(), ["t0", "t1", "t2", "t3"])
+
+    def test_sync_off_downloads_everything(self):
+        self._fetch()
+        with mock.patch.object(email_service, "GMAIL_INCREMENTAL_SYNC", False):
+            self._fetch()
+        self.assertEqual(self._full_gets(), ["t0", "t1", "t2", "t3"])
+
+    def test_get_reusable_threads_compares_history_ids(self):
+        self._fetch()
+        listed = [
+            {"id": "t0", "historyId": "100"},
+            {"id": "t1", "historyId": "555"},
+            {"id": "t2"},
+            {"id": "unknown", "historyId": "1"},
+        ]
+
+        reusable = email_service._get_reusable_threads(listed)
+        self.assertEqual(list(reusable), ["t0"])
+        self.assertEqual(reusable["t0"].day, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Unit tests for the LLM completion cache (llm_cache) and its use in
+llm_service.analyze_with_llm.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import itertools
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from support import use_temp_stores
+
+import llm_cache
+import llm_service
+
+
+class _FakeCompletions:
+    """OpenAI chat.completions stand-in that counts requests."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2, prompt_tokens_details=None)
+        message = SimpleNamespace(content=f"answer {self.calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+class LlmCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        use_temp_stores(self)
+        patcher = mock.patch.object(llm_cache, "LLM_CACHE_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_make_key_covers_every_input(self):
+        base = llm_cache.make_key("openai", "gpt-4o-mini", "system", "user", temperature=0)
+        self.assertEqual(base, llm_cache.make_key("openai", "gpt-4o-mini", "system", "user", temperature=0))
+        for other in (
+            llm_cache.make_key("groq", "gpt-4o-mini", "system", "user", temperature=0),
+            llm_cache.make_key("openai", "gpt-4o", "system", "user", temperature=0),
+            llm_cache.make_key("openai", "gpt-4o-mini", "system 2", "user", temperature=0),
+            llm_cache.make_key("openai", "gpt-4o-mini", "system", "user 2", temperature=0),
+            llm_cache.make_key("openai", "gpt-4o-mini", "system", "user", temperature=1),
+        ):
+            self.assertNotEqual(base, other)
+
+    def test_put_then_get_from_memory_and_disk(self):
+        llm_cache.put("k1", "value 1")
+        self.assertEqual(llm_cache.get("k1"), "value 1")
+
+        llm_cache._memory.clear()
+        self.assertEqual(llm_cache.get("k1"), "value 1")
+        self.assertIsNone(llm_cache.get("missing"))
+
+        stats = llm_cache.get_stats()
+        self.assertEqual((stats["memory_hits"], stats["disk_hits"], stats["misses"]), (1, 1, 1))
+
+    def test_expired_entries_are_misses(self):
+        with mock.patch.object(llm_cache.time, "time", return_value=1000.0):
+            llm_cache.put("k1", "value 1")
+        with mock.patch.object(llm_cache.time, "time", return_value=1000.0 + llm_cache.LLM_CACHE_TTL + 1):
+            self.assertIsNone(llm_cache.get("k1"))
+            llm_cache._memory.clear()
+            self.assertIsNone(llm_cache.get("k1"))
+
+    def test_disk_tier_is_trimmed_every_n_writes(self):
+        with mock.patch.object(llm_cache, "LLM_CACHE_MAX_ENTRIES", 3), \
+                mock.patch.object(llm_cache, "_EVICT_EVERY_WRITES", 5), \
+                mock.patch.object(llm_cache.time, "time", side_effect=itertools.count(1000.0)):
+            for i in range(4):
+                llm_cache.put(f"k{i}", str(i))
+            self.assertEqual(self._disk_count(), 4)  # No eviction before the 5th write
+
+            llm_cache.put("k4", "4")
+            self.assertEqual(self._disk_count(), 3)
+
+            llm_cache._memory.clear()
+            self.assertIsNone(llm_cache.get("k0"))  # Least recently used first
+            self.assertEqual(llm_cache.get("k4"), "4")
+
+    def test_memory_tier_is_bounded(self):
+        with mock.patch.object(llm_cache, "LLM_CACHE_MEMORY_ENTRIES", 2):
+            for i in range(3):
+                llm_cache.put(f"k{i}", str(i))
+        self.assertEqual(list(llm_cache._memory), ["k1", "k2"])
+
+    def test_disabled_cache_stores_nothing(self):
+        with mock.patch.object(llm_cache, "LLM_CACHE_ENABLED", False):
+            llm_cache.put("k1", "value 1")
+            self.assertIsNone(llm_cache.get("k1"))
+        self.assertIsNone(llm_cache.get("k1"))
+
+    def test_analyze_with_llm_reuses_cached_answers_unless_bypassed(self):
+        completions = _FakeCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        with mock.patch.object(llm_service, "_get_client", lambda *args, **kwargs: client):
+            first = llm_service.analyze_with_llm("system", "user")
+            second = llm_service.analyze_with_llm("system", "user")
+            bypassed = llm_service.analyze_with_llm("system", "user", use_cache=False)
+
+        self.assertEqual((first, second, bypassed), ("answer 1", "answer 1", "answer 2"))
+        self.assertEqual(completions.calls, 2)
+
+    def _disk_count(self) -> int:
+        with llm_cache._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,279 @@
+"""
+Unit tests for LLM call resilience in llm_service: retry classification
+and backoff, the shared rate limiter, and provider circuit breakers with
+failover and hedging.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+import groq
+import httpx
+import openai
+
+import support  # noqa: F401  (test config + sys.path)
+
+import llm_service
+
+_REQUEST = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+
+
+def _status_error(cls, status: int, headers=None, body=None):
+    """Build an SDK status error (e.g. openai.RateLimitError) for an HTTP response."""
+    return cls("error", response=httpx.Response(status, headers=headers, request=_REQUEST), body=body)
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(llm_service.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_classify_error(self):
+        classify = llm_service._classify_error
+        self.assertEqual(classify(_status_error(openai.RateLimitError, 429)), "rate_limit")
+        self.assertEqual(classify(_status_error(groq.InternalServerError, 503)), "server_error")
+        self.assertEqual(classify(_status_error(openai.ConflictError, 409)), "server_error")
+        self.assertEqual(classify(openai.APITimeoutError(request=_REQUEST)), "timeout")
+        self.assertEqual(classify(httpx.ReadTimeout("slow stream")), "timeout")
+        self.assertEqual(classify(groq.APIConnectionError(request=_REQUEST)), "connection")
+
+        self.assertIsNone(classify(_status_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"})))
+        self.assertIsNone(classify(_status_error(openai.BadRequestError, 400)))
+        self.assertIsNone(classify(_status_error(openai.AuthenticationError, 401)))
+        self.assertIsNone(classify(ValueError("bug")))
+
+    def test_retry_after_headers(self):
+        retry_after = llm_service._retry_after
+        self.assertEqual(retry_after(_status_error(openai.RateLimitError, 429, {"retry-after": "7"})), 7.0)
+        self.assertEqual(retry_after(_status_error(openai.RateLimitError, 429, {"retry-after-ms": "1500"})), 1.5)
+        self.assertIsNone(retry_after(_status_error(openai.RateLimitError, 429)))
+        self.assertIsNone(retry_after(openai.APITimeoutError(request=_REQUEST)))
+
+        with mock.patch.object(llm_service.time, "time", return_value=1_700_000_000.0):
+            error = _status_error(openai.RateLimitError, 429, {"retry-after": "Tue, 14 Nov 2023 22:13:30 GMT"})
+            self.assertEqual(retry_after(error), 10.0)
+
+    def test_backoff_is_jittered_exponential_and_capped(self):
+        error = openai.APITimeoutError(request=_REQUEST)
+        with mock.patch.object(llm_service, "LLM_RETRY_BASE_DELAY", 1.0), \
+                mock.patch.object(llm_service, "LLM_RETRY_MAX_DELAY", 5.0), \
+                mock.patch.object(llm_service.random, "uniform", side_effect=lambda low, high: high) as uniform:
+            delays = [llm_service._next_retry_delay(error, "timeout", attempt, 300, "") for attempt in (1, 2, 3, 4)]
+
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 5.0])
+        self.assertTrue(all(call.args[0] == 0 for call in uniform.call_args_list))
+
+    def test_retry_after_wins_and_limits_give_up(self):
+        error = _status_error(openai.RateLimitError, 429, {"retry-after": "12"})
+        self.assertEqual(llm_service._next_retry_delay(error, "rate_limit", 1, 300, ""), 12.0)
+        self.assertIsNone(llm_service._next_retry_delay(error, "rate_limit", 1, 15, ""))  # Past the deadline
+        with mock.patch.object(llm_service, "LLM_MAX_RETRIES", 2):
+            self.assertIsNone(llm_service._next_retry_delay(error, "rate_limit", 3, 300, ""))
+
+    def test_call_with_retries_recovers_from_transient_errors(self):
+        errors = [_status_error(openai.RateLimitError, 429, {"retry-after": "1"}), openai.APITimeoutError(request=_REQUEST)]
+
+        def request(timeout):
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        self.assertEqual(llm_service._call_with_retries(request, timeout=60), "ok")
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertEqual(self.sleep.call_args_list[0].args[0], 1.0)
+
+    def test_call_with_retries_does_not_retry_permanent_errors(self):
+        request = mock.Mock(side_effect=_status_error(openai.BadRequestError, 400))
+        with self.assertRaises(openai.BadRequestError):
+            llm_service._call_with_retries(request, timeout=60)
+        self.assertEqual(request.call_count, 1)
+        self.sleep.assert_not_called()
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        for name, value in {
+            "_rate_buckets": {},
+            "_rate_stats": {},
+            "_rate_overrides": None,
+            "LLM_RATE_LIMITS": "",
+            "OPENAI_RPM": 60,
+            "OPENAI_TPM": 6000,
+        }.items():
+            patcher = mock.patch.object(llm_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(llm_service.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reserve(self, tokens: int = 0) -> float:
+        return llm_service._reserve_rate(("openai", "gpt-4o-mini", tokens))
+
+    def test_requests_queue_in_arrival_order_once_the_bucket_is_empty(self):
+        waits = [self.reserve() for _ in range(62)]
+        self.assertEqual(waits[:60], [0.0] * 60)
+        self.assertAlmostEqual(waits[60], 1.0)
+        self.assertAlmostEqual(waits[61], 2.0)
+
+        self.now += 30  # Refills 30 requests, the two queued ones included
+        self.assertEqual(self.reserve(), 0.0)
+
+        stats = llm_service.get_rate_limit_stats()["openai:gpt-4o-mini"]
+        self.assertEqual((stats["requests"], stats["queued"], stats["rpm"]), (63, 2, 60))
+
+    def test_tokens_per_minute_budget(self):
+        self.assertEqual(self.reserve(tokens=4000), 0.0)
+        self.assertAlmostEqual(self.reserve(tokens=4000), 20.0)  # 2000 tokens short at 100 tokens/s
+        self.assertAlmostEqual(self.reserve(tokens=100_000), 80.0)  # Oversized: waits for a full bucket only
+
+    def test_pause_holds_back_new_reservations(self):
+        rate = ("openai", "gpt-4o-mini", 0)
+        self.reserve()
+        llm_service._pause_rate(rate, 10)
+        self.assertEqual(self.reserve(), 10.0)
+
+    def test_limits_from_defaults_and_overrides(self):
+        self.assertEqual(llm_service._rate_limits("openai", "gpt-4o-mini"), (60, 6000))
+        self.assertEqual(llm_service._rate_limits("other", "model"), (0, 0))
+        self.assertIsNone(llm_service._rate_request("other", "model", "prompt"))
+
+        overrides = '{"groq": {"rpm": 10}, "groq:llama-3.1-8b-instant": {"tpm": 6000}}'
+        with mock.patch.object(llm_service, "LLM_RATE_LIMITS", overrides), \
+                mock.patch.object(llm_service, "_rate_overrides", None), \
+                mock.patch.object(llm_service, "GROQ_RPM", 30), \
+                mock.patch.object(llm_service, "GROQ_TPM", 0):
+            self.assertEqual(llm_service._rate_limits("groq", "llama-3.1-8b-instant"), (10, 6000))
+            self.assertEqual(llm_service._rate_limits("groq", "other"), (10, 0))
+
+    def test_invalid_overrides_are_ignored(self):
+        with mock.patch.object(llm_service, "LLM_RATE_LIMITS", "{not json"):
+            self.assertEqual(llm_service._rate_limits("openai", "gpt-4o-mini"), (60, 6000))
+
+    def test_rate_request_counts_prompt_and_output_tokens(self):
+        rate = llm_service._rate_request("openai", "gpt-4o-mini", "system", "user")
+        expected = llm_service.estimate_tokens("system") + llm_service.estimate_tokens("user") + llm_service._RATE_OUTPUT_TOKENS
+        self.assertEqual(rate, ("openai", "gpt-4o-mini", expected))
+
+
+class ProviderChainTest(unittest.TestCase):
+
+    CHAIN = [{"provider": "openai", "model": "gpt-4o-mini"}, {"provider": "groq", "model": "llama"}]
+
+    def setUp(self):
+        for name, value in {
+            "_provider_health": {},
+            "LLM_BREAKER_FAILURES": 2,
+            "LLM_BREAKER_COOLDOWN": 60,
+            "LLM_HEDGE": False,
+        }.items():
+            patcher = mock.patch.object(llm_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def health(self, provider: str) -> dict:
+        return llm_service._provider_health[provider]
+
+    def end_cooldown(self, provider: str) -> None:
+        self.health(provider)["opened_at"] -= llm_service.LLM_BREAKER_COOLDOWN
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        llm_service._record_provider("openai", False)
+        self.assertTrue(llm_service._acquire_provider("openai"))
+        llm_service._record_provider("openai", False)
+
+        self.assertEqual(self.health("openai")["state"], "open")
+        self.assertFalse(llm_service._acquire_provider("openai"))
+
+    def test_half_open_admits_one_trial_call(self):
+        llm_service._record_provider("openai", False)
+        llm_service._record_provider("openai", False)
+        self.end_cooldown("openai")
+
+        self.assertTrue(llm_service._acquire_provider("openai"))
+        self.assertFalse(llm_service._acquire_provider("openai"))  # Trial still running
+        llm_service._record_provider("openai", False)
+        self.assertEqual(self.health("openai")["state"], "open")  # Failed trial reopens at once
+
+        self.end_cooldown("openai")
+        self.assertTrue(llm_service._acquire_provider("openai"))
+        llm_service._record_provider("openai", True, 1.0)
+        self.assertEqual(self.health("openai")["state"], "closed")
+        self.assertEqual(self.health("openai")["consecutive_failures"], 0)
+
+    def test_unknown_outcomes_do_not_count(self):
+        for _ in range(3):
+            llm_service._record_provider("openai", None)
+        self.assertEqual(self.health("openai")["state"], "closed")
+        self.assertEqual(self.health("openai")["calls"], 0)
+
+    def test_failed_provider_fails_over_to_the_next(self):
+        def call(config):
+            if config["provider"] == "openai":
+                raise _status_error(openai.InternalServerError, 500)
+            return "from groq"
+
+        self.assertEqual(llm_service._call_chain(self.CHAIN, call), "from groq")
+        self.assertEqual(self.health("openai")["failures"], 1)
+        self.assertEqual(self.health("groq")["calls"], 1)
+
+    def test_open_circuit_is_skipped(self):
+        llm_service._record_provider("openai", False)
+        llm_service._record_provider("openai", False)
+        call = mock.Mock(return_value="answer")
+
+        llm_service._call_chain(self.CHAIN, call)
+        self.assertEqual([c.args[0]["provider"] for c in call.call_args_list], ["groq"])
+
+    def test_last_provider_is_tried_when_every_circuit_is_open(self):
+        for provider in ("openai", "groq"):
+            llm_service._record_provider(provider, False)
+            llm_service._record_provider(provider, False)
+
+        self.assertEqual(llm_service._call_chain(self.CHAIN, lambda config: config["provider"]), "groq")
+
+    def test_bad_request_is_raised_without_tripping_the_breaker(self):
+        errors = [_status_error(openai.BadRequestError, 400), _status_error(groq.BadRequestError, 400)]
+
+        def call(config):
+            raise errors.pop(0)
+
+        with self.assertRaises(groq.BadRequestError):
+            llm_service._call_chain(self.CHAIN, call)
+        self.assertEqual(self.health("openai")["calls"], 0)
+        self.assertEqual(self.health("groq")["calls"], 0)
+
+    def test_slow_call_is_hedged_with_the_next_provider(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def call(config):
+            if config["provider"] == "openai":
+                release.wait(5)
+                return "slow"
+            return "fast"
+
+        with mock.patch.object(llm_service, "LLM_HEDGE", True), \
+                mock.patch.object(llm_service, "_hedge_delay", return_value=0.05):
+            self.assertEqual(llm_service._call_chain(self.CHAIN, call), "fast")
+        self.assertEqual((self.health("groq")["hedged_calls"], self.health("groq")["hedge_wins"]), (1, 1))
+
+    def test_hedge_delay_uses_latency_percentile(self):
+        with mock.patch.object(llm_service, "LLM_HEDGE_MIN_SAMPLES", 10), \
+                mock.patch.object(llm_service, "LLM_HEDGE_PERCENTILE", 90), \
+                mock.patch.object(llm_service, "LLM_HEDGE_DELAY", 30):
+            self.assertEqual(llm_service._hedge_delay("openai"), 30)
+            for latency in range(1, 11):
+                llm_service._record_provider("openai", True, float(latency))
+            self.assertEqual(llm_service._hedge_delay("openai"), 10.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+Unit tests for the local analysis parser (markdown_parser): markdown
+parsing, structured-output validation and the schema both are checked
+against (a prompt's Output Format).
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import json
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (test config + sys.path)
+
+import markdown_parser
+import prompts
+import workflow
+
+SYSTEM_PROMPT = """You analyze emails.
+
+# Output Format
+
+# SECTION 1: 🚀 Opportunities
+
+## Opportunity 1
+- **Title:** [title]
+- **Description:** [description]
+- **Link:** [link]
+- **Tags:**
+  - [tag]
+
+# SECTION 2: Threads
+1. [Thread title] - [link]
+
+**Rules:**
+- Be concise
+"""
+
+ANALYSIS = """Here is the analysis.
+
+# SECTION 1: 🚀 Opportunities
+
+## Opportunity 1
+- **Title:** Reporting tool
+- **Description:** Wants weekly metrics
+  without spreadsheets
+- **Link:** [post](https://x.com/p)
+- **Tags:**
+  - saas
+  - b2b
+
+---
+
+# SECTION 2: Threads
+1. Ask HN thread - https://news.ycombinator.com/item?id=1
+2. [Show HN](https://news.ycombinator.com/item?id=2)
+"""
+
+
+def _use_test_prompt(test, structured_output: bool = False) -> None:
+    """Serve SYSTEM_PROMPT for every prompt key during one test."""
+    prompt = {"system_prompt": SYSTEM_PROMPT, "structured_output": structured_output}
+    for target, name, value in (
+        (prompts, "get_prompt", lambda key: prompt),
+        (markdown_parser, "_schema_cache", {}),
+    ):
+        patcher = mock.patch.object(target, name, value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class MarkdownParserTest(unittest.TestCase):
+
+    def setUp(self):
+        _use_test_prompt(self)
+
+    def parse(self, markdown: str):
+        result = markdown_parser.parse_markdown(markdown, "test_prompt")
+        return json.loads(result) if result else None
+
+    def test_schema_comes_from_output_format(self):
+        schema = markdown_parser._get_schema("test_prompt")
+        self.assertEqual(list(schema), ["OPPORTUNITIES", "THREADS"])
+        self.assertEqual(schema["OPPORTUNITIES"]["fields"], {"title": False, "description": False, "link": False, "tags": True})
+        self.assertEqual(schema["THREADS"]["fields"], {"number": False, "title": False, "link": False})
+
+    def test_parses_fields_lists_and_numbered_items(self):
+        sections = self.parse(ANALYSIS)["sections"]
+
+        self.assertEqual([section["title"] for section in sections], ["SECTION 1: 🚀 Opportunities", "SECTION 2: Threads"])
+        self.assertEqual(sections[0]["opportunities"], [{
+            "title": "Reporting tool",
+            "description": "Wants weekly metrics\nwithout spreadsheets",
+            "link": "https://x.com/p",
+            "tags": ["saas", "b2b"],
+        }])
+        self.assertEqual(sections[1]["opportunities"], [
+            {"number": "1", "title": "Ask HN thread", "link": "https://news.ycombinator.com/item?id=1"},
+            {"number": "2", "title": "Show HN", "link": "https://news.ycombinator.com/item?id=2"},
+        ])
+
+    def test_empty_sections_are_dropped(self):
+        markdown = ANALYSIS.split("# SECTION 2")[0] + "# SECTION 2: Threads\nNo relevant threads found.\n"
+        self.assertEqual(len(self.parse(markdown)["sections"]), 1)
+
+    def test_rejects_output_that_does_not_match_the_schema(self):
+        self.assertIsNone(self.parse("No opportunities this week."))
+        self.assertIsNone(self.parse("## Opportunity 1\n- Title: outside any section"))
+        self.assertIsNone(self.parse("# Unknown Section\n## Item\n- Title: x\n- Description: y"))
+        self.assertIsNone(self.parse("# SECTION 1: Opportunities\n## Opportunity 1\n- Title: only one field"))
+        self.assertIsNone(self.parse("# SECTION 1: Opportunities\n## Opportunity 1\nfree text only"))
+
+    def test_without_prompt_only_structure_is_checked(self):
+        result = markdown_parser.parse_markdown("# Anything\n## Item\n- Field: value")
+        self.assertEqual(json.loads(result)["sections"][0]["opportunities"], [{"field": "value"}])
+
+
+class StructuredOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        _use_test_prompt(self, structured_output=True)
+
+    def parse(self, text: str):
+        result = markdown_parser.parse_structured(text, "test_prompt")
+        return json.loads(result) if result else None
+
+    def test_json_schema_and_prompt_list_sections_and_keys(self):
+        schema = markdown_parser.get_json_schema("test_prompt")
+        section = schema["properties"]["sections"]["items"]
+        self.assertEqual(section["properties"]["title"]["enum"], ["SECTION 1: 🚀 Opportunities", "SECTION 2: Threads"])
+
+        instructions = markdown_parser.structured_output_prompt("test_prompt")
+        self.assertIn('- "SECTION 1: 🚀 Opportunities": title, description, link, tags[]', instructions)
+        self.assertIn('- "SECTION 2: Threads": number, title, link', instructions)
+
+    def test_valid_output_is_normalized(self):
+        text = """```json
+{"sections": [
+  {"title": "SECTION 1: 🚀 Opportunities", "opportunities": [
+    {"Title": "Reporting tool", "description": null, "Link": "[post](https://x.com/p)", "tags": ["saas", 1]}
+  ]},
+  {"title": "SECTION 2: Threads", "opportunities": []}
+]}
+```"""
+        self.assertEqual(self.parse(text), {"sections": [{
+            "title": "SECTION 1: 🚀 Opportunities",
+            "opportunities": [{"title": "Reporting tool", "description": "", "link": "https://x.com/p", "tags": ["saas", "1"]}],
+        }]})
+
+    def test_no_items_is_a_valid_answer(self):
+        self.assertEqual(self.parse('{"sections": []}'), {"sections": []})
+        self.assertEqual(self.parse('{"sections": [{"title": "SECTION 2: Threads", "opportunities": []}]}'), {"sections": []})
+
+    def test_invalid_output_is_rejected(self):
+        self.assertIsNone(self.parse("# SECTION 1: Opportunities"))
+        self.assertIsNone(self.parse('{"results": []}'))
+        self.assertIsNone(self.parse('{"sections": ["text"]}'))
+        self.assertIsNone(self.parse('{"sections": [{"title": "SECTION 2: Threads", "opportunities": ["text"]}]}'))
+        self.assertIsNone(self.parse('{"sections": [{"title": "Other", "opportunities": [{"title": "x", "link": "y"}]}]}'))
+        self.assertIsNone(self.parse('{"sections": [{"title": "SECTION 1: Opportunities", "opportunities": [{"tags": []}]}]}'))
+
+    def test_workflow_requests_structured_output_only_when_enabled(self):
+        system_prompt, schema = workflow._structured_request("test_prompt", "Base prompt")
+        self.assertTrue(system_prompt.startswith("Base prompt\n\n# JSON Output"))
+        self.assertEqual(schema, markdown_parser.get_json_schema("test_prompt"))
+
+        with mock.patch.object(prompts, "get_prompt", lambda key: {"system_prompt": SYSTEM_PROMPT, "structured_output": False}):
+            self.assertIsNone(workflow._structured_request("test_prompt", "Base prompt"))
+
+
+class ShippedPromptsTest(unittest.TestCase):
+
+    def test_shipped_prompts_define_a_schema(self):
+        for prompt_key in prompts.load_prompts():
+            self.assertTrue(markdown_parser._get_schema(prompt_key), prompt_key)
+
+
+if __name__ == "__main__":
+    unittest.main()
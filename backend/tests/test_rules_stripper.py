@@ -0,0 +1,79 @@
+"""
+Unit tests for the rule-based metadata stripper (strip_metadata_with_rules)
+and its fallback checks.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import unittest
+
+import support  # noqa: F401  (test config + sys.path)
+
+import email_service
+
+
+class RulesStripperTest(unittest.TestCase):
+
+    def strip(self, text: str) -> str:
+        return email_service.strip_metadata_with_rules(text)
+
+    def test_headers_quotes_and_signoff_are_removed(self):
+        text = (
+            "--- Message 1 of 1 ---\n"
+            "Subject: Hello\n"
+            "From: a@b.com\n"
+            "Date: Mon, 1 Jan 2024\n"
+            "Thread Context: Message 1 of 1\n"
+            "\n"
+            "Hi team,\n"
+            "We need a reporting tool.\n"
+            "> quoted line\n"
+            "Sent from my iPhone\n"
+            "\n"
+            "Best regards,\n"
+            "Jane Doe\n"
+            "CEO, Acme\n"
+        )
+        self.assertEqual(
+            self.strip(text),
+            "--- Message 1 of 1 ---\nSubject: Hello\nThread Context: Message 1 of 1\n\n"
+            "Hi team,\nWe need a reporting tool.",
+        )
+
+    def test_quoted_reply_and_signature_cut_the_rest(self):
+        self.assertEqual(self.strip("New text\nOn Mon, Jan 1, 2024 at 10:00 AM Bob <bob@x.com> wrote:\nold"), "New text")
+        self.assertEqual(self.strip("New text\nOn Mon, Jan 1, 2024 at 10:00 AM Bob\n<bob@x.com> wrote:\nold"), "New text")
+        self.assertEqual(self.strip("New text\n-----Original Message-----\nold"), "New text")
+        self.assertEqual(self.strip("Body\n-- \nJane\n555-0100"), "Body")
+
+    def test_underscore_rule_cuts_only_before_from_line(self):
+        self.assertEqual(self.strip("Body line\n__________\nFrom: x@y.com\nSent: today\nold"), "Body line")
+        self.assertEqual(self.strip("Item one\n__________\nItem two"), "Item one\n__________\nItem two")
+
+    def test_footer_tail_is_cut(self):
+        text = "Content here\nmore content\n\nUnsubscribe here\nManage preferences\n© 2024 Acme. All rights reserved."
+        self.assertEqual(self.strip(text), "Content here\nmore content")
+
+    def test_legal_words_in_content_are_kept(self):
+        text = (
+            "We updated our privacy policy and the article explains what changed and why it matters to "
+            "founders who store customer data.\nNext item"
+        )
+        self.assertEqual(self.strip(text), text)
+
+    def test_long_lines_after_unsubscribe_mention_are_kept(self):
+        long_line = "Founder wants a tool that" + " tracks metrics" * 10
+        text = f"Intro\nHow do I unsubscribe users from a drip campaign?\n{long_line}"
+        self.assertEqual(self.strip(text), text)
+
+    def test_checked_strip_keeps_separators(self):
+        text = "--- Message 1 of 2 ---\nFirst\n\n--- Message 2 of 2 ---\nSecond"
+        self.assertEqual(email_service._strip_with_rules_checked(text), text)
+
+    def test_checked_strip_falls_back_when_a_message_is_emptied(self):
+        text = "--- Message 1 of 2 ---\nFirst\n\n--- Message 2 of 2 ---\n> only a quote"
+        self.assertIsNone(email_service._strip_with_rules_checked(text))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Unit tests for per-message metadata stripping (STRIP_MODE "per_message"):
+chunking, splitting responses on marker lines, the strip cache and batch
+reassembly.
+
+Run from backend/: python -m unittest discover -s tests
+"""
+
+import unittest
+from unittest import mock
+
+from support import use_temp_stores
+
+import email_service
+
+
+def _message(message_id: str, body: str, number: int = 1, total: int = 1) -> dict:
+    return {
+        "message_id": message_id,
+        "thread_id": "t1",
+        "message_number": number,
+        "total_in_thread": total,
+        "body": body,
+    }
+
+
+class _FakeStripLlm:
+    """analyze_with_llm stand-in: echoes every marker with "clean <body>", except skipped IDs."""
+
+    def __init__(self, skip=()):
+        self.prompts = []
+        self.skip = set(skip)
+
+    def __call__(self, system_prompt, user_prompt, task_id=None):
+        self.prompts.append(user_prompt)
+        pieces = email_service._STRIP_MARKER_RE.split(user_prompt)
+        return "\n".join(
+            f"<<<MESSAGE {message_id}>>>\nclean {body.strip()}"
+            for message_id, body in zip(pieces[1::2], pieces[2::2])
+            if message_id not in self.skip
+        )
+
+
+class StripCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        use_temp_stores(self)
+        patcher = mock.patch.object(email_service, "STRIP_MODE", "per_message")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def strip(self, emails, llm):
+        with mock.patch.object(email_service.llm_service, "analyze_with_llm", llm):
+            return email_service.strip_messages(emails)
+
+    def test_cached_messages_are_not_sent_again(self):
+        emails = [_message("m1", "first", 1, 2), _message("m2", "second", 2, 2)]
+        llm = _FakeStripLlm()
+        first = self.strip(emails, llm)
+        self.assertEqual(len(llm.prompts), 1)
+
+        # Shifted batch: m2 is cached, only m3 is sent
+        llm = _FakeStripLlm()
+        shifted = self.strip([emails[1], _message("m3", "third")], llm)
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertNotIn("second", llm.prompts[0])
+        self.assertIn("clean second", first)
+        self.assertIn("clean second", shifted)
+        self.assertIn("clean third", shifted)
+
+    def test_changed_body_or_format_invalidates_the_cache(self):
+        self.strip([_message("m1", "first")], _FakeStripLlm())
+
+        llm = _FakeStripLlm()
+        self.assertIn("clean edited", self.strip([_message("m1", "edited")], llm))
+        self.assertEqual(len(llm.prompts), 1)
+
+        llm = _FakeStripLlm()
+        with mock.patch.object(email_service, "BODY_FORMAT_VERSION", email_service.BODY_FORMAT_VERSION + 1):
+            self.strip([_message("m1", "edited")], llm)
+        self.assertEqual(len(llm.prompts), 1)
+
+    def test_strip_keys_depend_on_model_and_body(self):
+        keys = email_service._strip_keys([_message("m1", "body"), _message("m2", "body"), {"body": "no id"}])
+        self.assertEqual(set(keys), {"m1", "m2"})
+        self.assertEqual(keys["m1"], keys["m2"])
+        self.assertNotEqual(keys["m1"], email_service._strip_keys([_message("m1", "body 2")])["m1"])
+        with mock.patch.object(email_service.llm_service, "get_primary_model", return_value="groq:other"):
+            self.assertNotEqual(keys["m1"], email_service._strip_keys([_message("m1", "body")])["m1"])
+
+    def test_missing_marker_falls_back_to_original_and_is_not_cached(self):
+        emails = [_message("m1", "first"), _message("m2", "  second  ")]
+        text = self.strip(emails, _FakeStripLlm(skip={"m2"}))
+        self.assertIn("clean first", text)
+        self.assertIn("\nsecond", text)
+
+        llm = _FakeStripLlm()
+        self.strip(emails, llm)
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertNotIn("first", llm.prompts[0])
+        self.assertIn("second", llm.prompts[0])
+
+    def test_failed_call_keeps_original_text(self):
+        def failing_llm(**kwargs):
+            raise RuntimeError("provider down")
+
+        text = self.strip([_message("m1", "first")], failing_llm)
+        self.assertTrue(text.endswith("\nfirst"))
+
+    def test_uncached_messages_are_chunked_by_size(self):
+        emails = [_message(f"m{i}", "x" * 40) for i in range(5)]
+        with mock.patch.object(email_service, "STRIP_MAX_CHARS", 100):
+            cleaned, chunks = email_service._plan_message_strip(emails)
+
+        self.assertEqual(cleaned, {})
+        self.assertEqual([[m["message_id"] for m in chunk] for chunk in chunks], [["m0", "m1"], ["m2", "m3"], ["m4"]])
+
+    def test_assembled_text_keeps_separators_and_thread_context(self):
+        emails = [_message("m1", "first", 1, 2), dict(_message("m2", "second", 2, 2), message_count=2)]
+        text = email_service._assemble_stripped(emails, {"m1": "clean first"})
+
+        self.assertEqual(
+            text,
+            "--- Message 1 of 2 ---\nThread Context: Message 1 of 2\nclean first\n\n"
+            "--- Message 2 of 2 ---\nThread Context: Message 2 of 2\nMessages in thread: 2\nsecond",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,19 +3,57 @@ Central workflow orchestrator for email analysis.
 ALL execution flows through this module - coordinates email fetching, LLM analysis, and result storage.
 """
 
+import asyncio
+import json
 import logging
-from typing import Dict, List
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 # Internal service imports
 import task_manager
 import email_service
 import llm_service
+import markdown_parser
 import prompts
 
 # Configure logging for workflow operations
 logger = logging.getLogger(__name__)
 
+# Batches processed in parallel per task (each batch makes up to 3 blocking LLM calls)
+WORKFLOW_BATCH_CONCURRENCY = int(os.getenv("WORKFLOW_BATCH_CONCURRENCY", "3"))
+
+# Pipelined execution: Gmail fetch, strip, analyze and parse run as separate stages
+# connected by bounded queues, so the first batch starts before fetching finishes
+WORKFLOW_PIPELINE = os.getenv("WORKFLOW_PIPELINE", "true").lower() == "true"
+
+# Batches allowed to wait between two pipeline stages (backpressure on Gmail fetch)
+WORKFLOW_STAGE_QUEUE_SIZE = int(os.getenv("WORKFLOW_STAGE_QUEUE_SIZE", "2"))
+
+# Run tasks with run_analysis_workflow_async on the event loop (async LLM clients)
+# instead of holding a threadpool worker for the whole task
+WORKFLOW_ASYNC = os.getenv("WORKFLOW_ASYNC", "true").lower() == "true"
+
+# Token budget per batch for prompts without batch_token_budget in prompts.yaml
+# (0 = split by the request's batch_size message count)
+WORKFLOW_BATCH_TOKEN_BUDGET = int(os.getenv("WORKFLOW_BATCH_TOKEN_BUDGET", "0"))
+
+# Message cap for token-budgeted batches (the request's batch_size still applies if lower)
+WORKFLOW_BATCH_MAX_MESSAGES = int(os.getenv("WORKFLOW_BATCH_MAX_MESSAGES", "30"))
+
+# Per-message tokens added by combine_emails separators and header labels
+_MESSAGE_OVERHEAD_TOKENS = 20
+
+# Debug dumps of every stage (fetched messages, LLM inputs/outputs)
+DEBUG_DIR = Path(__file__).parent / "debug_outputs"
+
+# End-of-stream marker passed between pipeline stages
+_STAGE_DONE = object()
+
 
 def run_analysis_workflow(
     task_id: str,
@@ -23,7 +61,9 @@ def run_analysis_workflow(
     sender_email: str,
     prompt_key: str,
     email_limit: int,
-    batch_size: int
+    batch_size: int,
+    batch_concurrency: Optional[int] = None,
+    metadata_stripper: str = "llm"
 ) -> None:
     """
     Central orchestrator - executes complete email analysis workflow.
@@ -40,15 +80,20 @@ def run_analysis_workflow(
     Workflow steps:
     1. Fetch INDIVIDUAL MESSAGES from email threads (not combined threads!)
     2. Split messages into batches
-    3. For each batch:
+    3. Process batches in parallel (up to batch_concurrency at once), each:
        - Combine individual messages preserving hyperlinks
        - Strip metadata with LLM (LLM Call #1)
        - Analyze with main LLM (LLM Call #2)
        - Parse markdown to JSON (LLM Call #3)
-       - Store results
-    4. Update task status after each batch
+       - Store results (kept sorted by batch_number)
+    4. Update progress as "completed/total" after each batch finishes
     5. Mark task as completed or failed
 
+    With WORKFLOW_PIPELINE enabled, steps 1-3 overlap: the same threads are
+    selected and ranked as with fetch_emails, their full bodies are streamed
+    from Gmail, a batch is handed to the strip stage as soon as it fills up,
+    and each LLM call runs in its own stage (see _run_pipeline).
+
     Args:
         task_id: Unique task identifier for tracking
         sender_id: Sender identifier (e.g., "f5bot")
@@ -56,255 +101,1101 @@ def run_analysis_workflow(
         prompt_key: Prompt key for LLM analysis
         email_limit: Maximum number of THREADS to fetch (each thread may have multiple messages)
         batch_size: Number of INDIVIDUAL MESSAGES per batch (NEW: was threads, now messages!)
+        batch_concurrency: Batches processed in parallel (default: WORKFLOW_BATCH_CONCURRENCY)
+        metadata_stripper: "llm" or "rules" - how LLM Call #1 strips metadata (senders.json)
     """
+    concurrency = max(1, batch_concurrency or WORKFLOW_BATCH_CONCURRENCY)
+
     logger.info(f"[{task_id}] ========== WORKFLOW START ==========")
-    logger.info(f"[{task_id}] Config: sender={sender_id}, email={sender_email}, limit={email_limit}, batch={batch_size}")
+    logger.info(
+        f"[{task_id}] Config: sender={sender_id}, email={sender_email}, limit={email_limit}, "
+        f"batch={batch_size}, concurrency={concurrency}, pipeline={WORKFLOW_PIPELINE}, "
+        f"stripper={metadata_stripper}"
+    )
 
     start_time = datetime.now()
 
     try:
-        # Step 1: Fetch emails from Gmail
-        logger.info(f"[{task_id}] Step 1: Fetching emails from Gmail")
-        emails = email_service.fetch_emails(
-            sender_email=sender_email,
-            max_results=email_limit,
-            task_id=task_id
+        # Load prompts for LLM up front (fails fast on a bad prompt key)
+        logger.debug(f"[{task_id}] Loading prompts for key: {prompt_key}")
+        prompt_data = prompts.get_prompt(prompt_key)
+        system_prompt = prompt_data["system_prompt"]
+
+        run = _run_pipeline if WORKFLOW_PIPELINE else _run_batches
+        total_batches = run(
+            task_id, sender_email, prompt_key, system_prompt, email_limit, batch_size, concurrency,
+            metadata_stripper
         )
 
-        if not emails:
-            logger.warning(f"[{task_id}] No messages found - marking as completed")
-            task_manager.update_task(
-                task_id,
-                status="completed",
-                progress="0/0",
-                error="No messages found from this sender"
-            )
-            return
+        _complete_task(task_id, total_batches, start_time)
 
-        logger.info(f"[{task_id}] Fetched {len(emails)} individual messages successfully")
+    except Exception as e:
+        _fail_task(task_id, e, start_time)
+
+
+async def run_analysis_workflow_async(
+    task_id: str,
+    sender_id: str,
+    sender_email: str,
+    prompt_key: str,
+    email_limit: int,
+    batch_size: int,
+    batch_concurrency: Optional[int] = None,
+    metadata_stripper: str = "llm"
+) -> None:
+    """
+    Async variant of run_analysis_workflow - runs on the event loop.
+
+    LLM calls go through AsyncOpenAI / AsyncGroq, so a task waiting on the LLM
+    holds no thread and dozens of tasks can run without exhausting the anyio
+    threadpool that serves the sync API endpoints. The Gmail client has no
+    async API: messages are pulled from email_service.iter_emails one at a
+    time with asyncio.to_thread (default loop executor, one call in flight
+    per task) - the first pull also lists and ranks the threads. Debug files
+    and the SQLite caches are written from worker threads as well, so the
+    event loop never blocks on disk.
+
+    Batches start as soon as they fill up; up to batch_concurrency batches run
+    their strip → analyze → parse calls at once. Results, progress and debug
+    files are the same as the pipelined sync workflow.
+
+    Args:
+        task_id: Unique task identifier for tracking
+        sender_id: Sender identifier (e.g., "f5bot")
+        sender_email: Email address to fetch from
+        prompt_key: Prompt key for LLM analysis
+        email_limit: Maximum number of THREADS to fetch (each thread may have multiple messages)
+        batch_size: Number of INDIVIDUAL MESSAGES per batch
+        batch_concurrency: Batches processed in parallel (default: WORKFLOW_BATCH_CONCURRENCY)
+        metadata_stripper: "llm" or "rules" - how LLM Call #1 strips metadata (senders.json)
+    """
+    concurrency = max(1, batch_concurrency or WORKFLOW_BATCH_CONCURRENCY)
+
+    logger.info(f"[{task_id}] ========== WORKFLOW START (async) ==========")
+    logger.info(
+        f"[{task_id}] Config: sender={sender_id}, email={sender_email}, limit={email_limit}, "
+        f"batch={batch_size}, concurrency={concurrency}, stripper={metadata_stripper}"
+    )
+
+    start_time = datetime.now()
 
-        # Save fetched messages to debug file
-        import os
-        import json
-        from pathlib import Path
-        debug_dir = Path(__file__).parent / "debug_outputs"
-        debug_dir.mkdir(exist_ok=True)
-        debug_file_messages = debug_dir / f"{task_id}_fetched_messages.json"
-        with open(debug_file_messages, "w", encoding="utf-8") as f:
-            json.dump({
-                "task_id": task_id,
-                "sender_email": sender_email,
-                "threads_requested": email_limit,
-                "total_messages_fetched": len(emails),
-                "messages": emails
-            }, f, indent=2, ensure_ascii=False)
-        logger.info(f"[{task_id}] Fetched messages saved to: {debug_file_messages}")
-
-        # Step 2: Split INDIVIDUAL MESSAGES into batches (NEW: message-level batching!)
-        batches = _create_batches(emails, batch_size)
-        total_batches = len(batches)
-        logger.info(f"[{task_id}] Split {len(emails)} messages into {total_batches} batches (batch size: {batch_size} messages)")
-
-        # Step 3: Load prompts for LLM
+    try:
         logger.debug(f"[{task_id}] Loading prompts for key: {prompt_key}")
         prompt_data = prompts.get_prompt(prompt_key)
         system_prompt = prompt_data["system_prompt"]
 
-        # Step 4: Process each batch sequentially
-        for batch_num, batch in enumerate(batches, 1):
-            logger.info(f"[{task_id}] ===== Processing Batch {batch_num}/{total_batches} =====")
+        total_batches = await _run_async(
+            task_id, sender_email, prompt_key, system_prompt, email_limit, batch_size, concurrency,
+            metadata_stripper
+        )
 
-            try:
-                # Combine individual messages in batch preserving hyperlinks
-                logger.debug(f"[{task_id}] Combining {len(batch)} individual messages")
-                combined_emails = email_service.combine_emails(batch)
-
-                # Save combined messages BEFORE metadata stripping (debug file)
-                import os
-                from pathlib import Path
-                debug_dir = Path(__file__).parent / "debug_outputs"
-                debug_dir.mkdir(exist_ok=True)
-                debug_file_combined = debug_dir / f"{task_id}_batch{batch_num}_combined_messages.txt"
-                with open(debug_file_combined, "w", encoding="utf-8") as f:
-                    f.write(f"=== Combined Messages BEFORE Metadata Stripping ===\n")
-                    f.write(f"Task ID: {task_id}\n")
-                    f.write(f"Batch: {batch_num}/{total_batches}\n")
-                    f.write(f"Messages in batch: {len(batch)}\n")
-                    # Count unique threads in batch
-                    unique_threads = len(set(msg.get("thread_id", "") for msg in batch))
-                    f.write(f"Unique threads in batch: {unique_threads}\n")
-                    f.write(f"Combined length: {len(combined_emails)} chars\n")
-                    f.write(f"Timestamp: {datetime.now().isoformat()}\n")
-                    f.write(f"\n{'='*60}\n\n")
-                    f.write(combined_emails)
-                logger.info(f"[{task_id}] Combined messages saved to: {debug_file_combined}")
-
-                # Strip metadata using LLM (LLM Call #1)
-                logger.info(f"[{task_id}] Stripping metadata (LLM Call #1)")
-                cleaned_emails = email_service.strip_metadata_with_llm(
-                    email_text=combined_emails,
-                    task_id=task_id
-                )
-
-                # Save cleaned emails AFTER metadata stripping (debug file - THE SMOKING GUN!)
-                debug_file_cleaned = debug_dir / f"{task_id}_batch{batch_num}_llm_call1_output.txt"
-                with open(debug_file_cleaned, "w", encoding="utf-8") as f:
-                    f.write(f"=== LLM Call #1 Output (AFTER Metadata Stripping) ===\n")
-                    f.write(f"Task ID: {task_id}\n")
-                    f.write(f"Batch: {batch_num}/{total_batches}\n")
-                    f.write(f"Cleaned length: {len(cleaned_emails)} chars\n")
-                    f.write(f"Timestamp: {datetime.now().isoformat()}\n")
-                    f.write(f"\n{'='*60}\n\n")
-                    f.write(f"NOTE: Check if '--- Message X of Y ---' separators are preserved!\n")
-                    f.write(f"\n{'='*60}\n\n")
-                    f.write(cleaned_emails)
-                logger.info(f"[{task_id}] Cleaned emails saved to: {debug_file_cleaned}")
-
-                # Format user prompt with cleaned email content
-                logger.debug(f"[{task_id}] Formatting user prompt with cleaned content")
-                user_prompt = prompts.format_user_prompt(prompt_key, cleaned_emails)
-
-                # Call LLM for analysis (LLM Call #2) - 180s timeout
-                logger.info(f"[{task_id}] Analyzing content (LLM Call #2)")
-                llm_response = llm_service.analyze_with_llm(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    task_id=task_id
-                )
-
-                # Save raw LLM response to file for debugging
-                import os
-                from pathlib import Path
-                debug_dir = Path(__file__).parent / "debug_outputs"
-                debug_dir.mkdir(exist_ok=True)
-                debug_file = debug_dir / f"{task_id}_batch{batch_num}_llm_call2_raw.txt"
-                with open(debug_file, "w", encoding="utf-8") as f:
-                    f.write(f"=== LLM Call #2 Raw Output ===\n")
-                    f.write(f"Task ID: {task_id}\n")
-                    f.write(f"Batch: {batch_num}/{total_batches}\n")
-                    f.write(f"Timestamp: {datetime.now().isoformat()}\n")
-                    f.write(f"Response Length: {len(llm_response)} chars\n")
-                    f.write(f"\n{'='*60}\n\n")
-                    f.write(llm_response)
-                logger.info(f"[{task_id}] Raw LLM output saved to: {debug_file}")
-
-                # Parse markdown to JSON (LLM Call #3)
-                logger.info(f"[{task_id}] Parsing markdown to JSON (LLM Call #3)")
-
-                # Save input to parsing LLM
-                debug_file_parse_input = debug_dir / f"{task_id}_batch{batch_num}_llm_call3_input.txt"
-                with open(debug_file_parse_input, "w", encoding="utf-8") as f:
-                    f.write(f"=== LLM Call #3 Input (Markdown to be parsed) ===\n")
-                    f.write(f"Task ID: {task_id}\n")
-                    f.write(f"Batch: {batch_num}/{total_batches}\n")
-                    f.write(f"Input Length: {len(llm_response)} chars\n")
-                    f.write(f"\n{'='*60}\n\n")
-                    f.write(llm_response)
-                logger.info(f"[{task_id}] Parsing input saved to: {debug_file_parse_input}")
-
-                parsed_response = llm_service.parse_markdown_to_json(
-                    markdown_text=llm_response,
-                    task_id=task_id
-                )
-
-                # Save final parsed JSON output
-                debug_file_parsed = debug_dir / f"{task_id}_batch{batch_num}_llm_call3_output.json"
-                with open(debug_file_parsed, "w", encoding="utf-8") as f:
-                    f.write(parsed_response)
-                logger.info(f"[{task_id}] Parsing output saved to: {debug_file_parsed}")
-
-                # Store batch result with original messages for drawer
-                # Count unique threads in this batch
-                unique_threads = len(set(msg.get("thread_id", "") for msg in batch))
-
-                batch_result = {
-                    "batch_number": batch_num,
-                    "total_batches": total_batches,
-                    "messages_in_batch": len(batch),  # Changed from threads_in_batch
-                    "thread_count_in_batch": unique_threads,  # New: number of unique threads
-                    "analysis": parsed_response,  # Store parsed JSON
-                    "raw_markdown": llm_response,  # Also keep raw markdown
-                    "original_emails": [  # Store original messages for cross-checking
-                        {
-                            "subject": email.get("subject", "No Subject"),
-                            "from": email.get("from", "Unknown"),
-                            "thread_id": email.get("thread_id", ""),
-                            "message_number": email.get("message_number", 1),
-                            "total_in_thread": email.get("total_in_thread", 1),
-                            "body": email.get("body", ""),
-                            "date": email.get("date", "Unknown Date")
-                        }
-                        for email in batch
-                    ],
-                    "processed_at": datetime.now().isoformat()
-                }
-
-                task_manager.add_result(task_id, batch_result)
-
-                # Update progress
-                progress = f"{batch_num}/{total_batches}"
-                task_manager.update_task(task_id, progress=progress)
-
-                logger.info(f"[{task_id}] Batch {batch_num} completed - progress: {progress}")
+        _complete_task(task_id, total_batches, start_time)
+
+    except Exception as e:
+        _fail_task(task_id, e, start_time)
 
-            except Exception as e:
-                logger.error(f"[{task_id}] Batch {batch_num} failed: {str(e)}")
-
-                # Store error but continue processing
-                unique_threads = len(set(msg.get("thread_id", "") for msg in batch))
-                error_result = {
-                    "batch_number": batch_num,
-                    "total_batches": total_batches,
-                    "messages_in_batch": len(batch),  # Changed from threads_in_batch
-                    "thread_count_in_batch": unique_threads,  # New field
-                    "error": str(e),
-                    "processed_at": datetime.now().isoformat()
-                }
-                task_manager.add_result(task_id, error_result)
-
-                # Continue with next batch
-                continue
-
-        # Step 5: Mark task as completed
-        elapsed = (datetime.now() - start_time).total_seconds()
-        logger.info(f"[{task_id}] All batches processed successfully - elapsed: {elapsed:.1f}s")
 
+def _complete_task(task_id: str, total_batches: int, start_time: datetime) -> None:
+    """Mark a task completed (or completed with "no messages" when nothing was fetched)."""
+    if total_batches == 0:
+        logger.warning(f"[{task_id}] No messages found - marking as completed")
         task_manager.update_task(
             task_id,
             status="completed",
-            progress=f"{total_batches}/{total_batches}"
+            progress="0/0",
+            error="No messages found from this sender"
         )
+        return
+
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.info(f"[{task_id}] All batches processed successfully - elapsed: {elapsed:.1f}s")
+
+    llm_usage = llm_service.pop_task_usage(task_id)
+    logger.info(
+        f"[{task_id}] LLM usage: {llm_usage['calls']} calls, {llm_usage['prompt_tokens']} prompt tokens "
+        f"({llm_usage['cached_ratio']:.0%} cached), {llm_usage['completion_tokens']} completion tokens"
+    )
+
+    task_manager.update_task(
+        task_id,
+        status="completed",
+        progress=f"{total_batches}/{total_batches}",
+        llm_usage=llm_usage
+    )
+
+    logger.info(f"[{task_id}] ========== WORKFLOW COMPLETE ==========")
+
+
+def _fail_task(task_id: str, error: Exception, start_time: datetime) -> None:
+    """Mark a task failed after a workflow-level error."""
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.error(f"[{task_id}] Workflow failed after {elapsed:.1f}s: {str(error)}")
+
+    task_manager.update_task(
+        task_id,
+        status="failed",
+        error=str(error),
+        llm_usage=llm_service.pop_task_usage(task_id)
+    )
+
+    logger.info(f"[{task_id}] ========== WORKFLOW FAILED ==========")
+
+
+def _run_batches(
+    task_id: str,
+    sender_email: str,
+    prompt_key: str,
+    system_prompt: str,
+    email_limit: int,
+    batch_size: int,
+    concurrency: int,
+    metadata_stripper: str = "llm"
+) -> int:
+    """
+    Fetch everything, then process whole batches on a thread pool.
+
+    Args:
+        task_id: Task identifier for logging and results
+        sender_email: Email address to fetch from
+        prompt_key: Prompt key for LLM analysis
+        system_prompt: System prompt for the analysis call
+        email_limit: Maximum number of THREADS to fetch
+        batch_size: Number of INDIVIDUAL MESSAGES per batch
+        concurrency: Batches processed in parallel
+        metadata_stripper: "llm" or "rules" (see email_service.strip_messages)
+
+    Returns:
+        Number of batches processed (0 if no messages were found)
+    """
+    # Step 1: Fetch emails from Gmail
+    logger.info(f"[{task_id}] Step 1: Fetching emails from Gmail")
+    emails = email_service.fetch_emails(
+        sender_email=sender_email,
+        max_results=email_limit,
+        task_id=task_id
+    )
+
+    if not emails:
+        return 0
+
+    logger.info(f"[{task_id}] Fetched {len(emails)} individual messages successfully")
+    _save_fetched_messages(task_id, sender_email, email_limit, emails)
+
+    # Step 2: Split INDIVIDUAL MESSAGES into batches (token budget or message count)
+    token_budget, max_messages = _batch_limits(task_id, prompt_key, batch_size)
+    batches = _create_batches(emails, max_messages, token_budget)
+    total_batches = len(batches)
+    logger.info(f"[{task_id}] Split {len(emails)} messages into {total_batches} batches")
+
+    # Step 3: Process batches in parallel - results land in batch_number order
+    # regardless of completion order, progress counts finished batches
+    workers = min(concurrency, total_batches)
+    logger.info(f"[{task_id}] Processing {total_batches} batches with {workers} in parallel")
+    task_manager.update_task(task_id, progress=f"0/{total_batches}")
+
+    completed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = {
+            executor.submit(
+                _process_batch,
+                task_id, _new_batch_job(batch_num, batch, total_batches), prompt_key, system_prompt,
+                metadata_stripper
+            ): batch_num
+            for batch_num, batch in enumerate(batches, 1)
+        }
+
+        for future in as_completed(futures):
+            batch_num = futures[future]
+            task_manager.add_result(task_id, future.result())
+
+            completed += 1
+            progress = f"{completed}/{total_batches}"
+            task_manager.update_task(task_id, progress=progress)
+
+            logger.info(f"[{task_id}] Batch {batch_num} finished - progress: {progress}")
+
+    return total_batches
+
+
+def _run_pipeline(
+    task_id: str,
+    sender_email: str,
+    prompt_key: str,
+    system_prompt: str,
+    email_limit: int,
+    batch_size: int,
+    concurrency: int,
+    metadata_stripper: str = "llm"
+) -> int:
+    """
+    Stream messages through fetch → strip → analyze → parse stages.
+
+    Each stage has its own worker threads (concurrency per LLM stage) and
+    hands batches to the next stage over a bounded queue, so:
+    - the first batch is stripped while later thread bodies are still being
+      fetched (threads are selected and ranked up front, see email_service.iter_emails)
+    - batch N is parsed while batch N+1 is being analyzed
+    - a slow LLM stage back-pressures the Gmail fetch instead of buffering
+      every message
+
+    Failed batches skip the remaining stages and are stored as error results.
+    The batch total is only known once fetching finishes, so progress reads
+    "completed/batches so far" until then; total_batches on stored results is
+    filled in at the end.
+
+    Args:
+        task_id: Task identifier for logging and results
+        sender_email: Email address to fetch from
+        prompt_key: Prompt key for LLM analysis
+        system_prompt: System prompt for the analysis call
+        email_limit: Maximum number of THREADS to fetch
+        batch_size: Number of INDIVIDUAL MESSAGES per batch
+        concurrency: Worker threads per LLM stage
+        metadata_stripper: "llm" or "rules" (see email_service.strip_messages)
+
+    Returns:
+        Number of batches processed (0 if no messages were found)
+
+    Raises:
+        Exception: If fetching from Gmail fails (batches already processed are kept)
+    """
+    strip_queue: queue.Queue = queue.Queue(maxsize=WORKFLOW_STAGE_QUEUE_SIZE)
+    analyze_queue: queue.Queue = queue.Queue(maxsize=WORKFLOW_STAGE_QUEUE_SIZE)
+    parse_queue: queue.Queue = queue.Queue(maxsize=WORKFLOW_STAGE_QUEUE_SIZE)
+    done_queue: queue.Queue = queue.Queue()
+
+    fetch_state: Dict[str, Any] = {"batches": 0, "error": None}
+    state_lock = threading.Lock()
+
+    def submit_batch(batch: List[Dict]) -> None:
+        with state_lock:
+            fetch_state["batches"] += 1
+            batch_num = fetch_state["batches"]
+        logger.info(f"[{task_id}] Batch {batch_num} ready ({len(batch)} messages) - queued for stripping")
+        strip_queue.put(_new_batch_job(batch_num, batch))
+
+    def fetch_stage() -> None:
+        """Stream messages from Gmail and cut them into batches."""
+        emails: List[Dict] = []
+        try:
+            token_budget, max_messages = _batch_limits(task_id, prompt_key, batch_size)
+            packer = _new_packer(max_messages, token_budget)
+
+            logger.info(f"[{task_id}] Step 1: Streaming emails from Gmail")
+            for email in email_service.iter_emails(
+                sender_email=sender_email,
+                max_results=email_limit,
+                task_id=task_id
+            ):
+                emails.append(email)
+                for batch in _pack_message(packer, email):
+                    submit_batch(batch)
+            for batch in _flush_packer(packer):
+                submit_batch(batch)
+
+            logger.info(f"[{task_id}] Fetched {len(emails)} individual messages successfully")
+            if emails:
+                _save_fetched_messages(task_id, sender_email, email_limit, emails)
+
+        except Exception as e:
+            logger.error(f"[{task_id}] Fetch stage failed: {str(e)}")
+            fetch_state["error"] = e
+
+        finally:
+            strip_queue.put(_STAGE_DONE)
+
+    stage_threads = [threading.Thread(target=fetch_stage, name="pipeline-fetch", daemon=True)]
+    stage_threads[0].start()
+    stage_threads += _start_stage(
+        "strip", lambda job: _strip_batch(task_id, job, metadata_stripper),
+        strip_queue, analyze_queue, done_queue, concurrency
+    )
+    stage_threads += _start_stage(
+        "analyze", lambda job: _analyze_batch(task_id, job, prompt_key, system_prompt),
+        analyze_queue, parse_queue, done_queue, concurrency
+    )
+    stage_threads += _start_stage(
+        "parse", lambda job: _parse_batch(task_id, job, prompt_key),
+        parse_queue, done_queue, done_queue, concurrency
+    )
+
+    # Store stage (this thread): results arrive in completion order, add_result sorts them
+    completed = 0
+    while True:
+        job = done_queue.get()
+        if job is _STAGE_DONE:
+            break
+
+        task_manager.add_result(task_id, _batch_result(job))
+        completed += 1
+
+        with state_lock:
+            known_batches = fetch_state["batches"]
+        progress = f"{completed}/{known_batches}"
+        task_manager.update_task(task_id, progress=progress)
+        logger.info(f"[{task_id}] Batch {job['batch_number']} finished - progress: {progress}")
+
+    for thread in stage_threads:
+        thread.join()
+
+    total_batches = fetch_state["batches"]
+    if total_batches:
+        task_manager.update_results(task_id, total_batches=total_batches)
+
+    if fetch_state["error"] is not None:
+        raise fetch_state["error"]
+
+    return total_batches
+
+
+def _start_stage(
+    name: str,
+    work: Callable[[Dict[str, Any]], None],
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    error_queue: queue.Queue,
+    workers: int
+) -> List[threading.Thread]:
+    """
+    Start worker threads for one pipeline stage.
+
+    Workers take batch jobs from in_queue, run work(job) and pass the job on
+    to out_queue. A job whose stage raises gets its "error" set and goes
+    straight to error_queue. The end-of-stream marker is passed on once the
+    last worker of the stage has finished.
+
+    Args:
+        name: Stage name (thread names and logs)
+        work: Function updating the job in place
+        in_queue: Queue to read jobs from
+        out_queue: Queue for successfully processed jobs
+        error_queue: Queue for failed jobs (the store stage)
+        workers: Number of worker threads
+
+    Returns:
+        Started threads
+    """
+    remaining = [workers]
+    remaining_lock = threading.Lock()
+
+    def worker() -> None:
+        while True:
+            job = in_queue.get()
+            if job is _STAGE_DONE:
+                in_queue.put(_STAGE_DONE)  # Let sibling workers see it too
+                break
+
+            try:
+                work(job)
+                out_queue.put(job)
+            except Exception as e:
+                logger.error(f"[{name}] Batch {job['batch_number']} failed: {str(e)}")
+                job["error"] = str(e)
+                error_queue.put(job)
 
-        logger.info(f"[{task_id}] ========== WORKFLOW COMPLETE ==========")
+        with remaining_lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            out_queue.put(_STAGE_DONE)
 
+    threads = [
+        threading.Thread(target=worker, name=f"pipeline-{name}-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+async def _run_async(
+    task_id: str,
+    sender_email: str,
+    prompt_key: str,
+    system_prompt: str,
+    email_limit: int,
+    batch_size: int,
+    concurrency: int,
+    metadata_stripper: str = "llm"
+) -> int:
+    """
+    Stream messages from Gmail and process batches as asyncio tasks.
+
+    Args:
+        task_id: Task identifier for logging and results
+        sender_email: Email address to fetch from
+        prompt_key: Prompt key for LLM analysis
+        system_prompt: System prompt for the analysis call
+        email_limit: Maximum number of THREADS to fetch
+        batch_size: Number of INDIVIDUAL MESSAGES per batch
+        concurrency: Batches processed in parallel
+        metadata_stripper: "llm" or "rules" (see email_service.strip_messages)
+
+    Returns:
+        Number of batches processed (0 if no messages were found)
+
+    Raises:
+        Exception: If fetching from Gmail fails (batches already processed are kept)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_tasks: List[asyncio.Task] = []
+    completed = 0
+
+    async def process(job: Dict[str, Any]) -> None:
+        nonlocal completed
+        async with semaphore:
+            result = await _process_batch_async(
+                task_id, job, prompt_key, system_prompt, metadata_stripper
+            )
+
+        task_manager.add_result(task_id, result)
+        completed += 1
+        progress = f"{completed}/{len(batch_tasks)}"
+        task_manager.update_task(task_id, progress=progress)
+        logger.info(f"[{task_id}] Batch {job['batch_number']} finished - progress: {progress}")
+
+    def submit_batch(batch: List[Dict]) -> None:
+        job = _new_batch_job(len(batch_tasks) + 1, batch)
+        logger.info(f"[{task_id}] Batch {job['batch_number']} ready ({len(batch)} messages)")
+        batch_tasks.append(asyncio.create_task(process(job)))
+
+    token_budget, max_messages = _batch_limits(task_id, prompt_key, batch_size)
+    packer = _new_packer(max_messages, token_budget)
+
+    # Step 1: Stream emails from Gmail (blocking client → worker thread per pull)
+    logger.info(f"[{task_id}] Step 1: Streaming emails from Gmail")
+    stream = email_service.iter_emails(
+        sender_email=sender_email,
+        max_results=email_limit,
+        task_id=task_id
+    )
+    emails: List[Dict] = []
+    fetch_error: Optional[Exception] = None
+    try:
+        while True:
+            email = await asyncio.to_thread(next, stream, None)
+            if email is None:
+                break
+            emails.append(email)
+            for batch in _pack_message(packer, email):
+                submit_batch(batch)
+        for batch in _flush_packer(packer):
+            submit_batch(batch)
     except Exception as e:
-        # Handle workflow-level errors
-        elapsed = (datetime.now() - start_time).total_seconds()
-        logger.error(f"[{task_id}] Workflow failed after {elapsed:.1f}s: {str(e)}")
+        logger.error(f"[{task_id}] Fetch failed: {str(e)}")
+        fetch_error = e
 
-        task_manager.update_task(
-            task_id,
-            status="failed",
-            error=str(e)
+    if emails:
+        logger.info(f"[{task_id}] Fetched {len(emails)} individual messages successfully")
+        await asyncio.to_thread(_save_fetched_messages, task_id, sender_email, email_limit, emails)
+
+    # Step 2: Wait for the remaining batches
+    await asyncio.gather(*batch_tasks)
+
+    total_batches = len(batch_tasks)
+    if total_batches:
+        task_manager.update_results(task_id, total_batches=total_batches)
+
+    if fetch_error is not None:
+        raise fetch_error
+
+    return total_batches
+
+
+def _save_fetched_messages(task_id: str, sender_email: str, email_limit: int, emails: List[Dict]) -> None:
+    """Save fetched messages to debug file."""
+    DEBUG_DIR.mkdir(exist_ok=True)
+    debug_file_messages = DEBUG_DIR / f"{task_id}_fetched_messages.json"
+    with open(debug_file_messages, "w", encoding="utf-8") as f:
+        json.dump({
+            "task_id": task_id,
+            "sender_email": sender_email,
+            "threads_requested": email_limit,
+            "total_messages_fetched": len(emails),
+            "messages": emails
+        }, f, indent=2, ensure_ascii=False)
+    logger.info(f"[{task_id}] Fetched messages saved to: {debug_file_messages}")
+
+
+def _new_batch_job(batch_num: int, batch: List[Dict], total_batches: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Create the work item passed through the batch stages.
+
+    Args:
+        batch_num: 1-based batch number
+        batch: Individual message dictionaries in this batch
+        total_batches: Total number of batches (None while still fetching)
+
+    Returns:
+        Batch job dictionary; stages add "cleaned", "markdown", "parsed" or "error"
+    """
+    return {
+        "batch_number": batch_num,
+        "total_batches": total_batches,
+        "batch": batch,
+        "unique_threads": len(set(msg.get("thread_id", "") for msg in batch)),
+    }
+
+
+def _batch_label(job: Dict[str, Any]) -> str:
+    """Return "N/total" (or just "N" while the total is unknown) for debug files."""
+    if job["total_batches"]:
+        return f"{job['batch_number']}/{job['total_batches']}"
+    return str(job["batch_number"])
+
+
+def _process_batch(
+    task_id: str,
+    job: Dict[str, Any],
+    prompt_key: str,
+    system_prompt: str,
+    metadata_stripper: str = "llm"
+) -> Dict[str, Any]:
+    """
+    Run one batch through the three LLM calls (runs in a worker thread).
+    Never raises - failures are returned as an error result so other
+    batches keep going.
+
+    Args:
+        task_id: Task identifier for logging and debug files
+        job: Batch job from _new_batch_job
+        prompt_key: Prompt key for LLM analysis
+        system_prompt: System prompt for the analysis call
+        metadata_stripper: "llm" or "rules" (see email_service.strip_messages)
+
+    Returns:
+        Batch result dictionary (or error result with an "error" field)
+    """
+    logger.info(f"[{task_id}] ===== Processing Batch {_batch_label(job)} =====")
+
+    try:
+        _strip_batch(task_id, job, metadata_stripper)
+        _analyze_batch(task_id, job, prompt_key, system_prompt)
+        _parse_batch(task_id, job, prompt_key)
+    except Exception as e:
+        logger.error(f"[{task_id}] Batch {job['batch_number']} failed: {str(e)}")
+        job["error"] = str(e)  # Store error but let the remaining batches continue
+
+    return _batch_result(job)
+
+
+async def _process_batch_async(
+    task_id: str,
+    job: Dict[str, Any],
+    prompt_key: str,
+    system_prompt: str,
+    metadata_stripper: str = "llm"
+) -> Dict[str, Any]:
+    """Async variant of _process_batch (never raises)."""
+    logger.info(f"[{task_id}] ===== Processing Batch {_batch_label(job)} =====")
+
+    try:
+        await _strip_batch_async(task_id, job, metadata_stripper)
+        await _analyze_batch_async(task_id, job, prompt_key, system_prompt)
+        await _parse_batch_async(task_id, job, prompt_key)
+    except Exception as e:
+        logger.error(f"[{task_id}] Batch {job['batch_number']} failed: {str(e)}")
+        job["error"] = str(e)
+
+    return _batch_result(job)
+
+
+def _strip_batch(task_id: str, job: Dict[str, Any], metadata_stripper: str = "llm") -> None:
+    """
+    Combine the batch's messages and strip metadata (LLM Call #1).
+    Sets job["cleaned"].
+
+    Args:
+        task_id: Task identifier for logging and debug files
+        job: Batch job
+        metadata_stripper: "llm" or "rules" (see email_service.strip_messages)
+    """
+    combined_emails = _prepare_strip(task_id, job)
+
+    # Strip metadata using LLM (LLM Call #1)
+    logger.info(f"[{task_id}] Batch {job['batch_number']}: Stripping metadata (LLM Call #1)")
+    cleaned_emails = email_service.strip_messages(
+        job["batch"],
+        task_id=task_id,
+        combined_text=combined_emails,
+        stripper=metadata_stripper
+    )
+
+    _finish_strip(task_id, job, cleaned_emails)
+
+
+async def _strip_batch_async(task_id: str, job: Dict[str, Any], metadata_stripper: str = "llm") -> None:
+    """Async variant of _strip_batch (LLM call awaited on the event loop, debug files written in a worker thread)."""
+    combined_emails = await asyncio.to_thread(_prepare_strip, task_id, job)
+
+    logger.info(f"[{task_id}] Batch {job['batch_number']}: Stripping metadata (LLM Call #1)")
+    cleaned_emails = await email_service.strip_messages_async(
+        job["batch"],
+        task_id=task_id,
+        combined_text=combined_emails,
+        stripper=metadata_stripper
+    )
+
+    await asyncio.to_thread(_finish_strip, task_id, job, cleaned_emails)
+
+
+def _prepare_strip(task_id: str, job: Dict[str, Any]) -> str:
+    """
+    Combine the batch's messages and save them to a debug file.
+
+    Args:
+        task_id: Task identifier for logging and debug files
+        job: Batch job
+
+    Returns:
+        Combined message text for LLM Call #1
+    """
+    batch = job["batch"]
+    batch_num = job["batch_number"]
+
+    # Combine individual messages in batch preserving hyperlinks
+    logger.debug(f"[{task_id}] Combining {len(batch)} individual messages")
+    combined_emails = email_service.combine_emails(batch)
+
+    # Save combined messages BEFORE metadata stripping (debug file)
+    DEBUG_DIR.mkdir(exist_ok=True)
+    debug_file_combined = DEBUG_DIR / f"{task_id}_batch{batch_num}_combined_messages.txt"
+    with open(debug_file_combined, "w", encoding="utf-8") as f:
+        f.write(f"=== Combined Messages BEFORE Metadata Stripping ===\n")
+        f.write(f"Task ID: {task_id}\n")
+        f.write(f"Batch: {_batch_label(job)}\n")
+        f.write(f"Messages in batch: {len(batch)}\n")
+        f.write(f"Unique threads in batch: {job['unique_threads']}\n")
+        f.write(f"Combined length: {len(combined_emails)} chars\n")
+        f.write(f"Timestamp: {datetime.now().isoformat()}\n")
+        f.write(f"\n{'='*60}\n\n")
+        f.write(combined_emails)
+    logger.info(f"[{task_id}] Combined messages saved to: {debug_file_combined}")
+
+    return combined_emails
+
+
+def _finish_strip(task_id: str, job: Dict[str, Any], cleaned_emails: str) -> None:
+    """Save LLM Call #1 output to a debug file and set job["cleaned"]."""
+    batch_num = job["batch_number"]
+
+    # Save cleaned emails AFTER metadata stripping (debug file - THE SMOKING GUN!)
+    debug_file_cleaned = DEBUG_DIR / f"{task_id}_batch{batch_num}_llm_call1_output.txt"
+    with open(debug_file_cleaned, "w", encoding="utf-8") as f:
+        f.write(f"=== LLM Call #1 Output (AFTER Metadata Stripping) ===\n")
+        f.write(f"Task ID: {task_id}\n")
+        f.write(f"Batch: {_batch_label(job)}\n")
+        f.write(f"Cleaned length: {len(cleaned_emails)} chars\n")
+        f.write(f"Timestamp: {datetime.now().isoformat()}\n")
+        f.write(f"\n{'='*60}\n\n")
+        f.write(f"NOTE: Check if '--- Message X of Y ---' separators are preserved!\n")
+        f.write(f"\n{'='*60}\n\n")
+        f.write(cleaned_emails)
+    logger.info(f"[{task_id}] Cleaned emails saved to: {debug_file_cleaned}")
+
+    job["cleaned"] = cleaned_emails
+
+
+def _analyze_batch(task_id: str, job: Dict[str, Any], prompt_key: str, system_prompt: str) -> None:
+    """
+    Analyze the cleaned batch with the main LLM (LLM Call #2).
+    Sets job["markdown"]. Prompts with structured_output ask for JSON
+    directly and also set job["parsed"] (LLM Call #3 is skipped); output
+    that doesn't validate falls back to the markdown call.
+
+    Args:
+        task_id: Task identifier for logging and debug files
+        job: Batch job (after _strip_batch)
+        prompt_key: Prompt key for LLM analysis
+        system_prompt: System prompt for the analysis call
+    """
+    user_prompt = _prepare_analyze(task_id, job, prompt_key)
+
+    structured = _structured_request(prompt_key, system_prompt)
+    if structured:
+        logger.info(f"[{task_id}] Batch {job['batch_number']}: Analyzing content (LLM Call #2, structured output)")
+        llm_response = llm_service.analyze_with_llm(
+            system_prompt=structured[0],
+            user_prompt=user_prompt,
+            task_id=task_id,
+            json_schema=structured[1]
         )
+        if _finish_structured(task_id, job, llm_response, prompt_key):
+            return
+
+    # Call LLM for analysis (LLM Call #2) - 180s timeout; streamed markdown is
+    # shown as the batch's partial result until the batch finishes
+    logger.info(f"[{task_id}] Batch {job['batch_number']}: Analyzing content (LLM Call #2)")
+    llm_response = llm_service.analyze_with_llm(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        task_id=task_id,
+        on_partial=_partial_reporter(task_id, job)
+    )
+
+    _finish_analyze(task_id, job, llm_response)
+
+
+async def _analyze_batch_async(task_id: str, job: Dict[str, Any], prompt_key: str, system_prompt: str) -> None:
+    """Async variant of _analyze_batch (LLM call awaited on the event loop, debug files written in a worker thread)."""
+    user_prompt = _prepare_analyze(task_id, job, prompt_key)
+
+    structured = _structured_request(prompt_key, system_prompt)
+    if structured:
+        logger.info(f"[{task_id}] Batch {job['batch_number']}: Analyzing content (LLM Call #2, structured output)")
+        llm_response = await llm_service.analyze_with_llm_async(
+            system_prompt=structured[0],
+            user_prompt=user_prompt,
+            task_id=task_id,
+            json_schema=structured[1]
+        )
+        if await asyncio.to_thread(_finish_structured, task_id, job, llm_response, prompt_key):
+            return
+
+    logger.info(f"[{task_id}] Batch {job['batch_number']}: Analyzing content (LLM Call #2)")
+    llm_response = await llm_service.analyze_with_llm_async(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        task_id=task_id,
+        on_partial=_partial_reporter(task_id, job)
+    )
+
+    await asyncio.to_thread(_finish_analyze, task_id, job, llm_response)
+
+
+def _prepare_analyze(task_id: str, job: Dict[str, Any], prompt_key: str) -> str:
+    """Format the analysis user prompt with the cleaned email content."""
+    logger.debug(f"[{task_id}] Formatting user prompt with cleaned content")
+    return prompts.format_user_prompt(prompt_key, job["cleaned"])
+
+
+def _partial_reporter(task_id: str, job: Dict[str, Any]) -> Callable[[str], None]:
+    """Build the on_partial callback that stores a batch's streamed markdown in the task."""
+    def report(markdown: str) -> None:
+        task_manager.set_partial_result(task_id, job["batch_number"], markdown)
+    return report
+
+
+def _structured_request(prompt_key: str, system_prompt: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Build the structured-output variant of the analysis call.
+
+    Args:
+        prompt_key: Prompt key for LLM analysis
+        system_prompt: System prompt for the analysis call
+
+    Returns:
+        Tuple of (system prompt with JSON instructions, JSON schema), or None
+        if the prompt doesn't set structured_output
+    """
+    if not prompts.get_prompt(prompt_key)["structured_output"]:
+        return None
+    return (
+        f"{system_prompt}\n\n{markdown_parser.structured_output_prompt(prompt_key)}",
+        markdown_parser.get_json_schema(prompt_key)
+    )
+
 
-        logger.info(f"[{task_id}] ========== WORKFLOW FAILED ==========")
+def _finish_structured(task_id: str, job: Dict[str, Any], llm_response: str, prompt_key: str) -> bool:
+    """
+    Validate structured analysis output and store it as both LLM Call #2 and #3 output.
+
+    Args:
+        task_id: Task identifier for logging and debug files
+        job: Batch job
+        llm_response: Raw JSON from the analysis model
+        prompt_key: Prompt key (schema for validation)
+
+    Returns:
+        True if job["markdown"] and job["parsed"] are set, False if the output did not validate
+    """
+    parsed = markdown_parser.parse_structured(llm_response, prompt_key, f"[{task_id}]")
+    if parsed is None:
+        logger.warning(f"[{task_id}] Batch {job['batch_number']}: ⚠ Structured output invalid - retrying as markdown")
+        return False
+
+    _finish_analyze(task_id, job, llm_response)
+    _finish_parse(task_id, job, parsed)
+    return True
+
+
+def _finish_analyze(task_id: str, job: Dict[str, Any], llm_response: str) -> None:
+    """Save raw LLM Call #2 output to a debug file and set job["markdown"]."""
+    batch_num = job["batch_number"]
+
+    # Save raw LLM response to file for debugging
+    DEBUG_DIR.mkdir(exist_ok=True)
+    debug_file = DEBUG_DIR / f"{task_id}_batch{batch_num}_llm_call2_raw.txt"
+    with open(debug_file, "w", encoding="utf-8") as f:
+        f.write(f"=== LLM Call #2 Raw Output ===\n")
+        f.write(f"Task ID: {task_id}\n")
+        f.write(f"Batch: {_batch_label(job)}\n")
+        f.write(f"Timestamp: {datetime.now().isoformat()}\n")
+        f.write(f"Response Length: {len(llm_response)} chars\n")
+        f.write(f"\n{'='*60}\n\n")
+        f.write(llm_response)
+    logger.info(f"[{task_id}] Raw LLM output saved to: {debug_file}")
+
+    job["markdown"] = llm_response
+
+
+def _parse_batch(task_id: str, job: Dict[str, Any], prompt_key: Optional[str] = None) -> None:
+    """
+    Parse the analysis markdown to JSON (LLM Call #3, local parse first).
+    Sets job["parsed"].
+
+    Args:
+        task_id: Task identifier for logging and debug files
+        job: Batch job (after _analyze_batch)
+        prompt_key: Prompt key used for the analysis (schema for the local parse)
+    """
+    if "parsed" in job:
+        logger.info(f"[{task_id}] Batch {job['batch_number']}: Structured output - skipping LLM Call #3")
+        return
+
+    _prepare_parse(task_id, job)
+
+    parsed_response = llm_service.parse_markdown_to_json(
+        markdown_text=job["markdown"],
+        task_id=task_id,
+        prompt_key=prompt_key
+    )
+
+    _finish_parse(task_id, job, parsed_response)
+
+
+async def _parse_batch_async(task_id: str, job: Dict[str, Any], prompt_key: Optional[str] = None) -> None:
+    """Async variant of _parse_batch (LLM call awaited on the event loop, debug files written in a worker thread)."""
+    if "parsed" in job:
+        logger.info(f"[{task_id}] Batch {job['batch_number']}: Structured output - skipping LLM Call #3")
+        return
+
+    await asyncio.to_thread(_prepare_parse, task_id, job)
+
+    parsed_response = await llm_service.parse_markdown_to_json_async(
+        markdown_text=job["markdown"],
+        task_id=task_id,
+        prompt_key=prompt_key
+    )
+
+    await asyncio.to_thread(_finish_parse, task_id, job, parsed_response)
+
+
+def _prepare_parse(task_id: str, job: Dict[str, Any]) -> None:
+    """Save the LLM Call #3 input (analysis markdown) to a debug file."""
+    batch_num = job["batch_number"]
+    llm_response = job["markdown"]
+
+    # Parse markdown to JSON (LLM Call #3)
+    logger.info(f"[{task_id}] Batch {batch_num}: Parsing markdown to JSON (LLM Call #3)")
+
+    # Save input to parsing LLM
+    DEBUG_DIR.mkdir(exist_ok=True)
+    debug_file_parse_input = DEBUG_DIR / f"{task_id}_batch{batch_num}_llm_call3_input.txt"
+    with open(debug_file_parse_input, "w", encoding="utf-8") as f:
+        f.write(f"=== LLM Call #3 Input (Markdown to be parsed) ===\n")
+        f.write(f"Task ID: {task_id}\n")
+        f.write(f"Batch: {_batch_label(job)}\n")
+        f.write(f"Input Length: {len(llm_response)} chars\n")
+        f.write(f"\n{'='*60}\n\n")
+        f.write(llm_response)
+    logger.info(f"[{task_id}] Parsing input saved to: {debug_file_parse_input}")
+
+
+def _finish_parse(task_id: str, job: Dict[str, Any], parsed_response: str) -> None:
+    """Save the parsed JSON output to a debug file and set job["parsed"]."""
+    debug_file_parsed = DEBUG_DIR / f"{task_id}_batch{job['batch_number']}_llm_call3_output.json"
+    with open(debug_file_parsed, "w", encoding="utf-8") as f:
+        f.write(parsed_response)
+    logger.info(f"[{task_id}] Parsing output saved to: {debug_file_parsed}")
+
+    job["parsed"] = parsed_response
+
+
+def _batch_result(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the stored result for a finished (or failed) batch job.
+
+    Args:
+        job: Batch job after the last stage it reached
+
+    Returns:
+        Batch result with original messages for the drawer, or an error result
+    """
+    batch = job["batch"]
+
+    if "error" in job:
+        return {
+            "batch_number": job["batch_number"],
+            "total_batches": job["total_batches"],
+            "messages_in_batch": len(batch),  # Changed from threads_in_batch
+            "thread_count_in_batch": job["unique_threads"],  # New field
+            "error": job["error"],
+            "processed_at": datetime.now().isoformat()
+        }
 
+    return {
+        "batch_number": job["batch_number"],
+        "total_batches": job["total_batches"],
+        "messages_in_batch": len(batch),  # Changed from threads_in_batch
+        "thread_count_in_batch": job["unique_threads"],  # New: number of unique threads
+        "analysis": job["parsed"],  # Store parsed JSON
+        "raw_markdown": job["markdown"],  # Also keep raw markdown
+        "original_emails": [  # Store original messages for cross-checking
+            {
+                "subject": email.get("subject", "No Subject"),
+                "from": email.get("from", "Unknown"),
+                "thread_id": email.get("thread_id", ""),
+                "message_number": email.get("message_number", 1),
+                "total_in_thread": email.get("total_in_thread", 1),
+                "body": email.get("body", ""),
+                "date": email.get("date", "Unknown Date")
+            }
+            for email in batch
+        ],
+        "processed_at": datetime.now().isoformat()
+    }
 
-def _create_batches(items: List, batch_size: int) -> List[List]:
+
+def _batch_limits(task_id: str, prompt_key: str, batch_size: int) -> Tuple[int, int]:
     """
-    Split list into batches of specified size.
+    Resolve how a task's messages are batched.
+
+    Prompts with batch_token_budget (or WORKFLOW_BATCH_TOKEN_BUDGET) are
+    packed by estimated tokens; otherwise batches hold batch_size messages as
+    before. The request's batch_size stays a hard cap on messages per batch
+    either way (also capped by WORKFLOW_BATCH_MAX_MESSAGES when budgeted).
 
     Args:
-        items: List to split
-        batch_size: Maximum items per batch
+        task_id: Task identifier for logging
+        prompt_key: Prompt key for LLM analysis
+        batch_size: Requested messages per batch
+
+    Returns:
+        Tuple of (token budget or 0 for count batching, max messages per batch)
+    """
+    token_budget = prompts.get_prompt(prompt_key)["batch_token_budget"] or WORKFLOW_BATCH_TOKEN_BUDGET
+    if token_budget > 0:
+        max_messages = min(batch_size, WORKFLOW_BATCH_MAX_MESSAGES)
+        logger.info(
+            f"[{task_id}] Batching by tokens: ~{token_budget} tokens, "
+            f"max {max_messages} messages per batch"
+        )
+        return token_budget, max_messages
+    logger.info(f"[{task_id}] Batching by count: {batch_size} messages per batch")
+    return 0, batch_size
+
+
+def _create_batches(items: List[Dict], max_messages: int, token_budget: int = 0) -> List[List[Dict]]:
+    """
+    Split messages into batches (see _pack_message).
+
+    Args:
+        items: Individual message dictionaries in fetch order
+        max_messages: Maximum messages per batch
+        token_budget: Estimated token budget per batch (0 = count only)
 
     Returns:
         List of batches (each batch is a list)
     """
+    packer = _new_packer(max_messages, token_budget)
     batches = []
-    for i in range(0, len(items), batch_size):
-        batch = items[i:i + batch_size]
-        batches.append(batch)
+    for item in items:
+        batches.extend(_pack_message(packer, item))
+    batches.extend(_flush_packer(packer))
 
     return batches
+
+
+def _new_packer(max_messages: int, token_budget: int = 0) -> Dict[str, Any]:
+    """
+    Create the state for incremental batch packing.
+
+    Args:
+        max_messages: Maximum messages per batch
+        token_budget: Estimated token budget per batch (0 = count only)
+
+    Returns:
+        Packer state for _pack_message / _flush_packer
+    """
+    return {
+        "max_messages": max(1, max_messages),
+        "token_budget": token_budget,
+        "batch": [],
+        "batch_tokens": 0,
+        "thread": [],  # [(message, tokens)] of the thread being collected
+        "thread_id": None,
+    }
+
+
+def _pack_message(packer: Dict[str, Any], message: Dict) -> List[List[Dict]]:
+    """
+    Add a message and return the batches it completed.
+
+    With a token budget, messages of one thread (consecutive in fetch order)
+    are collected and placed together: a thread that doesn't fit in the
+    current batch starts a new one, and only a thread larger than a whole
+    batch is split. Without a budget, batches are filled to max_messages.
+
+    Args:
+        packer: State from _new_packer
+        message: Individual message dictionary
+
+    Returns:
+        Completed batches (usually empty)
+    """
+    if not packer["token_budget"]:
+        packer["batch"].append(message)
+        if len(packer["batch"]) < packer["max_messages"]:
+            return []
+        batch, packer["batch"] = packer["batch"], []
+        return [batch]
+
+    ready = []
+    thread_id = message.get("thread_id")
+    if packer["thread"] and thread_id != packer["thread_id"]:
+        ready = _place_thread(packer)
+    packer["thread_id"] = thread_id
+    packer["thread"].append((message, _message_tokens(message)))
+    return ready
+
+
+def _flush_packer(packer: Dict[str, Any]) -> List[List[Dict]]:
+    """Place any collected thread and return the remaining batches."""
+    ready = _place_thread(packer) if packer["thread"] else []
+    if packer["batch"]:
+        ready.append(packer["batch"])
+        packer["batch"], packer["batch_tokens"] = [], 0
+    return ready
+
+
+def _place_thread(packer: Dict[str, Any]) -> List[List[Dict]]:
+    """Move the collected thread into batches; return the batches it completed."""
+    ready = []
+    thread, packer["thread"] = packer["thread"], []
+
+    def fits(count: int, tokens: int) -> bool:
+        return (
+            len(packer["batch"]) + count <= packer["max_messages"]
+            and packer["batch_tokens"] + tokens <= packer["token_budget"]
+        )
+
+    if packer["batch"] and not fits(len(thread), sum(tokens for _, tokens in thread)):
+        ready.append(packer["batch"])
+        packer["batch"], packer["batch_tokens"] = [], 0
+
+    # Threads larger than a whole batch are split message by message
+    for message, tokens in thread:
+        if packer["batch"] and not fits(1, tokens):
+            ready.append(packer["batch"])
+            packer["batch"], packer["batch_tokens"] = [], 0
+        packer["batch"].append(message)
+        packer["batch_tokens"] += tokens
+
+    return ready
+
+
+def _message_tokens(message: Dict) -> int:
+    """Estimate a message's tokens as combine_emails renders it (headers + body)."""
+    text = f"{message.get('subject', '')}\n{message.get('from', '')}\n{message.get('date', '')}\n{message.get('body', '')}"
+    return llm_service.estimate_tokens(text) + _MESSAGE_OVERHEAD_TOKENS
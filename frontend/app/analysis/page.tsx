@@ -135,6 +135,18 @@ export default function AnalysisPage() {
             {/* Results Display */}
             <ResultsDisplay results={taskStatus.results} senderId={taskStatus.sender_id} />
 
+            {/* Partial Results - batches still streaming from the LLM */}
+            {taskStatus.status === 'processing' && taskStatus.partial_results?.map((partial) => (
+              <div key={partial.batch_number} className="bg-gray-800 rounded-lg shadow-md p-6 border border-blue-800">
+                <p className="text-sm font-medium text-blue-300 mb-2">
+                  Batch {partial.batch_number} - analysis in progress...
+                </p>
+                <pre className="text-xs text-gray-300 whitespace-pre-wrap break-words font-mono max-h-96 overflow-y-auto">
+                  {partial.raw_markdown}
+                </pre>
+              </div>
+            ))}
+
             {/* Completion Message */}
             {taskStatus.status === 'completed' && (
               <div className="bg-green-900 border border-green-700 rounded-lg p-4 text-center">
@@ -48,12 +48,18 @@ export interface BatchResult {
   processed_at: string; // ISO timestamp
 }
 
+export interface PartialResult {
+  batch_number: number;
+  raw_markdown: string; // Analysis markdown streamed so far (replaced by the BatchResult when done)
+}
+
 export interface TaskStatus {
   task_id: string;
   sender_id: string; // Sender identifier (for conditional rendering)
   status: 'processing' | 'completed' | 'failed';
   progress: string;
   results: BatchResult[];
+  partial_results?: PartialResult[]; // Batches still being analyzed (LLM_STREAMING)
   error?: string;
 }
 